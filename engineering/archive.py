@@ -0,0 +1,283 @@
+import json
+import os
+import pickle
+import re
+
+import numpy as np
+
+from sizing.parameters import is_number
+
+
+def archive_values(rocket) -> dict:
+    """
+    :param rocket: Rocket class
+    :return: Every numeric value of Rocket.export_all_values and of the Simulator (as "simulator.apogee"), NaN if it
+    is None
+    """
+    values: dict = {}
+    for name, value in rocket.export_all_values().items():
+        if value is None or is_number(value):
+            values[name] = np.nan if value is None else float(value)
+    for name, value in rocket.simulator.__dict__.items():
+        if value is None or is_number(value):
+            values[f"simulator.{name}"] = np.nan if value is None else float(value)
+    return values
+
+
+class RunArchive:
+    def __init__(self, directory: str):
+        """
+        :param directory: Directory of the run in the archive
+        Columnar archive of a run, one row per iteration and one column per dotted variable. Rows are appended to a
+        row-major segment (values_{k}.f8, with its column names in columns_{k}.json), a new segment starts when
+        variables are added. Closing the archive rewrites the segments as columns.npz, from which single columns are
+        read without reading the others.
+        """
+        self.directory: str = directory
+        self.columns: list | None = None  # Column names of the segment that is appended to
+        self.segment: int = len(self.segments())
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, "columns.npz")) or \
+            os.path.exists(os.path.join(directory, "columns_0.json"))
+
+    def segments(self) -> list[tuple[list, str]]:
+        """
+        :return: Column names and values file of every segment, in order
+        """
+        segments: list = []
+        while os.path.exists(os.path.join(self.directory, f"columns_{len(segments)}.json")):
+            with open(os.path.join(self.directory, f"columns_{len(segments)}.json")) as file:
+                segments.append((json.load(file), os.path.join(self.directory, f"values_{len(segments)}.f8")))
+        return segments
+
+    def append(self, iteration: int, rocket) -> dict:
+        """
+        :param iteration: Number of the iteration, 0 for the starting point
+        :param rocket: Rocket class after the iteration
+        :return: The values that were appended
+        """
+        values: dict = {"iteration": float(iteration), **archive_values(rocket)}
+        if self.columns is None or not values.keys() <= set(self.columns):  # Start a new segment
+            self.columns = list(values)
+            with open(os.path.join(self.directory, f"columns_{self.segment}.json"), "w") as file:
+                json.dump(self.columns, file)
+            self.segment += 1
+
+        row = np.array([values.get(name, np.nan) for name in self.columns], dtype=np.float64)
+        with open(os.path.join(self.directory, f"values_{self.segment - 1}.f8"), "ab") as file:
+            row.tofile(file)
+        return values
+
+    def read_segments(self, variables: list[str]) -> dict:
+        columns: dict = {variable: [] for variable in variables}
+        for names, values_file in self.segments():
+            width: int = len(names)
+            values = np.fromfile(values_file, dtype=np.float64) if os.path.exists(values_file) else np.zeros(0)
+            values = values[:len(values) // width * width].reshape(-1, width)  # Without an unfinished last row
+            positions: dict = {name: i for i, name in enumerate(names)}
+            for variable in variables:
+                if variable in positions:
+                    columns[variable].append(values[:, positions[variable]])
+                else:
+                    columns[variable].append(np.full(len(values), np.nan))
+        return {variable: np.concatenate(parts) if parts else np.zeros(0) for variable, parts in columns.items()}
+
+    def read(self, variables: list[str]) -> dict:
+        """
+        :param variables: Dotted variables, like "stage1.fins.span" or "simulator.apogee"
+        :return: Value of every variable per iteration, NaN where it is not a number
+        """
+        compact_file = os.path.join(self.directory, "columns.npz")
+        if not os.path.exists(compact_file):
+            return self.read_segments(variables)
+
+        columns: dict = {}
+        with np.load(compact_file) as compact:
+            rows: int = len(compact["iteration"])
+            for variable in variables:
+                columns[variable] = compact[variable] if variable in compact.files else np.full(rows, np.nan)
+        return columns
+
+    def close(self):
+        """
+        Rewrites the segments as one column per variable in columns.npz
+        """
+        segments: list = self.segments()
+        if not segments:
+            return
+        names: list = list(dict.fromkeys(name for columns, _ in segments for name in columns))
+        np.savez(os.path.join(self.directory, "columns.npz"), **self.read_segments(names))
+        for i, (_, values_file) in enumerate(segments):
+            os.remove(os.path.join(self.directory, f"columns_{i}.json"))
+            if os.path.exists(values_file):
+                os.remove(values_file)
+        self.columns, self.segment = None, 0
+
+    def clear(self):
+        """
+        Removes the iterations of an earlier run in the same directory
+        """
+        for i, (_, values_file) in enumerate(self.segments()):
+            os.remove(os.path.join(self.directory, f"columns_{i}.json"))
+            if os.path.exists(values_file):
+                os.remove(values_file)
+        if os.path.exists(os.path.join(self.directory, "columns.npz")):
+            os.remove(os.path.join(self.directory, "columns.npz"))
+        self.columns, self.segment = None, 0
+
+
+def get_value(rocket, variable: str):
+    """
+    :param rocket: Rocket class
+    :param variable: Dotted variable without "rocket.", "simulator." for the Simulator
+    :return: Value of the variable
+    """
+    value = rocket
+    for key in variable.split("."):
+        value = value[key]
+    return value
+
+
+def set_value(rocket, variable: str, value):
+    """
+    :param rocket: Rocket class
+    :param variable: Dotted variable without "rocket.", "simulator." for the Simulator
+    :param value: New value
+    """
+    keys: list = variable.split(".")
+    node = rocket
+    for key in keys[:-1]:
+        node = node[key]
+    node[keys[-1]] = value
+
+
+class SnapshotArchive:
+    def __init__(self, directory: str, keyframe_interval: int = 10):
+        """
+        :param directory: Directory of the run in the archive
+        :param keyframe_interval: Number of iterations between the full Rocket classes
+        Delta encoded Rocket classes of a run. The full class is pickled at iteration 0, every keyframe_interval
+        iterations, the last iteration and every iteration without known changes ({iteration}_rocket.pickle). Every
+        other iteration only appends the values that changed since the iteration before to iterations.delta, so any
+        iteration is rebuilt from the keyframe before it. Only the numeric values of the simulator are in the changes,
+        its trajectory arrays and flight data are those of the keyframe the iteration is rebuilt from.
+        """
+        self.directory: str = directory
+        self.keyframe_interval: int = keyframe_interval
+        self.delta_file: str = os.path.join(directory, "iterations.delta")
+        self.simulator: dict | None = None  # Numeric simulator values of the last saved iteration
+
+    def clear(self):
+        """
+        Removes the iterations of an earlier run in the same directory
+        """
+        for file in self.keyframes().values():
+            os.remove(file)
+        if os.path.exists(self.delta_file):
+            os.remove(self.delta_file)
+        self.simulator = None
+
+    def keyframes(self) -> dict:
+        """
+        :return: File of every saved full Rocket class per iteration
+        """
+        keyframes: dict = {}
+        if os.path.exists(self.directory):
+            for file in os.listdir(self.directory):
+                match = re.fullmatch(r"(\d+)_rocket\.pickle", file)
+                if match is not None:
+                    keyframes[int(match.group(1))] = os.path.join(self.directory, file)
+        return dict(sorted(keyframes.items()))
+
+    @staticmethod
+    def simulator_values(rocket) -> dict:
+        return {name: value for name, value in rocket.simulator.__dict__.items() if value is None or is_number(value)}
+
+    def save(self, iteration: int, rocket, changes: dict | None = None, last: bool = False):
+        """
+        :param iteration: Number of the iteration, 0 for the starting point
+        :param rocket: Rocket class after the iteration
+        :param changes: Values of the Rocket class that changed since the last saved iteration, with their dotted path,
+        the iteration is saved as a keyframe if they are not known
+        :param last: Last iteration of the run, which is always a keyframe
+        """
+        simulator: dict = self.simulator_values(rocket)
+        if self.simulator is None or changes is None or last or iteration % self.keyframe_interval == 0:
+            with open(os.path.join(self.directory, f"{str(iteration).zfill(4)}_rocket.pickle"), "wb") as file:
+                pickle.dump(rocket, file)
+        else:
+            changes = dict(changes)
+            for name, value in simulator.items():
+                if name not in self.simulator or self.simulator[name] != value:
+                    changes[f"simulator.{name}"] = value
+            with open(self.delta_file, "ab") as file:
+                pickle.dump((iteration, changes), file)
+        self.simulator = simulator
+
+    def deltas(self):
+        """
+        :return: Iterator over the (iteration, changes) of every saved iteration after the first, in order
+        """
+        if not os.path.exists(self.delta_file):
+            return
+        with open(self.delta_file, "rb") as file:
+            while True:
+                try:
+                    yield pickle.load(file)
+                except (EOFError, pickle.UnpicklingError):  # End of the file, or an unfinished last iteration
+                    return
+
+    def load(self, iteration: int):
+        """
+        :param iteration: Number of the iteration
+        :return: Rocket class of the iteration, rebuilt from the keyframe before it and the changes since. The
+        trajectory arrays and flight data of its simulator are those of the keyframe.
+        """
+        keyframes: dict = self.keyframes()
+        start: list = [keyframe for keyframe in keyframes if keyframe <= iteration]
+        if not start:
+            raise FileNotFoundError(f"No keyframe at or before iteration {iteration} in '{self.directory}'")
+        with open(keyframes[start[-1]], "rb") as file:
+            rocket = pickle.load(file)
+        if start[-1] == iteration:
+            return rocket
+
+        rebuilt: int = start[-1]
+        for delta_iteration, changes in self.deltas():
+            if delta_iteration > iteration:
+                break
+            if delta_iteration > start[-1]:
+                for variable, value in changes.items():
+                    set_value(rocket, variable, value)
+                rebuilt = delta_iteration
+        if rebuilt != iteration:
+            raise FileNotFoundError(f"Iteration {iteration} is not saved in '{self.directory}'")
+        return rocket
+
+    def history(self, variable: str):
+        """
+        :param variable: Dotted variable without "rocket.", like "stage1.fins.span" or "simulator.apogee"
+        :return: Iterator over the (iteration, value) of every saved iteration, from the keyframes and the changes
+        """
+        keyframes: dict = self.keyframes()
+        if not keyframes:
+            return
+        first: int = next(iter(keyframes))
+        deltas = self.deltas()
+        delta = next(deltas, None)
+        value = None
+        for keyframe, file_name in keyframes.items():
+            while delta is not None and delta[0] < keyframe:  # Iterations between the keyframes
+                if delta[0] > first and delta[0] not in keyframes:
+                    value = delta[1].get(variable, value)
+                    yield delta[0], value
+                delta = next(deltas, None)
+            with open(file_name, "rb") as file:
+                value = get_value(pickle.load(file), variable)
+            yield keyframe, value
+        while delta is not None:  # Iterations after the last keyframe of an unfinished run
+            value = delta[1].get(variable, value)
+            yield delta[0], value
+            delta = next(deltas, None)
@@ -0,0 +1,297 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import traceback
+from multiprocessing.connection import wait
+
+import numpy as np
+import pandas as pd
+
+import file_manager as fm
+import main
+import sampling
+
+
+current_file_path = os.path.split(sys.argv[0])[0]
+
+
+def worker(connection, log_directory: str):
+    """
+    :param connection: Pipe to the campaign, receives the runs and sends back their status
+    :param log_directory: Directory of the output of every run
+    Runs randomized Runner classes one after the other, the process is kept alive between runs so the numba functions
+    are only compiled once per worker
+    """
+    while True:
+        try:
+            task: dict | None = connection.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+
+        start_time = time.time()
+        with open(os.path.join(log_directory, f"run_{task['run_id']}.log"), "w") as log, \
+                contextlib.redirect_stdout(log):
+            try:
+                runner = main.Runner(task["file_name"], randomize=True, seed=task["seed"], factors=task["factors"])
+                runner.run(task["iterations"], print_sub=False, export_summary=task["export_summary"],
+                           run_id=task["run_id"])
+                result: dict = {"status": "ok"}
+            except Exception:
+                result: dict = {"status": "failed", "traceback": traceback.format_exc()}
+                print(result["traceback"])
+        result["duration"] = round(time.time() - start_time, 2)
+        connection.send(result)
+
+
+class Campaign:
+    def __init__(self, name: str, file_name: str = "initial_values_2", runs: int = 10, iterations: int = 50,
+                 seed: int = 0, export_summary: bool = True, method: str = "lhs"):
+        """
+        :param name: Name of the campaign, an existing campaign with this name is resumed and the other parameters are
+        taken from its manifest
+        :param file_name: Name of the rocket initialization file
+        :param runs: Number of randomized runs, or the number of base samples N for "saltelli"
+        :param iterations: Largest number of iterations per run
+        :param seed: Seed of the first run, run i gets seed + i
+        :param export_summary: Export the summary of every run
+        :param method: Sampling of the initial values, "lhs", "sobol" or "random", see sampling.unit_design, or
+        "saltelli" for the (d + 2) * N runs of the Sobol sensitivity indices
+        Sensitivity study of many randomized runs. Every run gets its own run id in the archive, its own seed and its
+        own row of the design in files/campaigns/{name}/design.csv, the status of every run is kept in
+        files/campaigns/{name}.json so an interrupted campaign can be resumed
+        """
+        self.name: str = name
+        self.directory: str = os.path.join(current_file_path, "files/campaigns")
+        self.log_directory: str = os.path.join(self.directory, name)
+        self.manifest_file: str = os.path.join(self.directory, f"{name}.json")
+        self.design_file: str = os.path.join(self.log_directory, "design.csv")
+        self.archive: str = os.path.join(current_file_path, "files/archive")
+
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file) as file:
+                self.manifest: dict = json.load(file)
+            print(f"Resuming campaign '{name}', {len(self.remaining())}/{len(self.manifest['runs'])} runs remaining")
+        else:
+            # Sample the initial values of all runs at once, for an even coverage
+            data = fm.import_csv(file_name)
+            if method == "saltelli":
+                design = sampling.saltelli_design(data, runs, seed)
+            else:
+                design = sampling.design(data, runs, method, seed)
+
+            self.manifest: dict = {"file_name": file_name, "iterations": iterations, "seed": seed,
+                                   "export_summary": export_summary, "method": method, "samples": runs,
+                                   "runs": self.reserve_runs(len(design), file_name, seed)}
+            self.save()
+            design.index = [run["run_id"] for run in self.manifest["runs"]]
+            design.to_csv(self.design_file, index_label="run_id")
+        self.design: pd.DataFrame = pd.read_csv(self.design_file, index_col="run_id")
+
+    def reserve_runs(self, runs: int, file_name: str, seed: int) -> list[dict]:
+        """
+        :param runs: Number of runs
+        :param file_name: Name of the rocket initialization file
+        :param seed: Seed of the first run
+        :return: Runs of the campaign, with run ids from the index of the archive
+        """
+        reserved: list[dict] = []
+        with contextlib.closing(fm.open_index()) as index:
+            for i in range(runs):
+                run_id: int = index.allocate(file_name, seed + i, self.name, status="pending")
+                reserved.append({"run_id": run_id, "seed": seed + i, "status": "pending"})
+        return reserved
+
+    def save(self):
+        # Write to a temporary file first, so an interrupted campaign never leaves a broken manifest
+        if not os.path.exists(self.log_directory):
+            os.makedirs(self.log_directory)
+        with open(f"{self.manifest_file}.tmp", "w") as file:
+            json.dump(self.manifest, file, indent=4)
+        os.replace(f"{self.manifest_file}.tmp", self.manifest_file)
+
+    def remaining(self) -> list[dict]:
+        return [run for run in self.manifest["runs"] if run["status"] != "ok"]
+
+    def finished(self) -> list[int]:
+        """
+        :return: Run ids of the runs that finished, for Runner.plot_sensitivity
+        """
+        return [run["run_id"] for run in self.manifest["runs"] if run["status"] == "ok"]
+
+    def outputs(self, variables: list[str] | None = None) -> pd.DataFrame:
+        """
+        :param variables: Dotted variables of the converged Rocket class, like "rocket.simulator.apogee", by default
+        the "sensitivity_outputs" of the run parameters
+        :return: Value of every variable (column) in the last iteration of every run (row), NaN if the run did not
+        finish
+        The values are cached in files/campaigns/{name}/outputs.csv, only new variables and new runs are read from
+        the archive
+        """
+        if variables is None:
+            with open(os.path.join(current_file_path, "files/run_parameters.json")) as file:
+                variables = json.load(file)["sensitivity_outputs"]
+
+        cache_file = os.path.join(self.log_directory, "outputs.csv")
+        run_ids: list = [run["run_id"] for run in self.manifest["runs"]]
+        cache = pd.read_csv(cache_file, index_col="run_id") if os.path.exists(cache_file) else pd.DataFrame()
+        cache = cache.reindex(index=run_ids, columns=list(dict.fromkeys(list(cache.columns) + variables)))
+
+        changed: bool = False
+        for run_id in self.finished():
+            missing: list = [variable for variable in cache.columns if pd.isna(cache.at[run_id, variable])]
+            if not missing:
+                continue
+            columns: dict = fm.open_archive(f"run_{run_id}").read([variable.split(".", 1)[1] for variable in missing])
+            for variable in missing:
+                column: np.ndarray = columns[variable.split(".", 1)[1]]  # Without "rocket."
+                cache.at[run_id, variable] = column[-1] if len(column) else np.nan
+            changed = True
+
+        # Runs that were started again lose their cached outputs
+        unfinished: list = [run["run_id"] for run in self.manifest["runs"] if run["status"] != "ok"]
+        cache.loc[unfinished] = np.nan
+        if changed or unfinished:
+            cache.to_csv(cache_file, index_label="run_id")
+        return cache[variables].astype(float)
+
+    def sensitivity(self, variables: list[str] | None = None, resamples: int = 1000, confidence: float = 0.95) \
+            -> pd.DataFrame:
+        """
+        :param variables: Dotted output variables, see outputs
+        :param resamples: Number of bootstrap resamples
+        :param confidence: Confidence level of the intervals
+        :return: First order and total Sobol index of every sampled variable on every output, with the half width of
+        their confidence interval, also saved as files/campaigns/{name}/sensitivity.csv
+        Needs a campaign with the "saltelli" method
+        """
+        if self.manifest["method"] != "saltelli":
+            raise ValueError(f"Campaign '{self.name}' uses '{self.manifest['method']}' sampling instead of 'saltelli'")
+        outputs = self.outputs(variables)
+
+        results: list = []
+        for output in outputs.columns:
+            indices: dict = sampling.sobol_indices(outputs[output].to_numpy(), len(self.design.columns), resamples,
+                                                   confidence, self.manifest["seed"])
+            results.append(pd.DataFrame({"output": output, "variable": self.design.columns, **indices}))
+
+        results: pd.DataFrame = pd.concat(results, ignore_index=True)
+        results.to_csv(os.path.join(self.log_directory, "sensitivity.csv"), index=False)
+        return results
+
+    def clear_run(self, run: dict):
+        """
+        :param run: Run that is started again, the iterations and summary of the earlier attempt are removed
+        """
+        run_directory = os.path.join(self.archive, f"run_{run['run_id']}")
+        shutil.rmtree(run_directory, ignore_errors=True)
+        os.makedirs(run_directory)
+        summary = os.path.join(current_file_path, f"files/summaries/summary_{run['run_id']}.csv")
+        if os.path.exists(summary):
+            os.remove(summary)
+
+    def run(self, workers: int = 2, timeout: float | None = None):
+        """
+        :param workers: Number of worker processes
+        :param timeout: Largest duration of a run in s, the first run of a worker includes the numba compilation
+        Runs all runs that did not finish yet, a run that times out stops its worker, which is replaced
+        """
+        queue: list[dict] = self.remaining()
+        if not queue:
+            print(f"Campaign '{self.name}' already finished")
+            return
+        print(f"Running campaign '{self.name}', {len(queue)} runs on {min(workers, len(queue))} workers")
+        start_time = time.time()
+        context = multiprocessing.get_context("spawn")  # Fresh processes, the numba and thread state is not shared
+
+        def start_worker() -> tuple:
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=worker, args=(child_connection, self.log_directory), daemon=True)
+            process.start()
+            child_connection.close()
+            return process, connection
+
+        def stop_worker(process, connection):
+            process.terminate()
+            process.join()
+            connection.close()
+
+        pool: list = [start_worker() for _ in range(min(workers, len(queue)))]
+        busy: dict = {}  # Run and start time per worker connection
+
+        try:
+            while queue or busy:
+                # Give every idle worker a run
+                for process, connection in pool:
+                    if connection not in busy and queue:
+                        run = queue.pop(0)
+                        self.clear_run(run)
+                        run["status"] = "running"
+                        self.save()
+                        connection.send({"file_name": self.manifest["file_name"],
+                                         "iterations": self.manifest["iterations"],
+                                         "export_summary": self.manifest["export_summary"], "run_id": run["run_id"],
+                                         "seed": run["seed"], "factors": self.design.loc[run["run_id"]].to_dict()})
+                        busy[connection] = (run, time.time())
+
+                # Wait for the first run to finish, or the first run to time out
+                wait_time = None
+                if timeout is not None:
+                    wait_time = max(0.0, min(started + timeout for _, started in busy.values()) - time.time())
+                ready = wait(list(busy), wait_time)
+
+                for i, (process, connection) in enumerate(pool):
+                    if connection not in busy:
+                        continue
+                    run, started = busy[connection]
+                    if connection in ready:
+                        try:
+                            result: dict = connection.recv()
+                        except (EOFError, OSError):  # The worker itself crashed
+                            result: dict = {"status": "failed", "traceback": f"Worker stopped with exit code "
+                                                                            f"{process.exitcode}"}
+                            stop_worker(process, connection)
+                            pool[i] = start_worker()
+                    elif timeout is not None and time.time() - started >= timeout:
+                        result: dict = {"status": "timeout", "duration": round(time.time() - started, 2)}
+                        stop_worker(process, connection)
+                        pool[i] = start_worker()
+                    else:
+                        continue
+
+                    del busy[connection]
+                    run.update(result)
+                    if run["status"] == "ok":
+                        run.pop("traceback", None)
+                    else:  # The Runner class could not record a timeout or a crashed worker itself
+                        with contextlib.closing(fm.open_index()) as index:
+                            index.update(run["run_id"], status=run["status"])
+                    self.save()
+                    print(f"\tRun {run['run_id']} {run['status']}, after {run.get('duration', '-')} s")
+        finally:
+            with contextlib.closing(fm.open_index()) as index:
+                for run, _ in busy.values():  # Interrupted, these runs are started again on resume
+                    run["status"] = "pending"
+                    index.update(run["run_id"], status="pending")
+            self.save()
+            for process, connection in pool:
+                if process.is_alive():
+                    with contextlib.suppress(OSError):
+                        connection.send(None)
+                    process.join(timeout=1)
+                stop_worker(process, connection)
+
+        statuses: list = [run["status"] for run in self.manifest["runs"]]
+        print(f"Finished campaign '{self.name}' after {round(time.time() - start_time, 2)} s, "
+              f"{statuses.count('ok')} ok, {statuses.count('failed')} failed, {statuses.count('timeout')} timed out")
+
+
+if __name__ == "__main__":
+    campaign = Campaign("sensitivity", "initial_values_2", runs=20, iterations=50)
+    campaign.run(workers=os.cpu_count())
+    print(f"Finished runs: {campaign.finished()}")
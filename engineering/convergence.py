@@ -0,0 +1,161 @@
+import numpy as np
+
+
+class ConvergenceMonitor:
+    def __init__(self, parameters: dict):
+        """
+        :param parameters: "convergence" of the run parameters, with "tolerances" as the largest relative change per
+        dotted variable (like "rocket.stage1.fins.span") and optionally "minimum_iterations"
+        Tracks the relative change of the variables between successive Rocket classes, the loop has converged when all
+        variables are within their tolerance
+        """
+        self.tolerances: dict = parameters.get("tolerances", {})
+        self.minimum_iterations: int = int(parameters.get("minimum_iterations", 1))
+
+        self.previous: dict = {}  # Values of the last Rocket class
+        self.history: list[dict] = []  # Relative change of every variable per iteration
+
+    @staticmethod
+    def get_value(rocket, variable: str):
+        value = rocket
+        for key in variable.split(".")[1:]:  # First key is "rocket"
+            value = value[key]
+        return value
+
+    def start(self, rocket):
+        """
+        :param rocket: Rocket class the first iteration starts from
+        """
+        self.remember(rocket)
+        self.history = []
+
+    def remember(self, rocket):
+        """
+        :param rocket: Rocket class the next iteration starts from, when it was changed after the check
+        """
+        self.previous = {variable: self.get_value(rocket, variable) for variable in self.tolerances}
+
+    def check(self, rocket, iteration: int) -> bool:
+        """
+        :param rocket: Rocket class after the iteration
+        :param iteration: Number of the iteration
+        :return: True if all variables changed less than their tolerance, never True without tolerances
+        """
+        residuals: dict = {"iteration": iteration}
+        for variable in self.tolerances:
+            value = self.get_value(rocket, variable)
+            previous = self.previous.get(variable)
+            if value is None or previous is None:
+                residuals[variable] = np.nan
+            else:
+                residuals[variable] = abs(value - previous) / max(abs(previous), np.finfo(float).tiny)
+            self.previous[variable] = value
+        self.history.append(residuals)
+
+        if not self.tolerances or iteration < self.minimum_iterations:
+            return False
+        return all(residuals[variable] <= tolerance for variable, tolerance in self.tolerances.items())
+
+    def largest(self) -> tuple[str, float] | None:
+        """
+        :return: Variable with the largest change relative to its tolerance in the last iteration, and its change
+        """
+        if not self.history or not self.tolerances:
+            return None
+        residuals: dict = self.history[-1]
+        variable = max(self.tolerances, key=lambda name: np.inf if np.isnan(residuals[name]) else
+                       residuals[name] / max(self.tolerances[name], np.finfo(float).tiny))
+        return variable, residuals[variable]
+
+
+class AndersonAccelerator:
+    def __init__(self, parameters: dict, derive=None):
+        """
+        :param parameters: "acceleration" of the run parameters, with "variables" as the independent design variables
+        that are mixed (dotted, like "rocket.stage1.fins.span") and optionally "memory" (number of earlier iterations
+        that are mixed), "damping", "restart_ratio" and "maximum_step"
+        :param derive: Function that derives the dependent quantities of the Rocket class from the mixed variables
+        Treats the design variables as a fixed-point map x = G(x), where G is one simulation and sizing iteration, and
+        mixes the earlier iterations into the next starting point with Anderson mixing. Derived quantities, like the
+        engine impulse, propellant mass and curves, are never mixed, they are derived again from the mixed variables.
+        """
+        self.variables: list = list(parameters.get("variables", []))
+        self.derive = derive
+        self.memory: int = int(parameters.get("memory", 3))
+        self.damping: float = float(parameters.get("damping", 1.0))
+        self.restart_ratio: float = float(parameters.get("restart_ratio", 2.0))  # Growth of the residual that restarts
+        self.maximum_step: float = float(parameters.get("maximum_step", 0.5))  # Largest relative mixing step
+
+        self.inputs: list[np.ndarray] = []  # Starting points x of the remembered iterations
+        self.residuals: list[np.ndarray] = []  # Residuals G(x) - x of the remembered iterations
+        self.norms: list[float] = []  # Scaled norms of the residuals
+        self.steps: dict = {"picard": 0, "anderson": 0, "restart": 0}
+
+    def clear(self):
+        self.inputs, self.residuals, self.norms = self.inputs[-1:], self.residuals[-1:], self.norms[-1:]
+
+    def values(self, rocket) -> np.ndarray:
+        """
+        :param rocket: Rocket class
+        :return: Values of the design variables, NaN if it is not set
+        """
+        values = [ConvergenceMonitor.get_value(rocket, variable) for variable in self.variables]
+        return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+    def step(self, start: np.ndarray, rocket) -> str:
+        """
+        :param start: Values of the design variables the iteration started from, x
+        :param rocket: Rocket class after the iteration, G(x), receives the next starting point
+        :return: Kind of step, "picard" for a plain (damped) iteration, "anderson" or "restart" if the mixed step was
+        rejected and the memory cleared
+        """
+        x = start
+        output = self.values(rocket)
+        if not np.all(np.isfinite(x) & np.isfinite(output)):  # Unset design variables, leave the iteration as it is
+            self.inputs, self.residuals, self.norms = [], [], []
+            self.steps["picard"] += 1
+            return "picard"
+        residual = output - x
+        scale = np.maximum(np.abs(x), np.abs(output))
+        scale[scale == 0] = 1
+        norm = float(np.linalg.norm(residual / scale))
+
+        kind = "anderson"
+        if self.norms and norm > self.restart_ratio * self.norms[-1]:  # Diverging, forget the earlier iterations
+            self.inputs, self.residuals, self.norms = [], [], []
+            kind = "restart"
+        self.inputs = (self.inputs + [x])[-(self.memory + 1):]
+        self.residuals = (self.residuals + [residual])[-(self.memory + 1):]
+        self.norms = (self.norms + [norm])[-(self.memory + 1):]
+
+        picard = x + self.damping * residual
+        new = picard
+        if len(self.inputs) > 1:
+            # Least squares combination of the residual differences that cancels the current residual
+            input_differences = np.diff(np.array(self.inputs), axis=0).T
+            residual_differences = np.diff(np.array(self.residuals), axis=0).T
+            gamma = np.linalg.lstsq(residual_differences / scale[:, None], residual / scale, rcond=None)[0]
+            new = picard - (input_differences + self.damping * residual_differences) @ gamma
+
+            # Safeguard, keep the signs of the plain iteration and limit the relative change of every parameter
+            flipped = np.any((np.sign(new) != np.sign(picard)) & (picard != 0))
+            if flipped or np.max(np.abs(new - picard) / scale) > self.maximum_step:
+                self.clear()
+                new = picard
+                kind = "restart"
+        elif kind != "restart":
+            kind = "picard"
+        self.steps[kind] += 1
+
+        if np.array_equal(new, output):  # Undamped plain iteration, the Rocket class already is the next start
+            return kind
+        for variable, value in zip(self.variables, new):
+            keys: list = variable.split(".")[1:]  # First key is "rocket"
+            node = rocket
+            for key in keys[:-1]:
+                node = node[key]
+            node[keys[-1]] = float(value)
+        if self.derive is not None:
+            self.derive(rocket)
+        rocket.update(print_warnings=False, full=True)
+        return kind
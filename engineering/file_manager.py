@@ -1,11 +1,16 @@
 from sizing.rocket import Rocket
 from simulators.simulator import Simulator
+from sampling import variable_name
+from archive import RunArchive, SnapshotArchive
+from run_index import RunIndex
+from results import ResultStore
 import pandas as pd
 import pickle
 import numpy as np
 import json
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
 
 current_file_path = os.path.split(sys.argv[0])[0]
@@ -38,29 +43,35 @@ def import_csv(file_name: str) -> pd.DataFrame:
     return pd.read_csv(os.path.join(current_file_path, f"files/{file_name}.csv"))
 
 
-def insert_values(data: pd.DataFrame, rocket: Rocket, randomizer: bool = False):
+def insert_values(data: pd.DataFrame, rocket: Rocket, randomizer: bool = False, seed: int | None = None,
+                  factors: dict | None = None):
     """
     :param data: Pandas Dataframe file with initialization values
     :param rocket: Rocket class
     :param randomizer: If true this will randomize the initial values to check for sensitivity
+    :param seed: Seed of the randomized values, None uses the global numpy random state
+    :param factors: Factor per dotted variable name, a row of sampling.design, replaces the randomizer
     """
+    random = np.random if seed is None else np.random.default_rng(seed)
 
-    def add_value(current_value, variable, rocket_sub, locked):
+    def add_value(current_value, variable, rocket_sub, locked, factor=None):
         try:  # Check if variable exists
             try:  # Try to convert it to a float, otherwise leave it as a string
                 value = float(current_value)
             except ValueError:
                 value = current_value
 
-            if randomizer and type(value) == float and not locked:
-                random_value = np.random.uniform(0.5, 2, 1)[0]
+            if factor is not None and type(value) == float and not locked:
+                value = value * factor
+            elif randomizer and type(value) == float and not locked:
+                random_value = random.uniform(0.5, 2, 1)[0]
                 value = value * random_value
 
             rocket_sub[variable] = value
         except KeyError as error:
             raise Exception(f"'{current_value}' not found in csv, error: {error}")
 
-    def add_line(subsystem, line, rocket_sub, locked):
+    def add_line(subsystem, line, rocket_sub, locked, factor=None):
         if len(subsystem) > 1:  # Dig deeper into the class system to get to the subclass
             try:
                 rocket_sub = rocket_sub[subsystem[0]]
@@ -68,32 +79,36 @@ def insert_values(data: pd.DataFrame, rocket: Rocket, randomizer: bool = False):
                 raise Exception(f"Subsystem '{subsystem[0]}' not found in Rocket class, error: {error}")
 
             subsystem.pop(0)
-            add_line(subsystem, line, rocket_sub, locked)
+            add_line(subsystem, line, rocket_sub, locked, factor)
 
         else:  # Insert the value under the right variable
-            add_value(line["Value"], line["Variable"], rocket_sub[subsystem[0]], locked)
+            add_value(line["Value"], line["Variable"], rocket_sub[subsystem[0]], locked, factor)
 
     for index, row in data.iterrows():
+        factor = None if factors is None else factors.get(variable_name(row))
         if row["Subsystem"] == "rocket":  # If it is a global rocket value
-            add_value(row["Value"], row["Variable"], rocket, row["Locked"])
+            add_value(row["Value"], row["Variable"], rocket, row["Locked"], factor)
         elif row["Subsystem"] == "stage":  # If it is a stage value
-            add_value(row["Value"], row["Variable"], rocket[f"stage{int(row['Stage'])}"], row["Locked"])
+            add_value(row["Value"], row["Variable"], rocket[f"stage{int(row['Stage'])}"], row["Locked"], factor)
         else:  # If it is a subsystem value
-            add_line(row["Subsystem"].split(","), row, rocket[f"stage{int(row['Stage'])}"], row["Locked"])
+            add_line(row["Subsystem"].split(","), row, rocket[f"stage{int(row['Stage'])}"], row["Locked"], factor)
 
 
-def initialize_rocket(file_name: str, simulator: Simulator, run_parameters: dict, randomizer: bool) -> Rocket:
+def initialize_rocket(file_name: str, simulator: Simulator, run_parameters: dict, randomizer: bool,
+                      seed: int | None = None, factors: dict | None = None) -> Rocket:
     """
     :param file_name: Name of csv file, must be in "files" folder
     :param simulator: The trajectory simulator
     :param run_parameters: The parameters that decide what the program will run
     :param randomizer: If true this will randomize the initial values to check for sensitivity
+    :param seed: Seed of the randomized values
+    :param factors: Factor per dotted variable name, replaces the randomizer
     :return: A filled Rocket class
     """
     data = import_csv(file_name)  # Import initialization data
     rocket = Rocket(simulator)  # Initialize rocket
 
-    insert_values(data, rocket, randomizer=randomizer)  # Insert csv values into Rocket class
+    insert_values(data, rocket, randomizer=randomizer, seed=seed, factors=factors)  # Insert csv values into Rocket class
 
     import_engine_chemicals(run_parameters["engine_chemicals"], rocket)
 
@@ -156,12 +171,67 @@ def export_to_csv(folder_name: str, file_name: str, rocket: Rocket, variables: d
     data.to_csv(output_path, mode='a', header=not os.path.exists(output_path), index=False)
 
 
+def export_residuals(file_name: str, history: list[dict]):
+    """
+    :param file_name: Name under which the file will be exported
+    :param history: Relative change of the converged variables per iteration, from the ConvergenceMonitor
+    Saves the residual history in the archive as a csv file, overwriting the history of earlier iterations
+    """
+    pd.DataFrame(history).to_csv(os.path.join(current_file_path, f"files/archive/{file_name}.csv"), index=False)
+
+
+def open_archive(run_name: str) -> RunArchive:
+    """
+    :param run_name: Directory of the run in the archive, like "run_5"
+    :return: Columnar archive of the run
+    """
+    return RunArchive(os.path.join(current_file_path, f"files/archive/{run_name}"))
+
+
+def open_snapshots(run_name: str, keyframe_interval: int = 10) -> SnapshotArchive:
+    """
+    :param run_name: Directory of the run in the archive, like "run_5"
+    :param keyframe_interval: Number of iterations between the full Rocket classes
+    :return: Delta encoded Rocket classes of the run
+    """
+    return SnapshotArchive(os.path.join(current_file_path, f"files/archive/{run_name}"), keyframe_interval)
+
+
+def load_iteration(run_number: int, iteration: int) -> Rocket:
+    """
+    :param run_number: Number of the run in the archive
+    :param iteration: Number of the iteration
+    :return: Rocket class of the iteration, rebuilt from the keyframe before it
+    """
+    return open_snapshots(f"run_{run_number}").load(iteration)
+
+
+def open_index() -> RunIndex:
+    """
+    :return: Index of the runs in the archive, in files/runs.sqlite
+    """
+    return RunIndex(os.path.join(current_file_path, "files/runs.sqlite"), os.path.join(current_file_path, "files/archive"))
+
+
+def open_results(indexed: list[str] = ()) -> ResultStore:
+    """
+    :param indexed: Dotted variables that are often filtered on
+    :return: Results of all iterations of all runs, in files/runs.sqlite next to the index
+    """
+    return ResultStore(os.path.join(current_file_path, "files/runs.sqlite"), indexed)
+
+
 def load_variable(run_number: int, variable: list):
     data: list = []
 
     if variable == "iteration" or not variable:
         return None
 
+    # Read the single column from the columnar archive, runs from before it unpickle every iteration
+    archive = open_archive(f"run_{run_number}")
+    if RunArchive.exists(archive.directory):
+        return archive.read([".".join(variable)])[".".join(variable)].tolist()
+
     def get_variable(rocket, i):
         i += 1
         if len(variable) == i + 1:
@@ -169,13 +239,79 @@ def load_variable(run_number: int, variable: list):
         else:
             get_variable(rocket[variable[i]], i)
 
-    files = os.listdir(os.path.join(current_file_path, f"files/archive/run_{run_number}"))
+    files = sorted(os.listdir(os.path.join(current_file_path, f"files/archive/run_{run_number}")))
     for file in files:
+        if not file.endswith(".pickle"):  # Residual history
+            continue
         iteration = import_rocket_iteration(f"archive/run_{run_number}/{file.split('.')[0]}")
         get_variable(iteration, -1)
 
     return data
 
 
+def load_variables(run_number: int, variables: list[str]) -> dict:
+    """
+    :param run_number: Number of the run in the archive
+    :param variables: Dotted variables, like "rocket.stage1.fins.span", or "iteration"
+    :return: Value of every variable per iteration, None for "iteration"
+    Reads all variables at once, from the columnar archive or, for runs from before it, by unpickling every iteration
+    only once
+    """
+    names: dict = {variable: variable.split(".")[1:] for variable in dict.fromkeys(variables) if variable != "iteration"}
+    data: dict = {variable: None for variable in variables}
+
+    archive = open_archive(f"run_{run_number}")
+    if RunArchive.exists(archive.directory):
+        columns: dict = archive.read([".".join(path) for path in names.values()])
+        data.update({variable: columns[".".join(path)] for variable, path in names.items()})
+        return data
+
+    values: dict = {variable: [] for variable in names}
+    files = sorted(os.listdir(os.path.join(current_file_path, f"files/archive/run_{run_number}")))
+    for file in files:
+        if not file.endswith(".pickle"):  # Residual history
+            continue
+        iteration = import_rocket_iteration(f"archive/run_{run_number}/{file.split('.')[0]}")
+        for variable, path in names.items():
+            value = iteration
+            for key in path:
+                value = value[key]
+            values[variable].append(np.nan if value is None else value)
+    data.update({variable: np.array(value) for variable, value in values.items()})
+    return data
+
+
+def load_runs(runs: list[int], variables: list[str], workers: int = 0) -> dict:
+    """
+    :param runs: Numbers of the runs in the archive
+    :param variables: Dotted variables, see load_variables
+    :param workers: Number of processes for the runs from before the columnar archive, 0 for one per CPU
+    :return: Result of load_variables per run
+    Runs in the results store are read with one query per variable, columnar runs take milliseconds and are read
+    directly, the runs that need unpickling are spread over processes
+    """
+    data: dict = {}
+    if os.path.exists(os.path.join(current_file_path, "files/runs.sqlite")):
+        store = open_results()
+        data.update(store.series(runs, variables))
+        store.close()
+
+    pickled: list = []
+    for run in runs:
+        if run in data:
+            continue
+        if RunArchive.exists(open_archive(f"run_{run}").directory):
+            data[run] = load_variables(run, variables)
+        else:
+            pickled.append(run)
+
+    if len(pickled) > 1:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            data.update(zip(pickled, executor.map(load_variables, pickled, [variables] * len(pickled))))
+    elif pickled:
+        data[pickled[0]] = load_variables(pickled[0], variables)
+    return {run: data[run] for run in runs}
+
+
 if __name__ == "__main__":
     pass
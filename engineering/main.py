@@ -1,9 +1,12 @@
 import copy
+import fnmatch
+import hashlib
+import io
 import json
 import os
 import sys
-import re
 import tqdm
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 from colorama import Fore
@@ -11,33 +14,108 @@ from plotting import plot_2d, scatter_plot
 import time
 
 import file_manager as fm
-from simulators.advanced.aerodynamics import drag, isa
+from archive import get_value
+from convergence import ConvergenceMonitor, AndersonAccelerator
+from simulators.advanced.aerodynamics import drag, table_drag, build_drag_table
+from simulators.advanced.atmosphere import isa
 from simulators.advanced.dynamics import run as dynamics_run
+from simulators.advanced.dynamics import run_adaptive as dynamics_run_adaptive
+from simulators.advanced.batch_dynamics import run_batch as dynamics_run_batch
+from simulators.advanced.mission import run_mission, run_mission_summary
 from simulators.advanced.gravity import gravity
 from simulators.simulator import Simulator
+from simulators.dispersion import run as run_dispersion
 
 from sizing.engine import run as run_engine_sizing
 from sizing.recovery import run as run_recovery_sizing
 from sizing.electronics import run as run_electronics_sizing
 from sizing.stability import run as run_stability_sizing
+from sizing.stability import derive as derive_stability
 from sizing.engine import initialize as initialize_engines
 from sizing.stability import initialize as initialize_stability
 from sizing.rocket import Rocket
-
-
-def extract_number(file):
-    s = re.findall("\d+$",file)
-    return int(s[0]) if s else 0, file
+from sizing.parameters import node_items, is_number
+
+
+# Integrators that can be selected with "integrator" in the simulator parameters
+integrators: dict = {"euler": dynamics_run, "dopri5": dynamics_run_adaptive}
+
+# Drag models that can be selected with "drag_model" in the simulator parameters
+drag_models: dict = {"components": drag, "table": table_drag}
+
+
+# Sizers that can be selected with "sizing_selection", with the dotted variables they read and write as patterns. They
+# are called with the Rocket class and the stream they print to. Stage and Rocket sums in the writes are ignored, the
+# Runner sums them again after sizing.
+sizers: dict = {
+    "engine": (run_engine_sizing,
+               ["*"],  # Simulates the whole Rocket
+               ["stage?.engine.*"]),
+    "recovery": (run_recovery_sizing,
+                 ["stage?.dry_mass", "stage?.recovery.main_parachute.*", "stage?.recovery.drogue.*",
+                  "stage?.recovery.*_cost", "stage?.recovery.*_density", "stage?.recovery.?_gas",
+                  "stage?.recovery.diameter"],
+                 ["stage?.recovery.main_parachute.*", "stage?.recovery.drogue.*", "stage?.recovery.gas_total_*",
+                  "stage?.recovery.mass", "stage?.recovery.cost", "stage?.recovery.length"]),
+    "electronics": (run_electronics_sizing,
+                    ["stage?.*.*system.*", "stage?.*.blackbox.*", "stage?.*.datarate", "stage?.*.power_sensors",
+                     "stage?.*.time", "simulator.max_velocity_tot"],
+                    ["stage?.*.*system.*", "stage?.*.blackbox.*", "stage?.electronics.mass"]),
+    "stability": (run_stability_sizing,
+                  ["*"],
+                  ["*cp_location", "*cg_location", "stage?.fins.*", "*.wetted_area", "*.flow_area"])
+}
+
+
+# Functions that derive the dependent quantities of the Rocket class from the design variables the accelerator mixes,
+# with those variables as patterns. Only variables that match a pattern can be selected with "variables".
+derivations: dict = {
+    "stability": (derive_stability, ["stage?.fins.span"])
+}
+
+
+# Variables that only number the iterations, they are not an input of any sizer
+bookkeeping: set = {"id", "iteration"}
+
+# Flight results of the simulator that sizers can read, the other numeric simulator values are its settings, which do
+# not change during a run, or count the work of the last simulation, like checkpoint_hits and trajectory_size
+flight_results: list = ["apogee", "apogee_1", "max_velocity1", "max_velocity2", "max_velocity_tot",
+                        "min_speed_of_sound1", "min_speed_of_sound2", "min_speed_of_sound_tot"]
+
+
+def input_hash(values: dict, paths: list) -> str:
+    """
+    :param values: Result of Runner.input_values
+    :param paths: Dotted paths of the inputs of a sizer
+    :return: Hash of the inputs, the same for the same values
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        value = values.get(path)
+        if isinstance(value, np.ndarray):
+            digest.update(f"{value.dtype}{value.shape}".encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+        else:
+            digest.update(repr(value).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
 
 
 class Runner:
-    def __init__(self, file_name: str, randomize: bool = False):
+    def __init__(self, file_name: str, randomize: bool = False, seed: int | None = None, factors: dict | None = None):
         """
         :param file_name: Name of the rocket initialization file
+        :param randomize: Randomize the initial values, for sensitivity studies
+        :param seed: Seed of the randomized initial values
+        :param factors: Factor on the initial value per dotted variable name, a row of a sampling design
         """
         print(sys.argv[0])
         self.current_file_path = os.path.split(sys.argv[0])[0]
+        self.file_name: str = file_name
+        self.seed: int | None = seed
         self.run_id: int = 0
+        self.index = None  # Index of the archive, opened when the run starts
+        self.results = None  # Results of every iteration, opened when the run starts
         self.iteration_id: int = 0
         self.start_time: float = 0
 
@@ -47,13 +125,30 @@ class Runner:
         self.run_parameters_file = open(os.path.join(self.current_file_path, "files/run_parameters.json"))
         self.run_parameters: dict = json.load(self.run_parameters_file)
         self.selection: list[str] = self.run_parameters["sizing_selection"]
-
-        simulator: Simulator = Simulator(self.run_parameters["mission_profile"], self.run_parameters["simulator_parameters"],
-                                         dynamics_run, gravity, drag, isa)
+        self.sizing_threads: int = int(self.run_parameters.get("sizing_threads", 0))  # 0 runs the sizers one by one
+        self.sizing_inputs: dict | None = None  # Dotted paths of the inputs of every selected sizer
+        self.cache_sizing: bool = bool(self.run_parameters.get("sizing_cache", False))
+        self.sizing_cache: dict = {}  # Hash of the inputs and the changes of the last run of every sizer
+        self.cache_counts: dict = {"hits": 0, "misses": 0}
+        self.convergence: ConvergenceMonitor = ConvergenceMonitor(self.run_parameters.get("convergence", {}))
+
+        # Optional acceleration of the outer loop, plain iterations if it is not selected
+        acceleration: dict = self.run_parameters.get("acceleration", {})
+        self.accelerator: AndersonAccelerator | None = None
+        if acceleration.get("method", "picard") == "anderson":
+            self.accelerator = AndersonAccelerator(acceleration, self.derive_functions(acceleration.get("variables", [])))
+
+        simulator_parameters: dict = self.run_parameters["simulator_parameters"]
+        drag_model: str = simulator_parameters.get("drag_model", "components")
+        simulator: Simulator = Simulator(self.run_parameters["mission_profile"], simulator_parameters,
+                                         integrators[simulator_parameters.get("integrator", "euler")], gravity,
+                                         drag_models[drag_model], isa, batch_run=dynamics_run_batch,
+                                         drag_table=build_drag_table if drag_model == "table" else None,
+                                         mission_run=run_mission, mission_summary_run=run_mission_summary)
         # if file_name[:7] == "archive":  # If name starts with archive, import the class from the archive
         #     self.rocket: Rocket = fm.import_rocket_iteration(file_name)
         # Create a new class from the initialization file
-        self.rocket: Rocket = fm.initialize_rocket(file_name, simulator, self.run_parameters, randomize)
+        self.rocket: Rocket = fm.initialize_rocket(file_name, simulator, self.run_parameters, randomize, seed, factors)
         # Calculate all the Engine specs
         self.rocket = initialize_engines(self.rocket)
 
@@ -62,37 +157,63 @@ class Runner:
         # Import requirements
         self.requirements = fm.import_csv("requirements")
 
-    def create_run_id(self, testing):
+    def create_run_id(self, testing, run_id: int | None = None):
         save_directory = os.path.join(self.current_file_path, f"files/archive")
 
         if not os.path.exists(save_directory):
             os.makedirs(save_directory)
 
-        # Make run_id based on last file created
-        if os.listdir(save_directory) and not testing:
-            self.run_id: int = int(max(os.listdir(f"{self.current_file_path}/files/archive"), key=extract_number).split("_")[1]) + 1
-        else:
+        # Get a new run id from the index of the archive, the testing run is always run 1
+        if testing:
             self.run_id: int = 1
+        else:
+            self.index = fm.open_index()
+            self.results = fm.open_results(self.run_parameters.get("index_metrics", []))
+            if run_id is None:
+                self.run_id: int = self.index.allocate(self.file_name, self.seed)
+            else:  # Given by a campaign, the results of an earlier attempt are removed
+                self.run_id: int = run_id
+                self.index.update(run_id, status="running", started=time.time())
+                self.results.clear(run_id)
 
         # Check if file exists
         if not os.path.exists(f"{save_directory}/run_{self.run_id}"):
             os.makedirs(f"{save_directory}/run_{self.run_id}")
 
-    def run(self, runs, save=True, print_iteration=True, print_sub=True, testing=False, export_catia=False, export_summary=False):
+    def run(self, runs, save=True, print_iteration=True, print_sub=True, testing=False, export_catia=False, export_summary=False,
+            run_id: int | None = None):
         print("Running Main Program")
         self.start_time = time.time()
 
         # Create an ID number to represent this run
-        self.create_run_id(testing)
-
-        # Save starting point
+        self.create_run_id(testing, run_id)
+
+        try:
+            self.run_iterations(runs, save, print_iteration, print_sub, testing, export_catia, export_summary)
+        except BaseException:
+            if self.index is not None:
+                self.index.finish(self.run_id, "failed", iterations=self.iteration_id)
+            raise
+        finally:
+            if self.index is not None:
+                self.index.close()
+                self.results.close()
+                self.index, self.results = None, None
+
+    def run_iterations(self, runs, save, print_iteration, print_sub, testing, export_catia, export_summary):
+        # Save starting point, the iterations are saved in the columnar archive and as delta encoded snapshots
+        run_name: str = "run_1" if testing else f"run_{self.run_id}"
+        archive = fm.open_archive(run_name)
+        snapshots = fm.open_snapshots(run_name, int(self.run_parameters.get("keyframe_interval", 10)))
         if save:
             if print_sub:
                 print("\tSaving Starting Point")
-            if testing:
-                fm.export_rocket_iteration(f"run_1/0000_rocket", self.new_rocket)
-            else:
-                fm.export_rocket_iteration(f"run_{self.run_id}/0000_rocket", self.new_rocket)
+            archive.clear()
+            snapshots.clear()
+            snapshots.save(0, self.new_rocket)
+            values: dict = archive.append(0, self.new_rocket)
+            if self.results is not None:
+                self.results.add_iteration(self.run_id, 0, values)
 
         # Run stability sizing before doing simulations
         initialize_stability(self.rocket)
@@ -105,11 +226,16 @@ class Runner:
         if print_sub:
             print("\tSumming Rocket Parameters")
         self.rocket.update(print_warnings=False)
+        self.convergence.start(self.rocket)
+        self.cache_counts = {"hits": 0, "misses": 0}
+        converged: bool = False
+        mixed: dict | None = None  # Changes since the last saved iteration before the sizing, None if not known
 
         for i in range(runs):
             self.iteration_id = i + 1
             self.rocket.id = f"{self.run_id}.{self.iteration_id}"
             last_time = time.time()
+            start = self.accelerator.values(self.rocket) if self.accelerator is not None else None
 
             if print_iteration:
                 print(f"Iteration {i + 1}/{runs}")
@@ -127,7 +253,7 @@ class Runner:
                 print(f"\t\tInitial apogee: {round(self.rocket.simulator.apogee, 3)} m")
 
             # Sizing
-            self.run_sizing(print_sub)
+            changes: dict = self.run_sizing(print_sub)
 
             print(f"\tAltitude {self.rocket.simulator.apogee}")
 
@@ -136,14 +262,25 @@ class Runner:
                 print("\tSumming Rocket Parameters")
             self.new_rocket.update()
 
+            # Compare with the previous iteration
+            converged: bool = self.convergence.check(self.new_rocket, self.iteration_id)
+            largest = self.convergence.largest()
+            if print_sub and largest is not None:
+                print(f"\tLargest relative change: '{largest[0]}' {largest[1]:.3e}")
+
             # Save iteration
             if save:
                 if print_sub:
                     print(Fore.RESET + "\tSaving Iteration")
-                if testing:
-                    fm.export_rocket_iteration(f"run_1/{str(self.iteration_id).zfill(4)}_rocket", self.new_rocket)
-                else:
-                    fm.export_rocket_iteration(f"run_{self.run_id}/{str(self.iteration_id).zfill(4)}_rocket", self.new_rocket)
+                values: dict = archive.append(self.iteration_id, self.new_rocket)
+                if self.results is not None:
+                    self.results.add_iteration(self.run_id, self.iteration_id, values)
+                snapshots.save(self.iteration_id, self.new_rocket, self.saved_changes(changes, mixed),
+                               last=converged or i == runs - 1)
+                if converged or i == runs - 1:
+                    archive.close()
+                if self.convergence.tolerances:
+                    fm.export_residuals(f"{run_name}/residuals", self.convergence.history)
 
             if export_catia:
                 if print_sub:
@@ -155,11 +292,37 @@ class Runner:
                     print("\tExporting Summary")
                 self.export_summary()
 
+            # Mix the earlier iterations into the next starting point, the saved iteration is the sized Rocket
+            mixed = {}
+            if self.accelerator is not None and not converged:
+                sized = self.new_rocket.copy_on_write()
+                step = self.accelerator.step(start, self.new_rocket)
+                mixed = self.new_rocket.changes(sized)
+                self.convergence.remember(self.new_rocket)
+                if print_sub:
+                    print(f"\tAcceleration step: {step}")
+
             # Overwrite old Rocket with New Rocket
             self.rocket = self.new_rocket
 
             if print_iteration:
-                print(f"Finished iteration {i + 1}, after {round(time.time() - last_time, 2)} s")
+                cache = f", sizer cache {self.cache_counts['hits']} hits and {self.cache_counts['misses']} misses" \
+                    if self.cache_sizing else ""
+                print(f"Finished iteration {i + 1}, after {round(time.time() - last_time, 2)} s{cache}")
+
+            if converged:
+                print(f"Converged after {i + 1} iterations")
+                break
+
+        # Record the run and its final values in the index
+        if self.index is not None:
+            metrics: dict = {}
+            for variable in self.run_parameters.get("index_metrics", []):
+                value = ConvergenceMonitor.get_value(self.new_rocket, variable)
+                if is_number(value):
+                    metrics[variable] = float(value)
+            self.index.finish(self.run_id, "ok", metrics, iterations=self.iteration_id, converged=int(converged),
+                              last_iteration=f"{str(self.iteration_id).zfill(4)}_rocket" if save else None)
 
         print(self.rocket.simulator.apogee_1)
         # Close
@@ -174,66 +337,83 @@ class Runner:
     def populate_simulation(self):
         self.rocket.simulator.create_stages(self.rocket)
 
-    def run_sizing(self, print_status=True):
+    def run_sizing(self, print_status=True) -> dict:
+        """
+        :param print_status: Print the sizers that run
+        :return: Values the sizers changed on the new Rocket class, with their dotted path
+        """
         if print_status:
             print("\tRunning Sizing")
 
         flight_data = self.rocket.simulator.stages  # Flight data from the different stages
         self.rocket.simulator.delete_stages()
 
-        changes: dict = {}
+        if self.sizing_inputs is None:
+            self.sizing_inputs = self.plan_sizing()
+
+        # Sizers with the same inputs as their last run are skipped, their last changes are used again
+        hashes: dict = {}
+        if self.cache_sizing:
+            values: dict = self.input_values()
+            for subsystem in self.sizing_inputs:
+                hashes[subsystem] = input_hash(values, self.sizing_inputs[subsystem])
+                cached = self.sizing_cache.get(subsystem)
+                self.cache_counts["hits" if cached and cached[0] == hashes[subsystem] else "misses"] += 1
+
+        def sizer(subsystem: str, output=None) -> dict:
+            cached = self.sizing_cache.get(subsystem)
+            if cached and cached[0] == hashes.get(subsystem):
+                if print_status:
+                    print(f"\t\tSkipped {subsystem.capitalize()}, inputs did not change", file=output)
+                return cached[1]
 
-        def sizer(subsystem: str | list, function):
             if print_status:
-                if type(subsystem) == list:
-                    for system in subsystem:
-                        print(f"\t\tSizing {system.capitalize()}")
-                else:
-                    print(f"\t\tSizing {subsystem.capitalize()}")
+                print(f"\t\tSizing {subsystem.capitalize()}", file=output)
 
-            rocket = copy.deepcopy(self.rocket)
+            rocket = self.rocket.copy_on_write()
             rocket.simulator.stages = flight_data
-
-            # try:
-            sizing = function(rocket)
-
-            # Get all attributes from the Old and New version of the Rocket class
-            old_rocket = self.rocket.export_all_values()
-            new_rocket = sizing.export_all_values()
-
-            for key, value in new_rocket.items():
-                if not key == "simulator":
-                    if type(value) == list or type(value) == np.array or type(value) == np.ndarray:
-                        if not np.array_equal(new_rocket[key], old_rocket[key]):
-                            if key not in changes:
-                                changes[key] = value
-                            else:
-                                print(f"\t\t\tDuplicate in changes: '{key}'")
-                    else:
-                        if new_rocket[key] != old_rocket[key]:
-                            if key not in changes:
-                                changes[key] = value
-                            else:
-                                print(f"\t\t\tDuplicate in changes: '{key}'")
-            # except Exception as error:
-            #     print(f"\t\t!! {subsystem} sizing failed with: {error}")
-
-        if "engine" in self.selection:
-            sizer("engine", run_engine_sizing)
-
-        if "recovery" in self.selection:
-            sizer("recovery", run_recovery_sizing)
-
-        if "electronics" in self.selection:
-            sizer("electronics", run_electronics_sizing)
-
-        if "stability" in self.selection:
-            sizer("stability", run_stability_sizing)
+            sizer_changes: dict = sizers[subsystem][0](rocket, output=output).changes(self.rocket)
+            if self.cache_sizing:
+                self.sizing_cache[subsystem] = (hashes[subsystem], sizer_changes)
+            return sizer_changes
+
+        # Every sizer sizes its own copy of the Rocket at the start of the iteration, so they do not depend on each other
+        # and run at the same time. Their output is written to a buffer per sizer and printed in the order of the sizers.
+        sized: dict = {}  # Changes of every sizer
+        if self.sizing_threads > 0:
+            buffers: dict = {subsystem: io.StringIO() for subsystem in self.sizing_inputs}
+            try:
+                with ThreadPoolExecutor(self.sizing_threads) as pool:
+                    futures = {subsystem: pool.submit(sizer, subsystem, buffers[subsystem])
+                               for subsystem in self.sizing_inputs}
+                    for subsystem, future in futures.items():
+                        sized[subsystem] = future.result()
+            finally:
+                for buffer in buffers.values():
+                    print(buffer.getvalue(), end="")
+        else:
+            for subsystem in self.sizing_inputs:
+                sized[subsystem] = sizer(subsystem)
 
         if not self.selection:
             if print_status:
                 print("\t\tNo sizing options specified in the 'run_parameters.json'")
 
+        # Only the values that the sizers set are compared with the old Rocket, in the order of the sizers
+        changes: dict = {}
+        writers: dict = {}  # Sizer that changed each value
+        summed: set = self.summed_variables()
+        for subsystem in sizers:
+            if subsystem in sized:
+                for key, value in sized[subsystem].items():
+                    if key not in summed and not any(fnmatch.fnmatchcase(key, pattern) for pattern in sizers[subsystem][2]):
+                        print(f"\t\t\tChange not declared by the sizer: '{key}', set by {subsystem}")
+                    if key not in changes:
+                        changes[key] = value
+                        writers[key] = subsystem
+                    else:
+                        print(f"\t\t\tDuplicate in changes: '{key}', set by {writers[key]} and {subsystem}")
+
         def add_values(system, key, value):
             if "." in key:
                 key_list = key.split(".")
@@ -248,6 +428,111 @@ class Runner:
         serial_num = int(self.rocket.id.split('.')[1])
         serial_num += 1
         self.new_rocket.id = f"{self.run_id}.{serial_num}"
+        return changes
+
+    def saved_changes(self, changes: dict, mixed: dict | None) -> dict | None:
+        """
+        :param changes: Values the sizers changed in this iteration
+        :param mixed: Values that changed since the last saved iteration before the sizing, None if they are not known
+        :return: Values of the new Rocket class that changed since the last saved iteration, with the values that
+        Rocket.update sets (the sums and the dry mass of the Subsystems) and the id, None if they are not known
+        """
+        if mixed is None:
+            return None
+        updated: set = self.summed_variables()
+        for stage in self.new_rocket.summation_indices()["stages"]:
+            updated.update(f"{stage[0]}.{subsystem}.dry_mass" for subsystem in stage[2] if subsystem != "engine")
+
+        saved: dict = {**mixed, **changes, "id": self.new_rocket.id}
+        for variable in updated:
+            saved[variable] = get_value(self.new_rocket, variable)
+        return saved
+
+    def input_values(self) -> dict:
+        """
+        :return: All values of the Rocket class and the flight results of the simulator, with their dotted path
+        """
+        values: dict = {key: value for key, value in self.rocket.export_all_values().items()
+                        if key != "simulator" and key.split(".")[-1] not in bookkeeping}
+        for key in flight_results:
+            values[f"simulator.{key}"] = self.rocket.simulator[key]
+        return values
+
+    def summed_variables(self) -> set:
+        """
+        :return: Dotted names of the Stage and Rocket sums
+        """
+        summed: set = set(self.rocket.compare_list)
+        for stage in self.rocket.summation_indices()["stages"]:
+            summed.update(f"{stage[0]}.{variable}" for variable in self.rocket.compare_list)
+        return summed
+
+    def plan_sizing(self) -> dict:
+        """
+        :return: Dotted paths of the inputs of every selected sizer, in the order of the sizers. These are the variables
+        it reads and the variables it writes, without the Stage and Rocket sums.
+        """
+        keys: list = list(self.input_values())
+        summed: set = self.summed_variables()
+
+        def variables(patterns: list, sums: bool = True) -> set:
+            return {key for key in keys if (sums or key not in summed) and
+                    any(fnmatch.fnmatchcase(key, pattern) for pattern in patterns)}
+
+        # A sizer also reads what it writes, so the cached changes are only used if the written values did not change
+        inputs: dict = {}
+        for subsystem in sizers:
+            if subsystem in self.selection:
+                inputs[subsystem] = sorted(variables(sizers[subsystem][1]) | variables(sizers[subsystem][2], sums=False))
+        return inputs
+
+    @staticmethod
+    def derive_functions(variables: list):
+        """
+        :param variables: Dotted design variables that are mixed by the accelerator, like "rocket.stage1.fins.span"
+        :return: Function that derives the dependent quantities of a Rocket class from the variables
+        """
+        functions: list = []
+        for variable in variables:
+            name: str = variable.split(".", 1)[1]  # Without "rocket."
+            matches: list = [function for function, patterns in derivations.values()
+                             if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)]
+            if not matches:
+                raise ValueError(f"'{variable}' is not a design variable that can be mixed, the quantities derived from "
+                                 f"it are unknown")
+            functions += [function for function in matches if function not in functions]
+
+        def derive(rocket):
+            for function in functions:
+                function(rocket)
+        return derive
+
+    def run_dispersion(self, print_status=True) -> dict:
+        """
+        :return: Drawn inputs, results and statistics of the dispersion, see simulators.dispersion.run
+        Flies the current rocket with the dispersed inputs from "dispersion" in the run parameters
+        """
+        parameters: dict = self.run_parameters["dispersion"]
+        if print_status:
+            print(f"Running Dispersion of {parameters['samples']} samples")
+        start_time = time.time()
+
+        initialize_stability(self.rocket)
+        self.rocket.update(print_warnings=False)
+
+        dispersion = run_dispersion(self.rocket, parameters["distributions"], int(parameters["samples"]),
+                                    seed=parameters.get("seed", 0), threads=parameters.get("threads", 0))
+
+        if print_status:
+            for name, values in dispersion["statistics"].items():
+                if values["count"]:
+                    print(f"\t{name}: mean {values['mean']:.4g}, std {values['std']:.4g}, "
+                          f"5% {values['p5']:.4g}, 95% {values['p95']:.4g} ({values['count']} samples)")
+                else:
+                    print(f"\t{name}: no samples")
+            print(f"Finished after {round(time.time() - start_time, 2)} s")
+
+        return dispersion
 
     def test_sizing(self):
         # run_electronics_sizing(copy.deepcopy(self.rocket))
@@ -260,7 +545,7 @@ class Runner:
         print("Checking Rocket Class")
 
         def check_level(obj, name):
-            attributes = vars(obj)
+            attributes = dict(node_items(obj))  # Includes the values in the parameter vector
             for key, attribute in attributes.items():
                 if key != "simulator":
                     if key in self.rocket.compare_list or key in self.rocket.excluded_variables:
@@ -340,7 +625,32 @@ class Runner:
             else:
                 add_line(row["Subsystem"].split(", "), row, self.rocket[f"stage{int(row['Stage'])}"])
 
+    def check_run_compliance(self, runs: list[int] | None = None):
+        """
+        :param runs: Ids of the runs, all runs in the results store by default
+        :return: Table of the requirements every run meets in its last iteration, from the results store
+        """
+        results = fm.open_results()
+        table = results.compliance(self.requirements, runs)
+        results.close()
+        print(f"{int(table['compliant'].sum())}/{len(table)} runs meet all requirements")
+        return table
+
+    @staticmethod
+    def plot_variables(plots: dict) -> list[str]:
+        """
+        :param plots: Plot entries of the run parameters, like "plot_selection" or "sensitivity_plots"
+        :return: Every dotted variable the plots use, once
+        """
+        variables: list = []
+        for plot_data in plots.values():
+            variables += plot_data["x_data"] + plot_data["y_data"]
+        return list(dict.fromkeys(variables))
+
     def show_plots(self, run_number: int):
+        # Read all variables of all plots at once
+        values: dict = fm.load_variables(run_number, self.plot_variables(self.run_parameters["plot_selection"]))
+
         for plot_name, plot_data in self.run_parameters["plot_selection"].items():
             sets: list = []
             data_set = {"x_description": plot_data["x_label"], "x_data": None,
@@ -351,23 +661,23 @@ class Runner:
             elif len(plot_data["x_data"]) > 1:
                 for variable in plot_data["x_data"]:
                     new_set = data_set.copy()
-                    new_set["x_data"] = fm.load_variable(run_number, variable.split('.')[1:])
-                    new_set["y_data"] = fm.load_variable(run_number, plot_data["y_data"][0].split('.')[1:])
+                    new_set["x_data"] = values[variable]
+                    new_set["y_data"] = values[plot_data["y_data"][0]]
                     new_set["name"] = str(variable)
                     sets.append(new_set)
 
             elif len(plot_data["y_data"]) > 1:
                 for variable in plot_data["y_data"]:
                     new_set = data_set.copy()
-                    new_set["x_data"] = fm.load_variable(run_number, plot_data["x_data"][0].split('.')[1:])
-                    new_set["y_data"] = fm.load_variable(run_number, variable.split('.')[1:])
+                    new_set["x_data"] = values[plot_data["x_data"][0]]
+                    new_set["y_data"] = values[variable]
                     new_set["name"] = str(variable)
                     sets.append(new_set)
 
             else:
                 new_set = data_set.copy()
-                new_set["x_data"] = fm.load_variable(run_number, plot_data["x_data"][0].split('.')[1:])
-                new_set["y_data"] = fm.load_variable(run_number, plot_data["y_data"][0].split('.')[1:])
+                new_set["x_data"] = values[plot_data["x_data"][0]]
+                new_set["y_data"] = values[plot_data["y_data"][0]]
                 new_set["name"] = ""
                 sets.append(new_set)
 
@@ -379,11 +689,14 @@ class Runner:
     def plot_sensitivity(self, runs: list[int], x_lim: tuple = (0, None), y_lim: tuple = (0, None)):
         sets_comparison: list = []
         sets_scatter: list = []
+
+        # Read all variables of all plots at once, for all runs in parallel
+        values: dict = fm.load_runs(runs, self.plot_variables(self.run_parameters["sensitivity_plots"]))
         for run in runs:
             print(f"run_{run}")
             for plot_name, plot_data in self.run_parameters["sensitivity_plots"].items():
-                x_data = fm.load_variable(run, plot_data["x_data"][0].split('.')[1:])
-                y_data = fm.load_variable(run, plot_data["y_data"][0].split('.')[1:])
+                x_data = values[run][plot_data["x_data"][0]]
+                y_data = values[run][plot_data["y_data"][0]]
                 data_set = {"x_description": plot_data["x_label"], "x_data": x_data,
                             "y_description": plot_data["y_label"], "y_data": y_data, "name": f"Run {run}"}
                 if plot_name == "compare":
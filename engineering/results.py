@@ -0,0 +1,180 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+
+# Comparisons that can be used in ResultStore.find and in the requirements
+operators: set = {"<", "<=", "=", "!=", ">=", ">"}
+
+
+def requirement_variable(row) -> str:
+    """
+    :param row: Row of the requirements file
+    :return: Dotted variable of the requirement, like "rocket.simulator.apogee"
+    """
+    if int(row["Stage"]) == 0:
+        if row["Subsystem"] == "simulation":
+            return f"rocket.simulator.{row['Variable']}"
+        if row["Subsystem"] == "rocket":
+            return f"rocket.{row['Variable']}"
+        raise NameError(f"Subsystem '{row['Subsystem']}' is not recognised for compliance checking, use 'simulation' or 'rocket'")
+    return f"rocket.stage{int(row['Stage'])}.{'.'.join(row['Subsystem'].split(', '))}.{row['Variable']}"
+
+
+class ResultStore:
+    def __init__(self, file: str, indexed: list[str] = ()):
+        """
+        :param file: SQLite file, the same as the RunIndex so the results can be joined with the runs
+        :param indexed: Dotted variables that are often filtered on, they get their own index on the value
+        Numeric values of every iteration of every run, one row per run, iteration and parameter, with the stored
+        iterations of every run in their own table. The parameters are the dotted variables of Rocket.export_all_values
+        and the Simulator, with "rocket." in front like in the run parameters.
+        """
+        self.connection = sqlite3.connect(file, timeout=60, isolation_level=None)  # Transactions are explicit
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, only the last commits can be lost
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS iterations (
+                run_id INTEGER NOT NULL,
+                iteration INTEGER NOT NULL,
+                PRIMARY KEY (run_id, iteration)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS parameters (
+                parameter_id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL);
+            CREATE TABLE IF NOT EXISTS results (
+                run_id INTEGER NOT NULL,
+                iteration INTEGER NOT NULL,
+                parameter_id INTEGER NOT NULL REFERENCES parameters(parameter_id),
+                value REAL,
+                PRIMARY KEY (run_id, parameter_id, iteration)) WITHOUT ROWID;""")
+        self.parameter_ids: dict = {}
+        for variable in indexed:
+            parameter_id: int = self.parameter_id(variable)
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS results_value_{parameter_id} "
+                                    f"ON results (value, run_id, iteration) WHERE parameter_id = {parameter_id}")
+
+    def parameter_id(self, variable: str, add: bool = True) -> int | None:
+        """
+        :param variable: Dotted variable
+        :param add: Add the variable if it is not known yet
+        :return: Id of the parameter, None if it is not known and not added
+        """
+        if variable not in self.parameter_ids:
+            if add:
+                self.connection.execute("INSERT OR IGNORE INTO parameters (name) VALUES (?)", (variable,))
+            row = self.connection.execute("SELECT parameter_id FROM parameters WHERE name = ?", (variable,)).fetchone()
+            if row is None:
+                return None
+            self.parameter_ids[variable] = row[0]
+        return self.parameter_ids[variable]
+
+    def add_iteration(self, run_id: int, iteration: int, values: dict):
+        """
+        :param run_id: Id of the run
+        :param iteration: Number of the iteration, 0 for the starting point
+        :param values: Value per dotted variable without "rocket.", like the result of archive.archive_values
+        """
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows: list = [(run_id, iteration, self.parameter_id(f"rocket.{name}"), None if np.isnan(value) else value)
+                          for name, value in values.items() if name != "iteration"]
+            self.connection.execute("INSERT OR IGNORE INTO iterations (run_id, iteration) VALUES (?, ?)",
+                                    (run_id, iteration))
+            self.connection.executemany("INSERT OR REPLACE INTO results (run_id, iteration, parameter_id, value) "
+                                        "VALUES (?, ?, ?, ?)", rows)
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def clear(self, run_id: int):
+        """
+        :param run_id: Id of the run that is started again
+        """
+        self.connection.execute("BEGIN IMMEDIATE")
+        self.connection.execute("DELETE FROM results WHERE run_id = ?", (run_id,))
+        self.connection.execute("DELETE FROM iterations WHERE run_id = ?", (run_id,))
+        self.connection.execute("COMMIT")
+
+    def last_iterations(self, runs: list[int] | None = None) -> dict:
+        """
+        :param runs: Ids of the runs, all runs by default
+        :return: Last stored iteration per run, for the runs that are in the store
+        """
+        query: str = "SELECT run_id, MAX(iteration) FROM iterations"
+        if runs is None:
+            return dict(self.connection.execute(query + " GROUP BY run_id"))
+        last: dict = {}
+        for run in runs:
+            row = self.connection.execute(query + " WHERE run_id = ?", (run,)).fetchone()
+            if row[0] is not None:
+                last[run] = row[1]
+        return last
+
+    def series(self, runs: list[int], variables: list[str]) -> dict:
+        """
+        :param runs: Ids of the runs
+        :param variables: Dotted variables, or "iteration"
+        :return: Value of every variable per iteration per run, like file_manager.load_runs, for the runs that are in
+        the store
+        """
+        iterations: dict = self.last_iterations(runs)
+        stored: list = [run for run in runs if run in iterations]
+        data: dict = {run: {variable: None for variable in variables} for run in stored}
+        for variable in dict.fromkeys(variables):
+            if variable == "iteration":
+                continue
+            parameter_id = self.parameter_id(variable, add=False)
+            for run in stored:
+                column = np.full(iterations[run] + 1, np.nan)
+                if parameter_id is not None:
+                    for iteration, value in self.connection.execute(
+                            "SELECT iteration, value FROM results WHERE run_id = ? AND parameter_id = ?",
+                            (run, parameter_id)):
+                        column[iteration] = np.nan if value is None else value
+                data[run][variable] = column
+        return data
+
+    def find(self, conditions: list[tuple], last: bool = True) -> list[tuple]:
+        """
+        :param conditions: Conditions as (dotted variable, operator, value), like ("rocket.simulator.apogee", ">", 1E5)
+        :param last: Only the last iteration of every run
+        :return: (run id, iteration) of the iterations that meet all conditions
+        """
+        # The parameter id is in the query itself, a partial index is only used for a literal value
+        query: str = "SELECT run_id, iteration FROM results WHERE parameter_id = {} AND value {} ?"
+        selection: set | None = None
+        for variable, operator, value in conditions:
+            if operator not in operators:
+                raise ValueError(f"Operator '{operator}' is not one of {sorted(operators)}")
+            parameter_id = self.parameter_id(variable, add=False)
+            found: set = set() if parameter_id is None else \
+                set(self.connection.execute(query.format(int(parameter_id), operator), (value,)))
+            selection = found if selection is None else selection & found
+
+        if selection and last:
+            final: dict = self.last_iterations(sorted({run for run, _ in selection}))
+            selection = {(run, iteration) for run, iteration in selection if final.get(run) == iteration}
+        return sorted(selection or [])
+
+    def compliance(self, requirements: pd.DataFrame, runs: list[int] | None = None) -> pd.DataFrame:
+        """
+        :param requirements: Requirements, like Runner.requirements
+        :param runs: Ids of the runs, all runs in the store by default
+        :return: Whether the last iteration of every run (row) meets every requirement (column), and a "compliant"
+        column that is True if it meets all
+        """
+        runs = sorted(self.last_iterations()) if runs is None else runs
+        table = pd.DataFrame(index=pd.Index(runs, name="run_id"))
+        for _, row in requirements.iterrows():
+            operator: str = str(row["Type"])
+            if operator not in operators:
+                raise ValueError(f"Comparison type not well defined for variable {row['Variable']}")
+            passed: set = {run for run, _ in self.find([(requirement_variable(row), operator, row["Value"])])}
+            table[row["Requirement"]] = [run in passed for run in runs]
+        table["compliant"] = table.all(axis=1)
+        return table
+
+    def close(self):
+        self.connection.close()
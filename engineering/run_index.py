@@ -0,0 +1,153 @@
+import os
+import re
+import sqlite3
+import time
+
+
+# Comparisons that can be used in RunIndex.select
+operators: set = {"<", "<=", "=", "!=", ">=", ">"}
+
+
+class RunIndex:
+    def __init__(self, file: str, archive: str):
+        """
+        :param file: SQLite file of the index
+        :param archive: Directory of the archive, the runs that are in it but not in the index are added once
+        Index of all runs in the archive, with their status, number of iterations, files and final values. Run ids
+        are handed out by SQLite, so parallel Runner classes and campaigns never get the same id.
+        """
+        self.file: str = file
+        self.archive: str = archive
+        self.connection = sqlite3.connect(file, timeout=60, isolation_level=None)  # Transactions are explicit
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_name TEXT,
+                seed INTEGER,
+                campaign TEXT,
+                status TEXT NOT NULL,
+                iterations INTEGER NOT NULL DEFAULT 0,
+                converged INTEGER NOT NULL DEFAULT 0,
+                directory TEXT NOT NULL DEFAULT '',
+                last_iteration TEXT,
+                started REAL,
+                finished REAL);
+            CREATE TABLE IF NOT EXISTS metrics (
+                run_id INTEGER NOT NULL REFERENCES runs(run_id),
+                name TEXT NOT NULL,
+                value REAL,
+                PRIMARY KEY (run_id, name));
+            CREATE INDEX IF NOT EXISTS metrics_value ON metrics (name, value);
+            CREATE INDEX IF NOT EXISTS runs_status ON runs (status);""")
+        self.add_existing()
+
+    def add_existing(self):
+        """
+        Adds the runs of the archive from before the index with the status "unindexed", once
+        """
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            if self.connection.execute("SELECT 1 FROM sqlite_sequence WHERE name = 'runs'").fetchone() is None and \
+                    os.path.exists(self.archive):
+                for directory in os.listdir(self.archive):
+                    match = re.fullmatch(r"run_(\d+)", directory)
+                    if match is None:
+                        continue
+                    pickles = sorted(file for file in os.listdir(os.path.join(self.archive, directory))
+                                     if file.endswith(".pickle"))
+                    self.connection.execute(
+                        "INSERT INTO runs (run_id, status, iterations, directory, last_iteration) VALUES (?, ?, ?, ?, ?)",
+                        (int(match.group(1)), "unindexed", int(pickles[-1].split("_")[0]) if pickles else 0,
+                         f"archive/{directory}", pickles[-1].split(".")[0] if pickles else None))
+                if self.connection.execute("SELECT 1 FROM sqlite_sequence WHERE name = 'runs'").fetchone() is None:
+                    self.connection.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('runs', 0)")  # Empty
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def allocate(self, file_name: str, seed: int | None = None, campaign: str | None = None,
+                 status: str = "running") -> int:
+        """
+        :param file_name: Name of the rocket initialization file
+        :param seed: Seed of the randomized initial values
+        :param campaign: Name of the campaign the run is part of
+        :param status: Status of the new run
+        :return: New run id, its directory in the archive is made as well
+        """
+        cursor = self.connection.execute(
+            "INSERT INTO runs (file_name, seed, campaign, status, started) VALUES (?, ?, ?, ?, ?)",
+            (file_name, seed, campaign, status, time.time()))
+        run_id: int = cursor.lastrowid
+        self.connection.execute("UPDATE runs SET directory = ? WHERE run_id = ?", (f"archive/run_{run_id}", run_id))
+        os.makedirs(os.path.join(self.archive, f"run_{run_id}"), exist_ok=True)
+        return run_id
+
+    def update(self, run_id: int, **fields):
+        """
+        :param run_id: Id of the run
+        :param fields: New values of the columns of the run, like status="failed"
+        """
+        if not fields:
+            return
+        assignments: str = ", ".join(f"{name} = ?" for name in fields)
+        self.connection.execute(f"UPDATE runs SET {assignments} WHERE run_id = ?", (*fields.values(), run_id))
+
+    def finish(self, run_id: int, status: str, metrics: dict | None = None, **fields):
+        """
+        :param run_id: Id of the run
+        :param status: Final status of the run, like "ok", "failed" or "timeout"
+        :param metrics: Final value per dotted variable, replaces the earlier values of the run
+        :param fields: Other columns of the run, like iterations=50
+        """
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.update(run_id, status=status, finished=time.time(), **fields)
+            if metrics is not None:
+                self.connection.execute("DELETE FROM metrics WHERE run_id = ?", (run_id,))
+                self.connection.executemany("INSERT INTO metrics (run_id, name, value) VALUES (?, ?, ?)",
+                                            [(run_id, name, value) for name, value in metrics.items()])
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def run(self, run_id: int) -> dict | None:
+        """
+        :param run_id: Id of the run
+        :return: All columns of the run and its metrics, None if the run is not in the index
+        """
+        cursor = self.connection.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        run: dict = dict(zip([column[0] for column in cursor.description], row))
+        run["metrics"] = dict(self.connection.execute("SELECT name, value FROM metrics WHERE run_id = ?", (run_id,)))
+        return run
+
+    def select(self, conditions: list[tuple] = (), status: str | None = "ok", campaign: str | None = None) -> list[int]:
+        """
+        :param conditions: Conditions on the metrics as (dotted variable, operator, value), like
+        ("rocket.simulator.apogee", ">", 100000)
+        :param status: Status of the runs, None for all
+        :param campaign: Name of the campaign of the runs, None for all
+        :return: Ids of the runs that meet all conditions, in order
+        """
+        query: str = "SELECT run_id FROM runs WHERE 1"
+        parameters: list = []
+        if status is not None:
+            query += " AND status = ?"
+            parameters.append(status)
+        if campaign is not None:
+            query += " AND campaign = ?"
+            parameters.append(campaign)
+        for name, operator, value in conditions:
+            if operator not in operators:
+                raise ValueError(f"Operator '{operator}' is not one of {sorted(operators)}")
+            query += f" AND run_id IN (SELECT run_id FROM metrics WHERE name = ? AND value {operator} ?)"
+            parameters += [name, value]
+        return [row[0] for row in self.connection.execute(query + " ORDER BY run_id", parameters)]
+
+    def close(self):
+        self.connection.close()
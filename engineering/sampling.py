@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, qmc
+
+
+# Default bounds of the factor on an initial value, if the initialization file has no "Lower" or "Upper" column
+default_bounds: tuple = (0.5, 2.0)
+
+
+def variable_name(row) -> str:
+    """
+    :param row: Row of the initialization file
+    :return: Dotted path of the variable in the Rocket class, like "stage1.recovery.main_parachute.mass"
+    """
+    if row["Subsystem"] == "rocket":
+        return f"rocket.{row['Variable']}"
+    if row["Subsystem"] == "stage":
+        return f"stage{int(row['Stage'])}.{row['Variable']}"
+    return f"stage{int(row['Stage'])}.{row['Subsystem'].replace(',', '.')}.{row['Variable']}"
+
+
+def sampled_variables(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    :param data: Pandas Dataframe file with initialization values
+    :return: Name, lower and upper factor and scale of every unlocked numeric variable, once per variable
+    The optional "Lower", "Upper" and "Scale" ("linear" or "log") columns of the initialization file give the range
+    of the factor the initial value is multiplied with
+    """
+    variables: dict = {}
+    for _, row in data.iterrows():
+        try:
+            float(row["Value"])
+        except ValueError:
+            continue
+        if row["Locked"]:
+            continue
+
+        lower = row.get("Lower", np.nan)
+        upper = row.get("Upper", np.nan)
+        scale = row.get("Scale", np.nan)
+        variables.setdefault(variable_name(row), {
+            "name": variable_name(row),
+            "lower": default_bounds[0] if pd.isna(lower) else float(lower),
+            "upper": default_bounds[1] if pd.isna(upper) else float(upper),
+            "scale": "linear" if pd.isna(scale) else str(scale).strip().lower()})
+
+    for variable in variables.values():
+        if variable["scale"] not in ("linear", "log"):
+            raise ValueError(f"Scale '{variable['scale']}' of '{variable['name']}' is not 'linear' or 'log'")
+        if variable["scale"] == "log" and variable["lower"] <= 0:
+            raise ValueError(f"Lower factor of '{variable['name']}' must be positive for a log scale")
+    return pd.DataFrame(list(variables.values()), columns=["name", "lower", "upper", "scale"])
+
+
+def unit_design(runs: int, dimensions: int, method: str = "lhs", seed: int | None = None) -> np.ndarray:
+    """
+    :param runs: Number of runs
+    :param dimensions: Number of variables
+    :param method: "lhs" for a Latin hypercube, "sobol" for a scrambled Sobol sequence or "random"
+    :param seed: Seed of the design
+    :return: Design in the unit hypercube, one row per run
+    """
+    if method == "lhs":
+        return qmc.LatinHypercube(dimensions, seed=seed).random(runs)
+    if method == "sobol":  # Balanced if runs is a power of 2
+        return qmc.Sobol(dimensions, scramble=True, seed=seed).random(runs)
+    if method == "random":
+        return np.random.default_rng(seed).random((runs, dimensions))
+    raise ValueError(f"Sampling method '{method}' is not 'lhs', 'sobol' or 'random'")
+
+
+def scale_design(unit: np.ndarray, variables: pd.DataFrame) -> np.ndarray:
+    """
+    :param unit: Design in the unit hypercube, one column per variable
+    :param variables: Result of sampled_variables
+    :return: Factors on the initial values
+    """
+    lower = variables["lower"].to_numpy(dtype=float)
+    upper = variables["upper"].to_numpy(dtype=float)
+    log = (variables["scale"] == "log").to_numpy()
+
+    factors = lower + unit * (upper - lower)
+    factors[:, log] = np.exp(np.log(lower[log]) + unit[:, log] * np.log(upper[log] / lower[log]))
+    return factors
+
+
+def design(data: pd.DataFrame, runs: int, method: str = "lhs", seed: int | None = None) -> pd.DataFrame:
+    """
+    :param data: Pandas Dataframe file with initialization values
+    :param runs: Number of runs
+    :param method: "lhs", "sobol" or "random", see unit_design
+    :param seed: Seed of the design
+    :return: Design of experiments, the factors of every run (row) on every unlocked numeric variable (column)
+    """
+    variables = sampled_variables(data)
+    unit = unit_design(runs, len(variables), method, seed)
+    return pd.DataFrame(scale_design(unit, variables), columns=variables["name"])
+
+
+def saltelli_design(data: pd.DataFrame, runs: int, seed: int | None = None) -> pd.DataFrame:
+    """
+    :param data: Pandas Dataframe file with initialization values
+    :param runs: Number of base samples N, balanced if it is a power of 2
+    :param seed: Seed of the design
+    :return: Saltelli design of (d + 2) * N runs for d variables, the matrices A and B followed by the d matrices AB_i,
+    which are A with column i taken from B
+    """
+    variables = sampled_variables(data)
+    dimensions: int = len(variables)
+    base = qmc.Sobol(2 * dimensions, scramble=True, seed=seed).random(runs)
+    a, b = base[:, :dimensions], base[:, dimensions:]
+
+    matrices: list = [a, b]
+    for i in range(dimensions):
+        ab = a.copy()
+        ab[:, i] = b[:, i]
+        matrices.append(ab)
+    return pd.DataFrame(scale_design(np.vstack(matrices), variables), columns=variables["name"])
+
+
+def sobol_indices(outputs: np.ndarray, dimensions: int, resamples: int = 1000, confidence: float = 0.95,
+                  seed: int | None = None) -> dict:
+    """
+    :param outputs: Output of every run of a saltelli_design, NaN for runs that failed
+    :param dimensions: Number of variables d
+    :param resamples: Number of bootstrap resamples
+    :param confidence: Confidence level of the intervals
+    :param seed: Seed of the bootstrap
+    :return: First order ("first", Saltelli 2010) and total ("total", Jansen) index per variable, with the half width
+    of their bootstrap confidence interval ("first_confidence" and "total_confidence")
+    Base samples with a failed run in any of the matrices are left out
+    """
+    outputs = np.asarray(outputs, dtype=float).reshape(dimensions + 2, -1)
+    outputs = outputs[:, ~np.any(np.isnan(outputs), axis=0)]
+    samples: int = outputs.shape[1]
+    if samples < 2:
+        raise ValueError(f"Sobol indices need at least 2 complete base samples, {samples} available")
+
+    def estimate(selection: np.ndarray) -> tuple:
+        a, b, ab = outputs[0, selection], outputs[1, selection], outputs[2:, selection]
+        variance = np.var(np.concatenate((a, b)))
+        with np.errstate(divide="ignore", invalid="ignore"):  # NaN if the output does not change
+            first = np.mean(b * (ab - a), axis=1) / variance
+            total = 0.5 * np.mean((a - ab) ** 2, axis=1) / variance
+        return first, total
+
+    first, total = estimate(np.arange(samples))
+    selections = np.random.default_rng(seed).integers(0, samples, (resamples, samples))
+    bootstrap = np.array([estimate(selection) for selection in selections])  # Resample, index kind, variable
+    z = norm.ppf(0.5 + confidence / 2)
+    return {"first": first, "first_confidence": z * np.std(bootstrap[:, 0], axis=0),
+            "total": total, "total_confidence": z * np.std(bootstrap[:, 1], axis=0)}
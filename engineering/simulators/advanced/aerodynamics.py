@@ -333,5 +333,105 @@ def drag(rocket, velocity: float, temperature: float, density: float, stage: int
     return drag_force
 
 
+
+# Mach number range of the drag tables
+mach_step: float = 0.01
+mach_max: float = 10
+
+
+@njit()
+def drag_components(rocket, velocity: float, temperature: float, density: float, stage: int) -> np.ndarray:
+    """
+    :return: Friction, nosecone, shoulder, fin 1, fin 2 and base drag [N]
+    Breakdown of drag per component, for diagnostics
+    """
+    components = np.zeros(6)
+    if velocity > 0:
+        speed_of_sound = np.sqrt(1.4 * 287 * temperature)  # [m/s]
+        mach_number = velocity / speed_of_sound  # [-]
+        dynamic_pressure = 0.5 * density * velocity ** 2  # [Pa]
+
+        stage1: bool = stage != 2
+        stage2: bool = stage != 1
+        drag_nosecone, drag_coefficient_nose = nosecone_pressure_drag(rocket, dynamic_pressure, mach_number)
+
+        components[0] = skin_friction_drag(rocket, stage1, stage2, velocity, dynamic_pressure, mach_number)
+        if stage2:
+            components[1] = drag_nosecone
+        if stage1:
+            components[2] = shoulder_pressure_drag(rocket, drag_coefficient_nose, dynamic_pressure)
+        components[3], components[4] = fin_pressure_drag(rocket, stage1, stage2, dynamic_pressure, mach_number)
+        components[5] = base_drag(rocket, dynamic_pressure, mach_number)
+
+    return components
+
+
+@njit()
+def build_drag_table(rocket, stage: int, table_step: float = mach_step, table_max: float = mach_max):
+    """
+    :param rocket: FlightData class, the tables are stored in it
+    :param stage: Stage configuration, 0 Total, 1 Stage 1, 2 Stage 2
+    All components scale with the dynamic pressure and only depend on the Mach number, except for skin friction that
+    also scales with velocity^0.2 (Reynolds number). This gives drag = q * S_ref * (Cd_pressure(M) + Cd_friction(M) * V^0.2)
+    The coefficients jump at Mach 1, so the table holds both the subsonic and the supersonic value at Mach 1.
+    """
+    sonic: int = int(round(1 / table_step))  # Index of Mach 1
+    samples: int = int(round(table_max / table_step)) + 2
+    stage1: bool = stage != 2
+    stage2: bool = stage != 1
+
+    cd_pressure = np.zeros(samples)
+    cd_friction = np.zeros(samples)
+    for i in range(samples):
+        if i < sonic:
+            mach_number = i * table_step
+        elif i == sonic:
+            mach_number = 1 - 1E-12  # Subsonic side of Mach 1
+        elif i == sonic + 1:
+            mach_number = 1 + 1E-12  # Supersonic side of Mach 1
+        else:
+            mach_number = (i - 1) * table_step
+
+        # Components at a dynamic pressure of 1 Pa and a velocity of 1 m/s
+        drag_nosecone, drag_coefficient_nose = nosecone_pressure_drag(rocket, 1.0, mach_number)
+        drag_fin1, drag_fin2 = fin_pressure_drag(rocket, stage1, stage2, 1.0, mach_number)
+        drag_pressure = drag_fin1 + drag_fin2 + base_drag(rocket, 1.0, mach_number)
+        if stage2:
+            drag_pressure += drag_nosecone
+        if stage1:
+            drag_pressure += shoulder_pressure_drag(rocket, drag_coefficient_nose, 1.0)
+
+        cd_pressure[i] = drag_pressure / rocket.reference_area
+        cd_friction[i] = skin_friction_drag(rocket, stage1, stage2, 1.0, 1.0, mach_number) / rocket.reference_area
+
+    rocket.mach_step = table_step
+    rocket.cd_pressure = cd_pressure
+    rocket.cd_friction = cd_friction
+
+
+@njit()
+def table_drag(rocket, velocity: float, temperature: float, density: float, stage: int) -> float:
+    """
+    Same as drag, but interpolates the drag tables of build_drag_table instead of evaluating all components
+    """
+    if velocity > 0:
+        speed_of_sound = np.sqrt(1.4 * 287 * temperature)  # [m/s]
+        mach_number = velocity / speed_of_sound  # [-]
+        dynamic_pressure = 0.5 * density * velocity ** 2  # [Pa]
+
+        position = mach_number / rocket.mach_step
+        index = int(position)
+        fraction = position - index
+        if mach_number > 1:  # Skip the subsonic value at Mach 1
+            index += 1
+        if index > rocket.cd_pressure.shape[0] - 2:  # Constant above the table
+            index, fraction = rocket.cd_pressure.shape[0] - 2, 1.0
+        cd_pressure = rocket.cd_pressure[index] + fraction * (rocket.cd_pressure[index + 1] - rocket.cd_pressure[index])
+        cd_friction = rocket.cd_friction[index] + fraction * (rocket.cd_friction[index + 1] - rocket.cd_friction[index])
+
+        return dynamic_pressure * rocket.reference_area * (cd_pressure + cd_friction * velocity ** 0.2)
+
+    return 0.0
+
 if __name__ == "__main__":
     pass
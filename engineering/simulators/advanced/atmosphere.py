@@ -0,0 +1,158 @@
+from numba import njit
+import numpy as np
+import hashlib
+import os
+
+from simulators.advanced import aerodynamics
+
+
+# Table settings, the ISA temperature is linear between the layer ceilings so with a spacing that divides the layer
+# ceilings the temperature is exact and the pressure and density errors are below 1E-6
+spacing: float = 10.0  # [m]
+ceiling: float = aerodynamics.layers[-1][0]  # [m]
+cache_directory: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "files", "cache")
+
+
+@njit()
+def build_table(table_spacing: float, table_ceiling: float) -> np.ndarray:
+    """
+    :param table_spacing: Height step of the table [m]
+    :param table_ceiling: Highest height in the table [m]
+    :return: Table with temperature [K], pressure [Pa], density [kg/m^3] and speed of sound [m/s] per height step
+    """
+    samples: int = int(round(table_ceiling / table_spacing)) + 1
+    table = np.zeros((samples, 4))
+    for i in range(samples):
+        temperature, pressure, density = aerodynamics.isa(min(i * table_spacing, table_ceiling))
+        table[i, 0] = temperature
+        table[i, 1] = pressure
+        table[i, 2] = density
+        table[i, 3] = np.sqrt(1.4 * 287 * temperature)
+
+    return table
+
+
+def load_table(table_spacing: float = spacing, table_ceiling: float = ceiling) -> np.ndarray:
+    """
+    :param table_spacing: Height step of the table [m]
+    :param table_ceiling: Highest height in the table [m]
+    :return: Atmosphere table, loaded from the cache or built and saved in the cache
+    The cache file name contains the layers, so a change in the layers builds a new table.
+    """
+    layers_hash = hashlib.md5(aerodynamics.layers.tobytes()).hexdigest()[:8]
+    cache_file = os.path.join(cache_directory, f"atmosphere_{table_spacing:g}m_{table_ceiling:g}m_{layers_hash}.npy")
+
+    if os.path.exists(cache_file):
+        return np.load(cache_file)
+
+    # Write to a temporary file of this process first, so campaign workers never load a half written table
+    table = build_table(table_spacing, table_ceiling)
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        with open(f"{cache_file}.{os.getpid()}.tmp", "wb") as file:
+            np.save(file, table)
+        os.replace(f"{cache_file}.{os.getpid()}.tmp", cache_file)
+    except OSError as error:
+        print(f"\t\tAtmosphere table not cached, error: {error}")
+
+    return table
+
+
+table: np.ndarray = load_table()
+
+
+@njit()
+def lookup(height: float, column: int) -> float:
+    """
+    :param height: [m]
+    :param column: 0 temperature, 1 pressure, 2 density, 3 speed of sound
+    :return: Linear interpolation in the atmosphere table, extrapolated below the ground
+    """
+    position = height / spacing
+    index = min(max(int(np.floor(position)), 0), table.shape[0] - 2)
+    fraction = position - index
+    return table[index, column] + fraction * (table[index + 1, column] - table[index, column])
+
+
+@njit()
+def isa(height: float) -> tuple[float, float, float]:
+    """
+    :param height: [m]
+    :return: Temperature [K], pressure [Pa] and density [kg/m^3], same as aerodynamics.isa
+    """
+    if height > ceiling:
+        return 0.0, 0.0, 0.0
+
+    position = height / spacing
+    index = min(max(int(np.floor(position)), 0), table.shape[0] - 2)
+    fraction = position - index
+    lower = table[index]
+    upper = table[index + 1]
+    return (lower[0] + fraction * (upper[0] - lower[0]), lower[1] + fraction * (upper[1] - lower[1]),
+            lower[2] + fraction * (upper[2] - lower[2]))
+
+
+@njit()
+def speed_of_sound(height: float) -> float:
+    """
+    :param height: [m]
+    :return: Speed of sound [m/s]
+    """
+    if height > ceiling:
+        return 0.0
+    return lookup(height, 3)
+
+
+@njit()
+def isa_array(heights: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :param heights: Array of heights [m]
+    :return: Arrays with the temperature [K], pressure [Pa] and density [kg/m^3]
+    """
+    temperature = np.empty(heights.shape[0])
+    pressure = np.empty(heights.shape[0])
+    density = np.empty(heights.shape[0])
+    for i in range(heights.shape[0]):
+        temperature[i], pressure[i], density[i] = isa(heights[i])
+
+    return temperature, pressure, density
+
+
+if __name__ == "__main__":
+    import time
+
+    # Per call cost of the layered ISA and the table, run from the engineering folder:
+    # python -m simulators.advanced.atmosphere
+    @njit()
+    def sum_calls(function, heights: np.ndarray) -> float:
+        total: float = 0
+        for height in heights:
+            total += function(height)[1]
+        return total
+
+    test_heights = np.random.default_rng(0).uniform(0, 150000, 1000000)
+    for name, function in (("aerodynamics.isa", aerodynamics.isa), ("atmosphere.isa", isa)):
+        sum_calls(function, test_heights[:10])
+        start = time.perf_counter()
+        sum_calls(function, test_heights)
+        print(f"{name}: {(time.perf_counter() - start) / test_heights.shape[0] * 1E9:.1f} ns per call")
+
+    isa_array(test_heights[:10])
+    start = time.perf_counter()
+    isa_array(test_heights)
+    print(f"atmosphere.isa_array: {(time.perf_counter() - start) / test_heights.shape[0] * 1E9:.1f} ns per height")
+
+    start = time.perf_counter()
+    for height in test_heights[:10000]:
+        aerodynamics.isa.py_func(height)
+    print(f"Python layered ISA (sizing): {(time.perf_counter() - start) / 10000 * 1E9:.1f} ns per call")
+    start = time.perf_counter()
+    for height in test_heights[:10000]:
+        isa(height)
+    print(f"atmosphere.isa from Python: {(time.perf_counter() - start) / 10000 * 1E9:.1f} ns per call")
+
+    errors = np.zeros(3)
+    for height in test_heights[:100000]:
+        exact = np.array(aerodynamics.isa(height))
+        errors = np.maximum(errors, np.abs(np.array(isa(height)) - exact) / exact)
+    print(f"Maximum relative error temperature {errors[0]:.1e}, pressure {errors[1]:.1e}, density {errors[2]:.1e}")
@@ -0,0 +1,87 @@
+import numpy as np
+from numba import njit
+
+from simulators.advanced.dynamics import euler_step
+
+
+@njit()
+def run_batch(flights, stage: int, gravity, drag, isa, locations: np.ndarray, velocities: np.ndarray, angles: np.ndarray,
+              start_times: np.ndarray, end_times: np.ndarray, dt: float = 0.1, delay: float = 0, coast: bool = False):
+    """
+    :param flights: Typed list with a FlightData class per member, only the rocket parameters and mass[0] are used
+    :param locations: Initial locations of all members (N, 2) [m]
+    :param velocities: Initial velocities of all members (N, 2) [m/s]
+    :param angles: Initial angles of all members (N,) [rad]
+    :param start_times: Start time of every member (N,) [s]
+    :param end_times: End time of every member (N,) [s]
+    :return: Final time, locations, velocities and angles, followed by the maximum altitude, maximum vertical velocity,
+    maximum speed of sound and the number of recorded steps of every member
+    Lock-step version of dynamics.run for N rocket designs. The state of all members is kept in (N, ...) arrays and
+    every time step the forces are evaluated for all members that have not reached apogee, the ground or their end
+    time yet. Per member this gives the same trajectory as dynamics.run, without storing the time history.
+    """
+    members: int = len(flights)
+
+    # State of dynamics.euler_step per member, the acceleration and speed of the previous step start at zero
+    state = np.zeros((members, 8))
+    state[:, 0:2] = locations
+    state[:, 2:4] = velocities
+    state[:, 6] = angles
+    time_last = start_times.copy()
+
+    # Mass and engine
+    mass_rocket = np.zeros(members)
+    mass_total = np.zeros(members)
+    delay_i = np.zeros(members, dtype=np.int64)
+    left_tower = np.zeros(members, dtype=np.bool_)
+
+    # Time grid of dynamics.run
+    samples = np.zeros(members, dtype=np.int64)
+    spacing = np.zeros(members)
+
+    # Results
+    active = np.ones(members, dtype=np.bool_)
+    max_altitude = locations[:, 1].copy()
+    max_velocity = velocities[:, 1].copy()
+    max_speed_of_sound = np.zeros(members)
+    steps = np.ones(members, dtype=np.int64)
+
+    for j in range(members):
+        mass_rocket[j] = flights[j].mass[0]
+        mass_total[j] = mass_rocket[j] + flights[j].fuel_mass_curve[0]
+
+        samples[j] = int((end_times[j] - start_times[j]) / dt)
+        if samples[j] > 1:
+            spacing[j] = (end_times[j] - start_times[j]) / (samples[j] - 1)
+
+    i: int = 0
+    while True:
+        any_active: bool = False
+        for j in range(members):
+            if not active[j]:
+                continue
+            if i >= samples[j] or state[j, 3] < 0 or state[j, 1] < 0:  # Stop at apogee, the ground or end time
+                active[j] = False
+                continue
+            any_active = True
+
+            time: float = start_times[j] + i * spacing[j]
+            if i == samples[j] - 1 and i > 0:  # The time grid ends exactly at the end time
+                time = end_times[j]
+
+            mass_total[j], delay_i[j], left_tower[j], _, temperature, _, _, _, _, _ = \
+                euler_step(flights[j], stage, gravity, drag, isa, state[j], time, dt, start_times[j], delay, mass_rocket[j],
+                           mass_total[j], delay_i[j], left_tower[j], coast)
+
+            max_speed_of_sound[j] = max(max_speed_of_sound[j], np.sqrt(1.4 * 287 * temperature))
+            time_last[j] = time
+            steps[j] = i + 2
+            max_altitude[j] = max(max_altitude[j], state[j, 1])
+            max_velocity[j] = max(max_velocity[j], state[j, 3])
+
+        if not any_active:
+            break
+        i += 1
+
+    return time_last, state[:, 0:2].copy(), state[:, 2:4].copy(), state[:, 6].copy(), max_altitude, max_velocity, \
+        max_speed_of_sound, steps
@@ -2,74 +2,354 @@ import numpy as np
 from numba import njit
 
 
+# Dormand-Prince 5(4) coefficients
+c2, c3, c4, c5 = 1 / 5, 3 / 10, 4 / 5, 8 / 9
+a21 = 1 / 5
+a31, a32 = 3 / 40, 9 / 40
+a41, a42, a43 = 44 / 45, -56 / 15, 32 / 9
+a51, a52, a53, a54 = 19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729
+a61, a62, a63, a64, a65 = 9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656
+b1, b3, b4, b5, b6 = 35 / 384, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84  # 5th order solution, b2 = b7 = 0
+e1, e3, e4, e5, e6, e7 = 71 / 57600, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40  # 5th - 4th order
+
+
 @njit()
-def run(flight, stage: int, gravity, drag, isa, dt: float = 0.1, start_time: float = 0, end_time: float = 1000, coast: bool = False, delay: float = 0):
+def run(flight, stage: int, gravity, drag, isa, dt: float = 0.1, start_time: float = 0, end_time: float = 1000, coast: bool = False, delay: float = 0,
+        chunk: int = 10000):
     mass_rocket: float = flight.mass[0]
-    mass_fuel: float = flight.fuel_mass_curve[0]
-    mass_total: float = mass_rocket + mass_fuel
+    mass_total: float = mass_rocket + flight.fuel_mass_curve[0]
 
     left_tower: bool = False
 
-    delay_i: float = 0
+    delay_i: int = 0
+    steps: int = 1  # The initial state is the first recorded step
 
-    for i, time in enumerate(np.linspace(start_time, end_time, int((end_time-start_time) / dt))):
-        if flight.velocities[i][1] >= 0:
-            # Atmosphere
-            flight.temperature[i], flight.pressure[i], flight.density[i] = isa(flight.locations[i][1])
-            flight.speed_of_sound[i] = np.sqrt(1.4 * 287 * flight.temperature[i])
-
-            # Calculate forces
-            force_gravity = gravity(flight.locations[i][1], mass_total)
-            force_drag = drag(flight, flight.total_velocities[i][0], flight.temperature[i], flight.density[i], stage)
-
-            if coast:
-                force_thrust: float = 0
-                mass_fuel: float = 0
-            else:
-                if (start_time + delay) > time:
-                    mass_fuel: float = flight.fuel_mass_curve[0]
-                    force_thrust: float = 0
-                elif (start_time + delay) <= time < (flight.burn_time + start_time + delay - dt):
-                    delay_i += 1
-                    force_thrust = flight.thrust_curve[delay_i]
-                    mass_fuel = flight.fuel_mass_curve[delay_i]
-                else:
-                    mass_fuel: float = 0
-                    force_thrust: float = 0
+    state = np.zeros(8)
+    state[0], state[1] = flight.locations[0][0], flight.locations[0][1]
+    state[2], state[3] = flight.velocities[0][0], flight.velocities[0][1]
+    state[4], state[5] = flight.accelerations[0][0], flight.accelerations[0][1]
+    state[6], state[7] = flight.angles[0], flight.total_velocities[0][0]
 
-            # New mass
-            mass_total: float = mass_rocket + mass_fuel
+    for i, time in enumerate(np.linspace(start_time, end_time, int((end_time-start_time) / dt))):
+        if state[3] >= 0 and state[1] >= 0:  # Stop at apogee or the ground
+            if i + 1 >= flight.time.shape[0]:  # Buffers too small for the next step
+                flight.grow(chunk)
 
-            force_x = (force_thrust - force_drag) * np.sin(flight.angles[i])
-            force_y = (force_thrust - force_drag) * np.cos(flight.angles[i]) - force_gravity
+            mass_total, delay_i, left_tower, total_velocity, temperature, pressure, density, force_thrust, force_drag, \
+                force_gravity = euler_step(flight, stage, gravity, drag, isa, state, time, dt, start_time, delay, mass_rocket,
+                                           mass_total, delay_i, left_tower, coast)
 
-            # Append forces to flight
+            # Atmosphere and forces of this step
+            flight.temperature[i], flight.pressure[i], flight.density[i] = temperature, pressure, density
+            flight.speed_of_sound[i] = np.sqrt(1.4 * 287 * temperature)
             flight.force_drag[i] = force_drag
             flight.force_thrust[i] = force_thrust
             flight.force_gravity[i] = force_gravity
 
-            # Iteration
-            flight.accelerations[i + 1] = np.array((force_x, force_y), dtype=np.float64) / mass_total
-            flight.velocities[i + 1] = flight.accelerations[i] * dt + flight.velocities[i]
-            flight.locations[i + 1] = flight.velocities[i] * dt + flight.locations[i]
-
-            total_velocity: float = np.linalg.norm(flight.velocities[i])
+            # Next state
+            flight.locations[i + 1][0], flight.locations[i + 1][1] = state[0], state[1]
+            flight.velocities[i + 1][0], flight.velocities[i + 1][1] = state[2], state[3]
+            flight.accelerations[i + 1][0], flight.accelerations[i + 1][1] = state[4], state[5]
+            flight.angles[i + 1] = state[6]
             flight.total_velocities[i + 1] = total_velocity
-            if total_velocity >= 40 or left_tower:
-                left_tower = True
-                if total_velocity == 0:
-                    flight.angles[i + 1] = flight.angles[i]
-                else:
-                    flight.angles[i + 1] = np.arcsin(flight.velocities[i][0] / total_velocity)
-            else:
-                flight.angles[i + 1] = flight.angles[i]
 
             flight.time[i + 1] = time
-            time += dt
+            steps = i + 2
 
         else:
             break
 
+    flight.steps = steps
+    flight.evaluations = steps - 1
+
+
+@njit()
+def euler_step(flight, stage: int, gravity, drag, isa, state: np.ndarray, time: float, dt: float, start_time: float, delay: float,
+               mass_rocket: float, mass_total: float, delay_i: int, left_tower: bool, coast: bool = False, thrust_scale: float = 1.0,
+               drag_scale: float = 1.0, wind: float = 0.0) -> tuple:
+    """
+    Explicit Euler step of run, also used by the mission, batch and dispersion kernels.
+    :param state: Location x/y, velocity x/y, acceleration x/y, angle and the airspeed of the previous step, updated to
+    the next step
+    :param time: Time of the step [s]
+    :param mass_rocket: Mass without the propellant [kg]
+    :param mass_total: Total mass of the previous step [kg]
+    :param delay_i: Number of thrust curve samples used so far
+    :param left_tower: Rocket left the launch tower and follows the airspeed vector
+    :param thrust_scale: Factor on the thrust curve [-]
+    :param drag_scale: Factor on the drag force [-]
+    :param wind: Horizontal wind speed in the direction of flight [m/s]
+    :return: New total mass, delay_i and left_tower, the speed of the state before the step and the atmosphere and
+    forces of the step
+    """
+    # Atmosphere
+    temperature, pressure, density = isa(state[1])
+
+    # Calculate forces
+    force_gravity = gravity(state[1], mass_total)
+    force_drag = drag(flight, state[7], temperature, density, stage) * drag_scale
+
+    if coast:
+        force_thrust: float = 0.0
+        mass_fuel: float = 0.0
+    elif (start_time + delay) > time:
+        mass_fuel = flight.fuel_mass_curve[0]
+        force_thrust = 0.0
+    elif (start_time + delay) <= time < (flight.burn_time + start_time + delay - dt):
+        delay_i += 1
+        force_thrust = flight.thrust_curve[delay_i] * thrust_scale
+        mass_fuel = flight.fuel_mass_curve[delay_i]
+    else:
+        mass_fuel = 0.0
+        force_thrust = 0.0
+
+    # New mass
+    mass_total = mass_rocket + mass_fuel
+
+    force_x = (force_thrust - force_drag) * np.sin(state[6])
+    force_y = (force_thrust - force_drag) * np.cos(state[6]) - force_gravity
+
+    # Iteration, the velocity uses the acceleration of the previous step
+    speed: float = np.sqrt(state[2] ** 2 + state[3] ** 2)
+    air_speed: float = np.sqrt((state[2] - wind) ** 2 + state[3] ** 2)
+    if speed >= 40 or left_tower:
+        left_tower = True
+        if air_speed != 0:
+            state[6] = np.arctan2(state[2] - wind, state[3])
+
+    state[0] += state[2] * dt
+    state[1] += state[3] * dt
+    state[2] += state[4] * dt
+    state[3] += state[5] * dt
+    state[4] = force_x / mass_total
+    state[5] = force_y / mass_total
+    state[7] = air_speed
+
+    return mass_total, delay_i, left_tower, speed, temperature, pressure, density, force_thrust, force_drag, force_gravity
+
+
+@njit()
+def engine_state(flight, time: float, phase_time: float, ignition_time: float, coast: bool) -> tuple[float, float]:
+    """
+    :param flight: FlightData class
+    :param time: Time at which the curves are interpolated [s]
+    :param phase_time: Time that decides the engine phase, the start of the integration step [s]
+    :param ignition_time: Time of ignition [s]
+    :param coast: No engine at all
+    :return: Thrust [N] and fuel mass [kg]
+    """
+    if coast:
+        return 0.0, 0.0
+    if phase_time < ignition_time:  # Before ignition
+        return 0.0, flight.fuel_mass_curve[0]
+    if phase_time >= ignition_time + flight.burn_time:  # After burnout
+        return 0.0, 0.0
+
+    # The curves are sampled evenly over the burn time
+    samples: int = flight.thrust_curve.shape[0]
+    position = min(max(time - ignition_time, 0.0), flight.burn_time) / flight.burn_time * samples
+    index = int(position)
+    if index >= samples - 1:
+        return flight.thrust_curve[samples - 1], flight.fuel_mass_curve[samples - 1]
+
+    fraction = position - index
+    thrust = flight.thrust_curve[index] + fraction * (flight.thrust_curve[index + 1] - flight.thrust_curve[index])
+    fuel_mass = flight.fuel_mass_curve[index] + fraction * (flight.fuel_mass_curve[index + 1] - flight.fuel_mass_curve[index])
+    return thrust, fuel_mass
+
+
+@njit()
+def derivatives(flight, stage: int, gravity, drag, isa, time: float, phase_time: float, state: np.ndarray, derivative: np.ndarray,
+                ignition_time: float, coast: bool, left_tower: bool) -> tuple:
+    """
+    :param state: Location and velocity [x, y, vx, vy]
+    :param derivative: Output array for the velocity and acceleration [vx, vy, ax, ay]
+    :return: Angle, forces and atmosphere at the state, used for recording
+    """
+    temperature, pressure, density = isa(state[1])
+    total_velocity = np.sqrt(state[2] ** 2 + state[3] ** 2)
+
+    force_thrust, mass_fuel = engine_state(flight, time, phase_time, ignition_time, coast)
+    mass_total = flight.mass[0] + mass_fuel
+
+    force_gravity = gravity(state[1], mass_total)
+    force_drag = drag(flight, total_velocity, temperature, density, stage)
+
+    # Follow the velocity vector once the rocket left the launch tower
+    if left_tower and total_velocity > 0:
+        angle = np.arcsin(state[2] / total_velocity)
+    else:
+        angle = flight.angles[0]
+
+    derivative[0] = state[2]
+    derivative[1] = state[3]
+    derivative[2] = (force_thrust - force_drag) * np.sin(angle) / mass_total
+    derivative[3] = ((force_thrust - force_drag) * np.cos(angle) - force_gravity) / mass_total
+
+    return angle, total_velocity, force_thrust, force_drag, force_gravity, temperature, pressure, density
+
+
+@njit()
+def dopri_step(flight, stage: int, gravity, drag, isa, time: float, h: float, state: np.ndarray, k: np.ndarray,
+               ignition_time: float, coast: bool, left_tower: bool) -> tuple:
+    """
+    :param k: Stage derivatives, k[0] must contain the derivative at the start of the step
+    :return: 5th order state, the error estimate and the diagnostics at time + h
+    """
+    temp = np.empty(4)
+    temp[:] = state + h * a21 * k[0]
+    derivatives(flight, stage, gravity, drag, isa, time + c2 * h, time, temp, k[1], ignition_time, coast, left_tower)
+    temp[:] = state + h * (a31 * k[0] + a32 * k[1])
+    derivatives(flight, stage, gravity, drag, isa, time + c3 * h, time, temp, k[2], ignition_time, coast, left_tower)
+    temp[:] = state + h * (a41 * k[0] + a42 * k[1] + a43 * k[2])
+    derivatives(flight, stage, gravity, drag, isa, time + c4 * h, time, temp, k[3], ignition_time, coast, left_tower)
+    temp[:] = state + h * (a51 * k[0] + a52 * k[1] + a53 * k[2] + a54 * k[3])
+    derivatives(flight, stage, gravity, drag, isa, time + c5 * h, time, temp, k[4], ignition_time, coast, left_tower)
+    temp[:] = state + h * (a61 * k[0] + a62 * k[1] + a63 * k[2] + a64 * k[3] + a65 * k[4])
+    derivatives(flight, stage, gravity, drag, isa, time + h, time, temp, k[5], ignition_time, coast, left_tower)
+
+    new_state = state + h * (b1 * k[0] + b3 * k[2] + b4 * k[3] + b5 * k[4] + b6 * k[5])
+    diagnostics = derivatives(flight, stage, gravity, drag, isa, time + h, time, new_state, k[6], ignition_time, coast, left_tower)
+    error = h * (e1 * k[0] + e3 * k[2] + e4 * k[3] + e5 * k[4] + e6 * k[5] + e7 * k[6])
+
+    return new_state, error, diagnostics
+
+
+@njit()
+def event_value(state: np.ndarray, event: int) -> float:
+    """
+    :param event: 0 apogee, 1 ground, 2 leaving the launch tower
+    :return: Value that crosses zero from positive to negative at the event
+    """
+    if event == 0:
+        return state[3]
+    elif event == 1:
+        return state[1]
+    else:
+        return 40 - np.sqrt(state[2] ** 2 + state[3] ** 2)
+
+
+@njit()
+def run_adaptive(flight, stage: int, gravity, drag, isa, dt: float = 0.1, start_time: float = 0, end_time: float = 1000, coast: bool = False,
+                 delay: float = 0, chunk: int = 10000, relative_tolerance: float = 1E-8, absolute_tolerance: float = 1E-6):
+    """
+    Embedded Runge-Kutta (Dormand-Prince 5(4)) version of run with error control. Ignition, burnout and end_time are
+    integrated up to exactly, leaving the tower, apogee and ground impact are located with an Illinois root finder on
+    the step size.
+    :param dt: Size of the first step [s]
+    """
+    ignition_time: float = start_time + delay
+    burnout_time: float = ignition_time + flight.burn_time
+    time: float = start_time
+    state = np.array((flight.locations[0][0], flight.locations[0][1], flight.velocities[0][0], flight.velocities[0][1]))
+    left_tower: bool = event_value(state, 2) < 0
+    k = np.zeros((7, 4))
+    evaluations: int = 0
+
+    diagnostics = derivatives(flight, stage, gravity, drag, isa, time, time, state, k[0], ignition_time, coast, left_tower)
+    evaluations += 1
+    record_step(flight, 0, time, state, k[0], diagnostics)
+    steps: int = 1
+
+    h: float = dt
+    minimum_step: float = 1E-9 * max(1.0, abs(end_time))
+    while time < end_time and state[3] >= 0 and state[1] >= 0:
+        # Never step over a change in the engine phase
+        next_event = end_time
+        if not coast:
+            if time < ignition_time < next_event:
+                next_event = ignition_time
+            elif time < burnout_time < next_event:
+                next_event = burnout_time
+        h = min(h, next_event - time)
+
+        new_state, error, diagnostics = dopri_step(flight, stage, gravity, drag, isa, time, h, state, k, ignition_time, coast, left_tower)
+        evaluations += 6
+
+        scale = absolute_tolerance + relative_tolerance * np.maximum(np.abs(state), np.abs(new_state))
+        error_norm = np.sqrt(np.mean((error / scale) ** 2))
+
+        if error_norm > 1 and h > minimum_step:  # Reject and retry with a smaller step
+            h *= max(0.2, 0.9 * error_norm ** -0.2)
+            continue
+
+        # Locate the first event within this step, apogee and ground end the flight
+        event: int = -1
+        for candidate in (2, 0, 1):
+            if (candidate != 2 or not left_tower) and event_value(new_state, candidate) < 0 <= event_value(state, candidate):
+                event = candidate
+                break
+
+        if event >= 0:
+            h_low, value_low = 0.0, event_value(state, event)
+            h_high, value_high = h, event_value(new_state, event)
+            h_root: float = h
+            side: int = 0
+            for _ in range(50):
+                h_root = (h_low * value_high - h_high * value_low) / (value_high - value_low)
+                new_state, _, diagnostics = dopri_step(flight, stage, gravity, drag, isa, time, h_root, state, k, ignition_time, coast, left_tower)
+                evaluations += 6
+                value = event_value(new_state, event)
+                if abs(value) < 1E-9 or h_high - h_low < 1E-9:
+                    break
+                if value > 0:
+                    h_low, value_low = h_root, value
+                    if side == -1:
+                        value_high *= 0.5
+                    side = -1
+                else:
+                    h_high, value_high = h_root, value
+                    if side == 1:
+                        value_low *= 0.5
+                    side = 1
+            h = h_root
+
+        landed: bool = h == next_event - time
+        time = next_event if landed else time + h
+        state = new_state
+        k[0] = k[6]  # First same as last
+
+        # The last derivative is not valid anymore after leaving the tower or in a new engine phase
+        if event == 2:
+            left_tower = True
+            diagnostics = derivatives(flight, stage, gravity, drag, isa, time, time, state, k[0], ignition_time, coast, left_tower)
+            evaluations += 1
+        elif landed and next_event < end_time:
+            diagnostics = derivatives(flight, stage, gravity, drag, isa, time, time, state, k[0], ignition_time, coast, left_tower)
+            evaluations += 1
+
+        if steps >= flight.time.shape[0]:  # Buffers too small for the next step
+            flight.grow(chunk)
+        record_step(flight, steps, time, state, k[0], diagnostics)
+        steps += 1
+
+        if event == 0 or event == 1:  # Apogee or ground reached
+            break
+
+        h *= min(5.0, max(0.2, 0.9 * max(error_norm, 1E-10) ** -0.2))
+
+    flight.steps = steps
+    flight.evaluations = evaluations
+
+
+@njit()
+def record_step(flight, i: int, time: float, state: np.ndarray, derivative: np.ndarray, diagnostics: tuple):
+    angle, total_velocity, force_thrust, force_drag, force_gravity, temperature, pressure, density = diagnostics
+
+    flight.time[i] = time
+    flight.locations[i][0], flight.locations[i][1] = state[0], state[1]
+    flight.velocities[i][0], flight.velocities[i][1] = state[2], state[3]
+    flight.accelerations[i][0], flight.accelerations[i][1] = derivative[2], derivative[3]
+    flight.angles[i] = angle
+    flight.total_velocities[i][0], flight.total_velocities[i][1] = total_velocity, total_velocity
+
+    flight.temperature[i], flight.pressure[i], flight.density[i] = temperature, pressure, density
+    flight.speed_of_sound[i] = np.sqrt(1.4 * 287 * temperature)
+
+    flight.force_drag[i] = force_drag
+    flight.force_thrust[i] = force_thrust
+    flight.force_gravity[i] = force_gravity
+
 
 if __name__ == '__main__':
     pass
@@ -0,0 +1,235 @@
+import numpy as np
+from numba import njit
+
+try:
+    from simulators.advanced.dynamics import euler_step
+except ModuleNotFoundError:  # Run as a script from the simulators directory
+    from advanced.dynamics import euler_step
+
+
+# Columns of the trajectory buffer
+trajectory_columns: list = ["time", "x", "y", "vx", "vy", "ax", "ay", "angle", "speed_of_sound", "density",
+                            "force_drag", "force_gravity", "force_thrust", "stage"]
+time_column, x_column, y_column, vx_column, vy_column, ax_column, ay_column, angle_column = 0, 1, 2, 3, 4, 5, 6, 7
+speed_of_sound_column, density_column, drag_column, gravity_column, thrust_column, stage_column = 8, 9, 10, 11, 12, 13
+column_count: int = len(trajectory_columns)
+
+# Running reductions of run_mission_summary, per phase the highest altitude, vertical velocity and speed of sound
+summary_names: list = ["apogee_1", "max_velocity_tot", "min_speed_of_sound_tot", "apogee", "max_velocity2",
+                       "min_speed_of_sound2"]
+summary_count: int = len(summary_names)
+
+# Event table, one row per event with [event, kind, value]
+mission_events: list = ["launch", "engine1_ignition", "separation", "engine2_ignition"]
+event_kinds: list = ["exact", "delay"]
+
+
+def encode_mission(mission_profile: dict) -> np.ndarray:
+    """
+    :param mission_profile: Mission profile from the run parameters
+    :return: Event table for run_mission
+    The delay of an event is relative to the previous event, for the separation that is the burnout of engine 1.
+    """
+    events = np.zeros((len(mission_events), 3))
+    for i, event in enumerate(mission_events):
+        kind, value = next(iter(mission_profile[event].items()))
+        if kind not in event_kinds:
+            raise ValueError(f"Event type '{kind}' of '{event}' not recognised, use 'exact' or 'delay'")
+        events[i] = (i, event_kinds.index(kind), value)
+
+    return events
+
+
+@njit()
+def event_delay(events: np.ndarray, event: int, previous_time: float) -> float:
+    """
+    :param events: Event table of encode_mission
+    :param event: Row of the event
+    :param previous_time: Time of the event that a delay is relative to [s]
+    :return: Time between the previous event and this event [s]
+    """
+    if events[event, 1] == 0:  # Exact
+        return events[event, 2] - previous_time
+    return events[event, 2]
+
+
+@njit()
+def grow(trajectory: np.ndarray, chunk: int) -> np.ndarray:
+    new_trajectory = np.zeros((trajectory.shape[0] + chunk, trajectory.shape[1]))
+    new_trajectory[:trajectory.shape[0]] = trajectory
+    return new_trajectory
+
+
+@njit()
+def run_phase(flight, stage: int, gravity, drag, isa, trajectory: np.ndarray, row: int, dt: float, start_time: float,
+              end_time: float, delay: float, chunk: int):
+    """
+    :param trajectory: Trajectory buffer, the row of the initial state already holds the time, location, velocity and
+    angle
+    :param row: Row of the initial state of the phase
+    :return: Trajectory buffer, which is a new array if it had to grow, and the row of the last state of the phase
+    Same explicit Euler step as dynamics.run, recorded in the trajectory buffer.
+    """
+    mass_rocket: float = flight.mass[0]
+    mass_total: float = mass_rocket + flight.fuel_mass_curve[0]
+
+    left_tower: bool = False
+
+    delay_i: int = 0
+    last_row: int = row
+    trajectory[row, stage_column] = stage
+
+    state = np.zeros(8)  # State of dynamics.euler_step, the speed of the previous state starts at zero
+    state[:7] = trajectory[row, x_column:angle_column + 1]
+
+    for i, time in enumerate(np.linspace(start_time, end_time, int((end_time - start_time) / dt))):
+        r = row + i
+        if state[3] >= 0 and state[1] >= 0:  # Stop at apogee or the ground
+            if r + 1 >= trajectory.shape[0]:  # Buffer too small for the next step
+                trajectory = grow(trajectory, chunk)
+
+            mass_total, delay_i, left_tower, _, temperature, _, density, force_thrust, force_drag, force_gravity = \
+                euler_step(flight, stage, gravity, drag, isa, state, time, dt, start_time, delay, mass_rocket, mass_total,
+                           delay_i, left_tower)
+
+            trajectory[r, density_column] = density
+            trajectory[r, speed_of_sound_column] = np.sqrt(1.4 * 287 * temperature)
+            trajectory[r, drag_column] = force_drag
+            trajectory[r, thrust_column] = force_thrust
+            trajectory[r, gravity_column] = force_gravity
+
+            trajectory[r + 1, x_column:angle_column + 1] = state[:7]
+            trajectory[r + 1, time_column] = time
+            trajectory[r + 1, stage_column] = stage
+            last_row = r + 1
+
+        else:
+            break
+
+    return trajectory, last_row
+
+
+@njit(nogil=True)  # Lets the engine sizing overlap with other sizers in threads
+def run_mission(total, stage2, gravity, drag, isa, events: np.ndarray, boost: np.ndarray, dt: float = 0.1,
+                end_time: float = 1000, size: int = 10000, chunk: int = 10000):
+    """
+    :param total: FlightData class of the complete rocket, only the rocket parameters and mass[0] are used
+    :param stage2: FlightData class of the 2nd stage
+    :param events: Event table of encode_mission
+    :param boost: Trajectory rows of an earlier boost phase that is reused, empty to simulate the boost phase
+    :param end_time: Latest end of the 2nd stage flight [s]
+    :param size: Initial number of rows of the trajectory buffer
+    :return: Trajectory with a row per recorded state, and the first row of every phase plus the number of rows
+    Runs the boost phase of the complete rocket and the 2nd stage up to apogee in one call. The separation state is the
+    last row of the boost phase and the first row of the 2nd stage, like the separate flight data of both stages.
+    """
+    trajectory = np.zeros((max(size, boost.shape[0] + 2), column_count))
+
+    launch_time = event_delay(events, 0, 0.0)
+    ignition1_delay = event_delay(events, 1, launch_time)
+    separation_time = launch_time + ignition1_delay + total.burn_time
+    separation_time += event_delay(events, 2, separation_time)
+
+    # Boost Phase
+    if boost.shape[0] > 0:
+        trajectory[:boost.shape[0]] = boost
+        last_row = boost.shape[0] - 1
+    else:
+        trajectory[0, time_column] = launch_time
+        trajectory[0, angle_column] = total.angles[0]
+        trajectory, last_row = run_phase(total, 0, gravity, drag, isa, trajectory, 0, dt, launch_time, separation_time,
+                                         ignition1_delay, chunk)
+
+    # Separation Phase
+    row = last_row + 1
+    if row + 1 >= trajectory.shape[0]:
+        trajectory = grow(trajectory, chunk)
+    for column in (time_column, x_column, y_column, vx_column, vy_column, angle_column):
+        trajectory[row, column] = trajectory[last_row, column]
+
+    # 2nd stage until apogee
+    start_time = trajectory[row, time_column]
+    trajectory, last_row = run_phase(stage2, 2, gravity, drag, isa, trajectory, row, dt, start_time, end_time,
+                                     event_delay(events, 3, start_time), chunk)
+
+    phase_starts = np.array([0, row, last_row + 1])
+    return trajectory[:last_row + 1], phase_starts
+
+
+@njit()
+def run_phase_summary(flight, stage: int, gravity, drag, isa, state: np.ndarray, summary: np.ndarray, dt: float,
+                      start_time: float, end_time: float, delay: float):
+    """
+    :param state: Trajectory row of the initial state, updated to the last state of the phase
+    :param summary: Highest altitude, vertical velocity and speed of sound of the phase, updated during the phase
+    Same step as run_phase with only the current and the next state, so nothing is recorded.
+    """
+    mass_rocket: float = flight.mass[0]
+    mass_total: float = mass_rocket + flight.fuel_mass_curve[0]
+
+    left_tower: bool = False
+
+    delay_i: int = 0
+    summary[0] = max(summary[0], state[y_column])
+    summary[1] = max(summary[1], state[vy_column])
+
+    euler_state = np.zeros(8)  # State of dynamics.euler_step, the speed of the previous state starts at zero
+    euler_state[:7] = state[x_column:angle_column + 1]
+
+    for time in np.linspace(start_time, end_time, int((end_time - start_time) / dt)):
+        if euler_state[3] >= 0 and euler_state[1] >= 0:  # Stop at apogee or the ground
+            mass_total, delay_i, left_tower, _, temperature, _, _, _, _, _ = \
+                euler_step(flight, stage, gravity, drag, isa, euler_state, time, dt, start_time, delay, mass_rocket,
+                           mass_total, delay_i, left_tower)
+
+            summary[2] = max(summary[2], np.sqrt(1.4 * 287 * temperature))
+            summary[0] = max(summary[0], euler_state[1])
+            summary[1] = max(summary[1], euler_state[3])
+            state[time_column] = time
+
+        else:
+            break
+
+    state[x_column:angle_column + 1] = euler_state[:7]
+
+
+@njit(nogil=True)
+def run_mission_summary(total, stage2, gravity, drag, isa, events: np.ndarray, separation: np.ndarray,
+                        boost_summary: np.ndarray, dt: float = 0.1, end_time: float = 1000):
+    """
+    :param separation: Trajectory row of the separation state of an earlier boost phase that is reused, empty to
+    simulate the boost phase
+    :param boost_summary: Summary of the reused boost phase, the first three values of summary_names
+    :return: Summary with the values of summary_names, and the trajectory row of the separation state
+    Summary only version of run_mission, the maxima are kept as running reductions instead of being taken from the
+    trajectory afterwards. Gives the same values as the full recording.
+    """
+    summary = np.zeros(summary_count)
+
+    launch_time = event_delay(events, 0, 0.0)
+    ignition1_delay = event_delay(events, 1, launch_time)
+    separation_time = launch_time + ignition1_delay + total.burn_time
+    separation_time += event_delay(events, 2, separation_time)
+
+    # Boost Phase
+    state = np.zeros(column_count)
+    if separation.shape[0] > 0:
+        state[:] = separation
+        summary[:3] = boost_summary
+    else:
+        state[time_column] = launch_time
+        state[angle_column] = total.angles[0]
+        run_phase_summary(total, 0, gravity, drag, isa, state, summary[:3], dt, launch_time, separation_time,
+                          ignition1_delay)
+    separation_state = state.copy()
+
+    # Separation Phase, the accelerations start at zero like a new trajectory row
+    for column in (ax_column, ay_column):
+        state[column] = 0
+
+    # 2nd stage until apogee
+    start_time = state[time_column]
+    run_phase_summary(stage2, 2, gravity, drag, isa, state, summary[3:], dt, start_time, end_time,
+                      event_delay(events, 3, start_time))
+
+    return summary, separation_state
@@ -0,0 +1,190 @@
+import numpy as np
+from numba import get_num_threads, njit, prange, set_num_threads
+
+from simulators.advanced.dynamics import euler_step
+
+
+# Dispersed inputs with their nominal value, launch angle in [deg] from the vertical and wind in [m/s]
+nominal_values: dict = {"thrust_scale": 1.0, "drag_scale": 1.0, "mass_scale": 1.0, "launch_angle": 7.0, "wind": 0.0}
+result_names: list = ["apogee", "max_velocity", "max_mach", "impact_distance"]
+
+
+def draw(distribution: dict, generator: np.random.Generator) -> float:
+    """
+    :param distribution: Dictionary with one item, {"exact": value}, {"normal": [mean, std]} or {"uniform": [low, high]}
+    :param generator: Random number generator of the sample
+    :return: Drawn value
+    """
+    kind, parameters = next(iter(distribution.items()))
+    if kind == "exact":
+        return float(parameters)
+    elif kind == "normal":
+        return generator.normal(parameters[0], parameters[1])
+    elif kind == "uniform":
+        return generator.uniform(parameters[0], parameters[1])
+    else:
+        raise ValueError(f"Distribution '{kind}' not recognised, use 'exact', 'normal' or 'uniform'")
+
+
+def draw_samples(distributions: dict, samples: int, seed: int) -> dict:
+    """
+    :param distributions: Distribution per dispersed input, missing inputs keep their nominal value
+    :param samples: Number of samples
+    :param seed: Seed of the dispersion
+    :return: Array of drawn values per dispersed input
+    Every sample has its own generator seeded with (seed, sample number), so a sample does not depend on the number of
+    samples or on the order in which they are drawn.
+    """
+    for name in distributions:
+        if name not in nominal_values:
+            raise KeyError(f"Dispersed input '{name}' not recognised, use one of {list(nominal_values)}")
+
+    values: dict = {name: np.zeros(samples) for name in nominal_values}
+    for i in range(samples):
+        generator = np.random.default_rng([seed, i])
+        for name, nominal in nominal_values.items():
+            values[name][i] = draw(distributions.get(name, {"exact": nominal}), generator)
+
+    return values
+
+
+def statistics(values: np.ndarray) -> dict:
+    """
+    :param values: Results of all samples, NaN for samples without a result
+    :return: Dictionary with the summary statistics
+    """
+    valid = values[~np.isnan(values)]
+    if valid.size == 0:
+        return {"count": 0}
+
+    return {"count": int(valid.size), "mean": float(np.mean(valid)), "std": float(np.std(valid)),
+            "min": float(np.min(valid)), "max": float(np.max(valid)),
+            "p5": float(np.percentile(valid, 5)), "p50": float(np.percentile(valid, 50)),
+            "p95": float(np.percentile(valid, 95))}
+
+
+@njit()
+def fly_phase(flight, stage: int, gravity, drag, isa, state: np.ndarray, results: np.ndarray, dt: float, start_time: float,
+              end_time: float, delay: float, stop_at_apogee: bool, thrust_scale: float, drag_scale: float, mass_scale: float,
+              wind: float):
+    """
+    :param state: Time, location and velocity x/y and angle, updated to the last step of the phase
+    :param results: Apogee, maximum speed, maximum Mach number and impact distance, updated during the phase
+    :param stop_at_apogee: Stop at apogee, otherwise the phase continues to the ground
+    :param thrust_scale: Factor on the thrust curve [-]
+    :param drag_scale: Factor on the drag force [-]
+    :param mass_scale: Factor on the mass without the propellant of this phase [-]
+    :param wind: Horizontal wind speed in the direction of flight [m/s]
+    Single member version of dynamics.run with dispersed inputs. The rocket points into the airspeed vector after
+    leaving the tower, without wind and scaling this is the same trajectory as dynamics.run.
+    """
+    mass_rocket: float = flight.mass[0] * mass_scale
+    mass_total: float = mass_rocket + flight.fuel_mass_curve[0]
+
+    time: float = state[0]
+    euler_state = np.zeros(8)  # State of dynamics.euler_step, the acceleration and airspeed start at zero
+    euler_state[:4] = state[1:5]
+    euler_state[6] = state[5]
+    left_tower: bool = False
+    delay_i: int = 0
+
+    samples: int = int((end_time - start_time) / dt)
+    spacing: float = (end_time - start_time) / (samples - 1) if samples > 1 else 0.0
+
+    for i in range(samples):
+        if euler_state[1] < 0 or (stop_at_apogee and euler_state[3] < 0):
+            break
+
+        step_time: float = start_time + i * spacing
+        if i == samples - 1 and i > 0:  # The time grid ends exactly at the end time
+            step_time = end_time
+
+        last_x, last_y, last_vy = euler_state[0], euler_state[1], euler_state[3]
+        mass_total, delay_i, left_tower, speed, temperature, _, _, _, _, _ = \
+            euler_step(flight, stage, gravity, drag, isa, euler_state, step_time, dt, start_time, delay, mass_rocket,
+                       mass_total, delay_i, left_tower, False, thrust_scale, drag_scale, wind)
+
+        if last_vy >= 0:  # Flight values of the ascent
+            speed_of_sound: float = np.sqrt(1.4 * 287 * temperature)
+            results[1] = max(results[1], speed)
+            if speed_of_sound > 0:
+                results[2] = max(results[2], euler_state[7] / speed_of_sound)
+
+        time = step_time
+        x, y = euler_state[0], euler_state[1]
+        results[0] = max(results[0], y)
+        if y < 0 <= last_y:  # Impact, interpolated between the last two steps
+            results[3] = last_x + (x - last_x) * last_y / (last_y - y)
+
+    state[0] = time
+    state[1:5] = euler_state[:4]
+    state[5] = euler_state[6]
+
+
+@njit(parallel=True)
+def run_dispersion(total, stage2, gravity, drag, isa, thrust_scale: np.ndarray, drag_scale: np.ndarray,
+                   mass_scale: np.ndarray, launch_angle: np.ndarray, wind: np.ndarray, dt: float = 0.1,
+                   separation_delay: float = 0, ignition_delay: float = 0, end_time: float = 1000) -> np.ndarray:
+    """
+    :param total: FlightData class of the boost phase of the nominal rocket
+    :param stage2: FlightData class of the 2nd stage of the nominal rocket
+    :param launch_angle: Launch angle of every sample (N,) [rad]
+    :param wind: Horizontal wind speed of every sample (N,) [m/s]
+    :return: Apogee, maximum speed, maximum Mach number and impact distance of every sample (N, 4), the impact
+    distance is NaN if the 2nd stage did not reach the ground before end_time
+    Flies the complete mission of every sample: boost, separation, 2nd stage to apogee and a ballistic descent. The
+    samples are independent, so they are spread over all threads.
+    """
+    members: int = thrust_scale.shape[0]
+    results = np.zeros((members, 4))
+
+    for j in prange(members):
+        state = np.zeros(6)
+        state[5] = launch_angle[j]
+        member = np.zeros(4)
+        member[3] = np.nan
+
+        # Boost Phase
+        fly_phase(total, 0, gravity, drag, isa, state, member, dt, 0.0, total.burn_time + separation_delay, 0.0, True,
+                  thrust_scale[j], drag_scale[j], mass_scale[j], wind[j])
+
+        # 2nd stage up to apogee and back to the ground
+        fly_phase(stage2, 2, gravity, drag, isa, state, member, dt, state[0], end_time, ignition_delay, False,
+                  thrust_scale[j], drag_scale[j], mass_scale[j], wind[j])
+
+        results[j] = member
+
+    return results
+
+
+def run(rocket, distributions: dict, samples: int, seed: int = 0, threads: int = 0) -> dict:
+    """
+    :param rocket: Nominal Rocket class, with updated values
+    :param distributions: Distribution per dispersed input, see nominal_values
+    :param samples: Number of samples
+    :param seed: Seed of the dispersion
+    :param threads: Number of threads, 0 uses all cores
+    :return: Dictionary with the drawn inputs and results per sample ("samples") and their statistics ("statistics")
+    """
+    simulator = rocket.simulator
+    if simulator.mission_profile["stages"] != 2:
+        raise ModuleNotFoundError("Only 2-Stage rockets are supported atm")
+
+    inputs: dict = draw_samples(distributions, samples, seed)
+    stages: dict = simulator.build_stages(rocket, (1, 1, 1))
+
+    default_threads: int = get_num_threads()
+    if threads:
+        set_num_threads(threads)
+    try:
+        results = run_dispersion(stages["Total"], stages["Stage2"], simulator.gravity, simulator.drag, simulator.isa,
+                                 inputs["thrust_scale"], inputs["drag_scale"], inputs["mass_scale"],
+                                 np.deg2rad(inputs["launch_angle"]), inputs["wind"], dt=simulator.dt,
+                                 separation_delay=simulator.mission_profile["separation"]["delay"],
+                                 ignition_delay=simulator.mission_profile["engine2_ignition"]["delay"],
+                                 end_time=simulator.end_time)
+    finally:
+        set_num_threads(default_threads)
+
+    outputs: dict = {name: results[:, i] for i, name in enumerate(result_names)}
+    return {"samples": {**inputs, **outputs}, "statistics": {name: statistics(values) for name, values in outputs.items()}}
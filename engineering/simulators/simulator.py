@@ -1,6 +1,13 @@
 from numba import njit
 from numba.experimental import jitclass
 from numba import int32, float64
+from numba.typed import List
+try:
+    from simulators.advanced.mission import encode_mission, summary_names, trajectory_columns
+    from simulators.advanced.dynamics import run as euler_run
+except ModuleNotFoundError:  # Run as a script from the simulators directory, see the __main__ block
+    from advanced.mission import encode_mission, summary_names, trajectory_columns
+    from advanced.dynamics import run as euler_run
 import matplotlib.pyplot as plt
 import numpy as np
 import os
@@ -9,6 +16,8 @@ import json
 
 
 rocket_specs = [("max_iterations", int32),
+                ("steps", int32),
+                ("evaluations", int32),
                 ("time", float64[:]),
                 ("locations", float64[:, :]),
                 ("velocities", float64[:, :]),
@@ -34,6 +43,9 @@ rocket_specs = [("max_iterations", int32),
                 ("fin_mac2", float64),
                 ("fin_span1", float64),
                 ("fin_span2", float64),
+                ("mach_step", float64),
+                ("cd_pressure", float64[:]),
+                ("cd_friction", float64[:]),
                 ("thrust_curve", float64[:]),
                 ("fuel_mass_curve", float64[:]),
                 ("mmoi", float64[:]),
@@ -45,10 +57,35 @@ rocket_specs = [("max_iterations", int32),
                 ("force_thrust", float64[:]),
                 ("force_gravity", float64[:])]
 
+# Standard gravitational acceleration, used to estimate the flight duration [m/s^2]
+g0: float = 9.80665
+
+
+@njit()
+def extend_1d(array: np.ndarray, size: int) -> np.ndarray:
+    new_array = np.zeros(size, float64)
+    new_array[:array.shape[0]] = array
+    return new_array
+
+
+@njit()
+def extend_2d(array: np.ndarray, size: int) -> np.ndarray:
+    new_array = np.zeros((size, array.shape[1]), float64)
+    new_array[:array.shape[0]] = array
+    return new_array
+
+
+# Flight data that is kept after trimming the boost phase, and therefore stored in the boost checkpoint
+checkpoint_fields: list = ["time", "angles", "locations", "velocities", "speed_of_sound", "accelerations",
+                           "force_drag", "force_gravity", "force_thrust", "density"]
+
 
 @jitclass(rocket_specs)
 class FlightData:
     def __init__(self, max_iterations: int):
+        self.steps: int32 = 0  # Number of recorded time steps, set by the dynamics
+        self.evaluations: int32 = 0  # Number of force evaluations, set by the dynamics
+
         # Dynamics
         self.time: np.array = np.zeros(max_iterations, float64)
         self.locations: np.array = np.zeros((max_iterations, 2), float64)
@@ -85,6 +122,11 @@ class FlightData:
         self.fin_span1: float64 = 0
         self.fin_span2: float64 = 0
 
+        # Drag tables, filled by aerodynamics.build_drag_table when the table drag model is used
+        self.mach_step: float64 = 0
+        self.cd_pressure: np.array = np.zeros(0, float64)  # Pressure drag coefficient per Mach step
+        self.cd_friction: np.array = np.zeros(0, float64)  # Friction drag coefficient at 1 m/s per Mach step
+
         # Engine
         self.thrust_curve: np.array = np.zeros(max_iterations, float64)  # Thrust curve
         self.fuel_mass_curve: np.array = np.zeros(max_iterations, float64)  # Total Engine mass over time
@@ -101,33 +143,79 @@ class FlightData:
         self.force_thrust: np.array = np.zeros(max_iterations, float64)
         self.force_gravity: np.array = np.zeros(max_iterations, float64)
 
+    def grow(self, extra: int):
+        """
+        :param extra: Number of time steps added to all the time-dependent buffers
+        """
+        size = self.time.shape[0] + extra
+
+        self.time = extend_1d(self.time, size)
+        self.locations = extend_2d(self.locations, size)
+        self.velocities = extend_2d(self.velocities, size)
+        self.accelerations = extend_2d(self.accelerations, size)
+        self.angles = extend_1d(self.angles, size)
+
+        self.total_velocities = extend_2d(self.total_velocities, size)
+        self.speed_of_sound = extend_1d(self.speed_of_sound, size)
+        self.mass = extend_1d(self.mass, size)
+
+        self.pressure = extend_1d(self.pressure, size)
+        self.temperature = extend_1d(self.temperature, size)
+        self.density = extend_1d(self.density, size)
+
+        self.force_drag = extend_1d(self.force_drag, size)
+        self.force_thrust = extend_1d(self.force_thrust, size)
+        self.force_gravity = extend_1d(self.force_gravity, size)
+
 
 class Simulator:
-    def __init__(self, mission_profile: dict, simulator_parameters: dict, dynamics_run, gravity, drag, isa):
+    def __init__(self, mission_profile: dict, simulator_parameters: dict, dynamics_run, gravity, drag, isa, batch_run=None,
+                 drag_table=None, mission_run=None, mission_summary_run=None):
         self.dt: float64 = simulator_parameters["dt"]  # [s]
         self.maximum_iterations = int(simulator_parameters["maximum_iterations"])
+        self.end_time: float = float(simulator_parameters.get("end_time", 1000))  # Latest end of the 2nd stage flight [s]
+
+        # Buffers sized from the expected flight duration instead of the maximum amount of iterations
+        self.right_size_buffers: bool = simulator_parameters.get("right_size_buffers", False)
+        self.buffer_chunk: int = int(simulator_parameters.get("buffer_chunk", 10000))  # Growth when the estimate is too small
 
         # Functions
         self.dynamics_run = dynamics_run
+        self.integrator_options: dict = simulator_parameters.get("integrator_options", {})  # Extra arguments of dynamics_run
+        self.batch_run = batch_run  # Lock-step dynamics of many designs, used by run_batch
+        self.drag_table = drag_table  # Fills the drag tables of the flight data, needed by table based drag functions
+        self.drag_tables: dict = {}  # Drag tables per stage configuration and geometry
+
+        # Whole mission in one compiled call, used instead of dynamics_run when "mission_kernel" is set
+        self.mission_run = mission_run
+        self.use_mission_kernel: bool = simulator_parameters.get("mission_kernel", False)
+        if self.use_mission_kernel and dynamics_run is not euler_run:
+            raise ValueError("The mission kernel only integrates with the fixed step Euler method, select the \"euler\" "
+                             "integrator or switch \"mission_kernel\" off")
+        self.trajectory_size: int = 0  # Initial number of rows of the trajectory buffer
+        self.trajectory: np.array = np.zeros((0, len(trajectory_columns)), dtype=float)  # A row per recorded state
+        self.phase_starts: np.array = np.zeros(0, dtype=int)  # First row of the Total and Stage2 phase, and the row count
+        self.mission_summary_run = mission_summary_run  # Mission kernel without recording, used by run(summary_only=True)
         self.gravity = gravity
         self.drag = drag
         self.isa = isa
 
-        # Curves (Total Stage to 2nd Stage after separation)
-        self.times: np.array = np.zeros(self.maximum_iterations, dtype=float)  # List with all th time stamps
-        self.angles: np.array = np.zeros(self.maximum_iterations, dtype=float)
+        # Curves (Total Stage to 2nd Stage after separation), filled by combine_lists
+        curve_size: int = 0 if self.right_size_buffers else self.maximum_iterations
+        self.times: np.array = np.zeros(curve_size, dtype=float)  # List with all th time stamps
+        self.angles: np.array = np.zeros(curve_size, dtype=float)
 
-        self.ground_distance: np.array = np.zeros(self.maximum_iterations, dtype=float)
-        self.altitudes: np.array = np.zeros(self.maximum_iterations, dtype=float)
-        self.velocities: np.array = np.zeros(self.maximum_iterations, dtype=float)
-        self.accelerations: np.array = np.zeros(self.maximum_iterations, dtype=float)
-        self.speed_of_sound: np.array = np.zeros(self.maximum_iterations, dtype=float)
+        self.ground_distance: np.array = np.zeros(curve_size, dtype=float)
+        self.altitudes: np.array = np.zeros(curve_size, dtype=float)
+        self.velocities: np.array = np.zeros(curve_size, dtype=float)
+        self.accelerations: np.array = np.zeros(curve_size, dtype=float)
+        self.speed_of_sound: np.array = np.zeros(curve_size, dtype=float)
 
-        self.forces_drag: np.array = np.zeros(self.maximum_iterations, dtype=float)
-        self.force_gravity: np.array = np.zeros(self.maximum_iterations, dtype=float)
-        self.force_thrust: np.array = np.zeros(self.maximum_iterations, dtype=float)
+        self.forces_drag: np.array = np.zeros(curve_size, dtype=float)
+        self.force_gravity: np.array = np.zeros(curve_size, dtype=float)
+        self.force_thrust: np.array = np.zeros(curve_size, dtype=float)
 
-        self.density: np.array = np.zeros(self.maximum_iterations, dtype=float)
+        self.density: np.array = np.zeros(curve_size, dtype=float)
 
         # Values
         self.apogee: float = 0
@@ -146,14 +234,35 @@ class Simulator:
         self.mission_profile: dict = mission_profile
         self.run_parameters: dict = simulator_parameters
 
-    def run(self):
-        if self.mission_profile["stages"] == 2:
+        # Boost phase checkpoint, reused as long as the Stage 1 / booster inputs do not change
+        self.use_checkpoint: bool = simulator_parameters.get("boost_checkpoint", False)
+        self.checkpoint_tolerance: float = simulator_parameters.get("checkpoint_mass_tolerance", 0)  # Relative [-]
+        self.boost_checkpoint: dict = {}
+        self.checkpoint_hits: int = 0
+        self.approximate_boost: bool = False  # True if the last boost phase was reused for a different lift-off mass
+
+    def run(self, summary_only: bool = False):
+        """
+        :param summary_only: Only calculate the summary values, like the apogee, without recording the trajectory. Only
+        used with the mission kernel, otherwise the trajectory is always recorded.
+        """
+        if self.mission_profile["stages"] == 2 and self.use_mission_kernel and summary_only:
+            self.run_mission_summary()
+
+        elif self.mission_profile["stages"] == 2 and self.use_mission_kernel:
+            self.run_mission()
+
+        elif self.mission_profile["stages"] == 2:
             # ToDo: Launch Tower
 
             # Boost Phase
             end_time = self.stages["Total"].burn_time + self.mission_profile["separation"]["delay"]
-            self.dynamics_run(self.stages["Total"], 0, self.gravity, self.drag, self.isa, end_time=end_time, dt=self.dt)
-            self.trim_lists(self.stages["Total"])
+            self.approximate_boost = False
+            if not self.load_boost_checkpoint(end_time):
+                self.dynamics_run(self.stages["Total"], 0, self.gravity, self.drag, self.isa, end_time=end_time, dt=self.dt,
+                                  chunk=self.buffer_chunk, **self.integrator_options)
+                self.trim_lists(self.stages["Total"])
+                self.save_boost_checkpoint(end_time)
 
             # Separation Phase
             start_time = self.stages["Total"].time[-1]
@@ -163,7 +272,9 @@ class Simulator:
             self.stages["Stage2"].velocities[0] = self.stages["Total"].velocities[-1]
             self.stages["Stage2"].angles[0] = self.stages["Total"].angles[-1]
 
-            self.dynamics_run(self.stages["Stage2"], 2, self.gravity, self.drag, self.isa, start_time=start_time, dt=self.dt, delay=self.mission_profile["engine2_ignition"]["delay"])
+            self.dynamics_run(self.stages["Stage2"], 2, self.gravity, self.drag, self.isa, start_time=start_time,
+                              end_time=self.end_time, dt=self.dt, delay=self.mission_profile["engine2_ignition"]["delay"],
+                              chunk=self.buffer_chunk, **self.integrator_options)
             self.trim_lists(self.stages["Stage2"])
 
             self.update()
@@ -171,62 +282,305 @@ class Simulator:
         else:
             raise ModuleNotFoundError("Only 2-Stage rockets are supported atm")
 
+    def run_mission(self):
+        """
+        Runs all phases with the mission kernel, the trajectory is stored in one buffer with a column per value
+        """
+        if self.mission_run is None:
+            raise ValueError("Simulator was created without a mission kernel")
+
+        # Boost Phase, reused from the checkpoint when possible
+        end_time = self.stages["Total"].burn_time + self.mission_profile["separation"]["delay"]
+        self.approximate_boost = False
+        boost = np.zeros((0, len(trajectory_columns)), dtype=float)
+        if self.load_boost_checkpoint(end_time, rows=True):
+            boost = self.boost_checkpoint["rows"]
+
+        self.trajectory, self.phase_starts = self.mission_run(self.stages["Total"], self.stages["Stage2"], self.gravity,
+                                                              self.drag, self.isa, encode_mission(self.mission_profile),
+                                                              boost, dt=self.dt, end_time=self.end_time,
+                                                              size=self.trajectory_size, chunk=self.buffer_chunk)
+        if boost.shape[0] == 0:
+            self.save_boost_checkpoint(end_time, rows=self.trajectory[:self.phase_starts[1]].copy())
+
+        self.update()
+
+    def run_mission_summary(self):
+        """
+        Runs all phases with the summary only mission kernel, which sets the summary values without a trajectory
+        """
+        if self.mission_summary_run is None:
+            raise ValueError("Simulator was created without a summary mission kernel")
+
+        # Boost Phase, reused from the checkpoint when possible
+        end_time = self.stages["Total"].burn_time + self.mission_profile["separation"]["delay"]
+        self.approximate_boost = False
+        separation = np.zeros(0, dtype=float)
+        boost_summary = np.zeros(3, dtype=float)
+        if self.load_boost_checkpoint(end_time):
+            separation = self.boost_checkpoint["separation"]
+            boost_summary = self.boost_checkpoint["summary"]
+
+        summary, separation_state = self.mission_summary_run(self.stages["Total"], self.stages["Stage2"], self.gravity,
+                                                             self.drag, self.isa, encode_mission(self.mission_profile),
+                                                             separation, boost_summary, dt=self.dt, end_time=self.end_time)
+        if separation.shape[0] == 0:
+            self.save_boost_checkpoint(end_time, separation=separation_state, summary=summary[:3].copy())
+
+        # The trajectory of an earlier run does not belong to these values anymore
+        self.trajectory = np.zeros((0, len(trajectory_columns)), dtype=float)
+        self.phase_starts = np.zeros(0, dtype=int)
+
+        for name, value in zip(summary_names, summary):
+            self[name] = value
+        self.max_velocity1 = self.stages["Stage1"].velocities.transpose()[1].max()
+        self.min_speed_of_sound1 = self.stages["Stage1"].speed_of_sound.transpose().max()
+
+    def run_batch(self, rockets: list) -> dict:
+        """
+        :param rockets: List of Rocket classes, for example variants of one design
+        :return: Dictionary with an array per flight value, with the same names as the Simulator values
+        Simulates all rockets at once with the lock-step batch dynamics, only the summary values are kept.
+        """
+        if self.mission_profile["stages"] != 2:
+            raise ModuleNotFoundError("Only 2-Stage rockets are supported atm")
+        if self.batch_run is None:
+            raise ValueError("Simulator was created without batch dynamics")
+
+        totals = List()
+        stages2 = List()
+        for rocket in rockets:
+            stages: dict = self.build_stages(rocket, (1, 1, 1))  # The batch dynamics do not store the time history
+            totals.append(stages["Total"])
+            stages2.append(stages["Stage2"])
+        return self.run_batch_stages(totals, stages2)
+
+    def run_batch_stages(self, totals, stages2) -> dict:
+        """
+        :param totals: Typed list with the Total flight data of every design
+        :param stages2: Typed list with the Stage2 flight data of every design
+        :return: Dictionary with an array per flight value, see run_batch
+        """
+        members: int = len(totals)
+
+        # Boost Phase
+        locations = np.zeros((members, 2))
+        velocities = np.zeros((members, 2))
+        angles = np.array([total.angles[0] for total in totals])
+        start_times = np.zeros(members)
+        end_times = np.array([total.burn_time for total in totals]) + self.mission_profile["separation"]["delay"]
+        (times, locations, velocities, angles, apogee_1, max_velocity_tot, min_speed_of_sound_tot,
+         steps_tot) = self.batch_run(totals, 0, self.gravity, self.drag, self.isa, locations, velocities, angles, start_times,
+                                     end_times, dt=self.dt)
+
+        # Stage 2, starting from the separation state
+        (times, locations, velocities, angles, apogee, max_velocity2, min_speed_of_sound2,
+         steps2) = self.batch_run(stages2, 2, self.gravity, self.drag, self.isa, locations, velocities, angles, times,
+                                  np.full(members, self.end_time), dt=self.dt,
+                                  delay=self.mission_profile["engine2_ignition"]["delay"])
+
+        return {"apogee": apogee, "apogee_1": apogee_1, "max_velocity_tot": max_velocity_tot, "max_velocity2": max_velocity2,
+                "min_speed_of_sound_tot": min_speed_of_sound_tot, "min_speed_of_sound2": min_speed_of_sound2,
+                "steps": steps_tot + steps2}
+
+    def boost_key(self, end_time: float) -> tuple:
+        """
+        :param end_time: End time of the boost phase [s]
+        :return: All inputs of the boost phase, except for the lift-off mass
+        """
+        total: FlightData = self.stages["Total"]
+        return (self.use_mission_kernel, end_time, self.dt, total.angles[0], total.cd, total.diameter, total.diameter1, total.diameter2,
+                total.shoulder_length, total.fineness_ratio, total.joint_angle, total.reference_area,
+                total.wetted_area_body, total.wetted_area_fins1, total.wetted_area_fins2,
+                total.fin_thickness1, total.fin_thickness2, total.fin_mac1, total.fin_mac2,
+                total.fin_span1, total.fin_span2, total.burn_time,
+                hash(total.thrust_curve.tobytes()), hash(total.fuel_mass_curve.tobytes()))
+
+    def save_boost_checkpoint(self, end_time: float, rows: np.ndarray = None, separation: np.ndarray = None,
+                              summary: np.ndarray = None):
+        """
+        :param end_time: End time of the boost phase [s]
+        :param rows: Trajectory rows of the boost phase, when the mission kernel is used
+        :param separation: Trajectory row of the separation state, when the summary only mission kernel is used
+        :param summary: Boost phase values of the summary only mission kernel
+        Stores the trimmed boost phase, which includes the separation state, for the next run
+        """
+        if not self.use_checkpoint:
+            return
+
+        total: FlightData = self.stages["Total"]
+        if rows is not None:  # The summary only kernel can continue from the recorded boost phase as well
+            separation = rows[-1]
+            summary = np.array([rows[:, trajectory_columns.index(column)].max() for column in ("y", "vy", "speed_of_sound")])
+
+        mission_kernel: bool = rows is not None or separation is not None
+        data: dict = {} if mission_kernel else {field: np.copy(getattr(total, field)) for field in checkpoint_fields}
+        self.boost_checkpoint = {"key": self.boost_key(end_time), "mass": total.mass[0], "data": data, "rows": rows,
+                                 "separation": separation, "summary": summary}
+
+    def load_boost_checkpoint(self, end_time: float, rows: bool = False) -> bool:
+        """
+        :param end_time: End time of the boost phase [s]
+        :param rows: The trajectory rows of the boost phase are needed, which a summary only run does not store
+        :return: True if the boost phase was restored from the checkpoint
+        """
+        if not self.use_checkpoint or not self.boost_checkpoint:
+            return False
+        if rows and self.boost_checkpoint["rows"] is None:
+            return False
+
+        total: FlightData = self.stages["Total"]
+        if self.boost_checkpoint["key"] != self.boost_key(end_time):
+            return False
+        if abs(total.mass[0] - self.boost_checkpoint["mass"]) > self.checkpoint_tolerance * self.boost_checkpoint["mass"]:
+            return False
+
+        # The stored arrays are never changed in place, so they can be shared between runs
+        for field, data in self.boost_checkpoint["data"].items():
+            setattr(total, field, data)
+
+        self.approximate_boost = total.mass[0] != self.boost_checkpoint["mass"]
+        self.checkpoint_hits += 1
+        return True
+
+    def buffer_sizes(self, rocket) -> tuple[int, int, int]:
+        """
+        :param rocket: Rocket class
+        :return: Buffer lengths of the Total, Stage1 and Stage2 flight data
+        """
+        if not self.right_size_buffers:
+            return self.maximum_iterations, self.maximum_iterations, self.maximum_iterations
+
+        # Boost phase has a fixed duration
+        boost_time: float = rocket.stage1.engine.burn_time + self.mission_profile["separation"]["delay"]
+        total_size = int(boost_time / self.dt) + 2
+
+        # Sustain and coast until apogee, estimated from the last apogee or the ideal velocity gain of both stages
+        if self.apogee > 0:
+            coast_time = np.sqrt(2 * self.apogee / g0)
+        else:
+            delta_v: float = 0
+            for stage, mass in ((rocket.stage1, rocket.mass), (rocket.stage2, rocket.stage2.mass)):
+                if not mass > stage.engine.propellant_mass >= 0:  # Randomized values without a mass ratio, no estimate
+                    return total_size, 1, self.maximum_iterations
+                delta_v += stage.engine.isp * g0 * np.log(mass / (mass - stage.engine.propellant_mass))
+            coast_time = delta_v / g0
+        sustain_time: float = self.mission_profile["engine2_ignition"]["delay"] + rocket.stage2.engine.burn_time
+        stage2_size = int(1.1 * (sustain_time + coast_time) / self.dt) + 2
+
+        return total_size, 1, min(stage2_size, self.maximum_iterations)
+
     def create_stages(self, rocket, show_params=True):
+        sizes: tuple = self.buffer_sizes(rocket)
+        if self.use_mission_kernel:  # The mission kernel only uses the rocket parameters of the flight data
+            self.trajectory_size = min(sizes[0] + sizes[2], self.maximum_iterations)
+            sizes = (1, 1, 1)
+        self.stages = self.build_stages(rocket, sizes)
+
+    def build_stages(self, rocket, sizes: tuple[int, int, int]) -> dict:
+        """
+        :param rocket: Rocket class
+        :param sizes: Buffer lengths of the Total, Stage1 and Stage2 flight data
+        :return: Flight data of the different stages, filled with the rocket parameters
+        """
+        stages: dict = {}
         if self.mission_profile["stages"] == 2:
+            total_size, stage1_size, stage2_size = sizes
+
             # Total stage
-            self.stages["Total"] = FlightData(int(self.maximum_iterations))
-            self.stages["Total"].angles[0] = np.deg2rad(7)  # 83 degree tower angle
-            self.stages["Total"].mass[0] = rocket.stage1.dry_mass + rocket.stage2.mass
-            self.stages["Total"].cd = rocket.cd
-            self.stages["Total"].diameter = rocket.diameter
-            self.stages["Total"].diameter1 = rocket.stage1.diameter
-            self.stages["Total"].diameter2 = rocket.stage2.diameter
-            self.stages["Total"].shoulder_length = rocket.stage1.shoulder.length
-            self.stages["Total"].fineness_ratio = rocket.fineness_ratio
-            self.stages["Total"].joint_angle = rocket.stage2.nosecone.joint_angle
-            self.stages["Total"].reference_area = np.pi * (rocket.stage1.diameter / 2)**2
+            stages["Total"] = FlightData(total_size)
+            stages["Total"].angles[0] = np.deg2rad(7)  # 83 degree tower angle
+            stages["Total"].mass[0] = rocket.stage1.dry_mass + rocket.stage2.mass
+            stages["Total"].cd = rocket.cd
+            stages["Total"].diameter = rocket.diameter
+            stages["Total"].diameter1 = rocket.stage1.diameter
+            stages["Total"].diameter2 = rocket.stage2.diameter
+            stages["Total"].shoulder_length = rocket.stage1.shoulder.length
+            stages["Total"].fineness_ratio = rocket.fineness_ratio
+            stages["Total"].joint_angle = rocket.stage2.nosecone.joint_angle
+            stages["Total"].reference_area = np.pi * (rocket.stage1.diameter / 2)**2
             wetted_area_body = rocket.wetted_area - rocket.stage1.fins.wetted_area - rocket.stage2.fins.wetted_area
-            self.stages["Total"].wetted_area_body = wetted_area_body
-            self.stages["Total"].wetted_area_fins1 = rocket.stage1.fins.wetted_area
-            self.stages["Total"].wetted_area_fins2 = rocket.stage2.fins.wetted_area
-            self.stages["Total"].fin_thickness1 = rocket.stage1.fins.thickness
-            self.stages["Total"].fin_thickness2 = rocket.stage2.fins.thickness
-            self.stages["Total"].fin_mac1 = rocket.stage1.fins.mac
-            self.stages["Total"].fin_mac2 = rocket.stage2.fins.mac
-            self.stages["Total"].fin_span1 = rocket.stage1.fins.span
-            self.stages["Total"].fin_span2 = rocket.stage2.fins.span
-            self.stages["Total"].thrust_curve = rocket.stage1.engine.thrust_curve
-            self.stages["Total"].fuel_mass_curve = rocket.stage1.engine.fuel_mass_curve
-            self.stages["Total"].mmoi = rocket.stage1.engine.mmoi
-            self.stages["Total"].burn_time = rocket.stage1.engine.burn_time
+            stages["Total"].wetted_area_body = wetted_area_body
+            stages["Total"].wetted_area_fins1 = rocket.stage1.fins.wetted_area
+            stages["Total"].wetted_area_fins2 = rocket.stage2.fins.wetted_area
+            stages["Total"].fin_thickness1 = rocket.stage1.fins.thickness
+            stages["Total"].fin_thickness2 = rocket.stage2.fins.thickness
+            stages["Total"].fin_mac1 = rocket.stage1.fins.mac
+            stages["Total"].fin_mac2 = rocket.stage2.fins.mac
+            stages["Total"].fin_span1 = rocket.stage1.fins.span
+            stages["Total"].fin_span2 = rocket.stage2.fins.span
+            stages["Total"].thrust_curve = rocket.stage1.engine.thrust_curve
+            stages["Total"].fuel_mass_curve = rocket.stage1.engine.fuel_mass_curve
+            stages["Total"].mmoi = rocket.stage1.engine.mmoi
+            stages["Total"].burn_time = rocket.stage1.engine.burn_time
 
             # Separation
             # Stage 1
-            self.stages["Stage1"] = FlightData(int(self.maximum_iterations))
-            self.stages["Stage1"].mass[0] = rocket.stage1.mass
+            stages["Stage1"] = FlightData(stage1_size)
+            stages["Stage1"].mass[0] = rocket.stage1.mass
 
             # Stage 2
-            self.stages["Stage2"] = FlightData(int(self.maximum_iterations))
-            self.stages["Stage2"].mass[0] = rocket.stage2.dry_mass
-            self.stages["Stage2"].cd = rocket.stage2.cd
-            self.stages["Stage2"].diameter = rocket.stage2.diameter
-            self.stages["Stage2"].diameter2 = rocket.stage2.diameter
-            self.stages["Stage2"].fineness_ratio = rocket.fineness_ratio
-            self.stages["Stage2"].joint_angle = rocket.stage2.nosecone.joint_angle
-            self.stages["Stage2"].reference_area = np.pi * (rocket.stage2.diameter / 2)**2
-            self.stages["Stage2"].wetted_area_body = rocket.stage2.wetted_area - rocket.stage2.fins.wetted_area
-            self.stages["Stage2"].wetted_area_fins2 = rocket.stage2.fins.wetted_area
-            self.stages["Stage2"].fin_thickness2 = rocket.stage2.fins.thickness
-            self.stages["Stage2"].fin_mac2 = rocket.stage2.fins.mac
-            self.stages["Stage2"].fin_span2 = rocket.stage2.fins.span
-            self.stages["Stage2"].thrust_curve = rocket.stage2.engine.thrust_curve
-            self.stages["Stage2"].fuel_mass_curve = rocket.stage2.engine.fuel_mass_curve
-            self.stages["Stage2"].mmoi = rocket.stage2.engine.mmoi
-            self.stages["Stage2"].burn_time = rocket.stage2.engine.burn_time
+            stages["Stage2"] = FlightData(stage2_size)
+            stages["Stage2"].mass[0] = rocket.stage2.dry_mass
+            stages["Stage2"].cd = rocket.stage2.cd
+            stages["Stage2"].diameter = rocket.stage2.diameter
+            stages["Stage2"].diameter2 = rocket.stage2.diameter
+            stages["Stage2"].fineness_ratio = rocket.fineness_ratio
+            stages["Stage2"].joint_angle = rocket.stage2.nosecone.joint_angle
+            stages["Stage2"].reference_area = np.pi * (rocket.stage2.diameter / 2)**2
+            stages["Stage2"].wetted_area_body = rocket.stage2.wetted_area - rocket.stage2.fins.wetted_area
+            stages["Stage2"].wetted_area_fins2 = rocket.stage2.fins.wetted_area
+            stages["Stage2"].fin_thickness2 = rocket.stage2.fins.thickness
+            stages["Stage2"].fin_mac2 = rocket.stage2.fins.mac
+            stages["Stage2"].fin_span2 = rocket.stage2.fins.span
+            stages["Stage2"].thrust_curve = rocket.stage2.engine.thrust_curve
+            stages["Stage2"].fuel_mass_curve = rocket.stage2.engine.fuel_mass_curve
+            stages["Stage2"].mmoi = rocket.stage2.engine.mmoi
+            stages["Stage2"].burn_time = rocket.stage2.engine.burn_time
+
+            # Drag tables of the simulated configurations, Stage 1 has no geometry
+            if self.drag_table is not None:
+                self.fill_drag_table(stages["Total"], 0)
+                self.fill_drag_table(stages["Stage2"], 2)
         else:
             raise ModuleNotFoundError("Only 2-Stage rockets are supported atm")
 
+        return stages
+
+    def fill_drag_table(self, flight: FlightData, stage: int):
+        """
+        :param flight: FlightData class with the rocket parameters filled in
+        :param stage: Stage configuration, 0 Total, 1 Stage 1, 2 Stage 2
+        Reuses the tables of an earlier configuration with the same geometry, the tables are never changed in place
+        """
+        key: tuple = (stage, flight.diameter, flight.diameter1, flight.diameter2, flight.fineness_ratio,
+                      flight.reference_area, flight.wetted_area_body, flight.wetted_area_fins1, flight.wetted_area_fins2,
+                      flight.fin_thickness1, flight.fin_thickness2, flight.fin_mac1, flight.fin_mac2,
+                      flight.fin_span1, flight.fin_span2)
+
+        if key not in self.drag_tables:
+            if len(self.drag_tables) >= 64:  # Geometry keeps changing during sizing, only keep recent tables
+                self.drag_tables.clear()
+            self.drag_table(flight, stage)
+            self.drag_tables[key] = (flight.mach_step, flight.cd_pressure, flight.cd_friction)
+        else:
+            flight.mach_step, flight.cd_pressure, flight.cd_friction = self.drag_tables[key]
+
     def combine_lists(self):
+        if self.use_mission_kernel:  # All phases are already in one buffer
+            self.times = self.trajectory[:, trajectory_columns.index("time")]
+            self.angles = self.trajectory[:, trajectory_columns.index("angle")]
+            self.ground_distance = self.trajectory[:, trajectory_columns.index("x")]
+            self.altitudes = self.trajectory[:, trajectory_columns.index("y")]
+            self.velocities = self.trajectory[:, trajectory_columns.index("vy")]
+            self.accelerations = self.trajectory[:, trajectory_columns.index("ay")]
+            self.speed_of_sound = self.trajectory[:, trajectory_columns.index("speed_of_sound")]
+            self.forces_drag = self.trajectory[:, trajectory_columns.index("force_drag")]
+            self.forces_gravity = self.trajectory[:, trajectory_columns.index("force_gravity")]
+            self.forces_thrust = self.trajectory[:, trajectory_columns.index("force_thrust")]
+            self.density = self.trajectory[:, trajectory_columns.index("density")]
+            return
+
         self.times = np.concatenate((self.stages["Total"].time, self.stages["Stage2"].time), axis=0)
         self.angles = np.concatenate((self.stages["Total"].angles, self.stages["Stage2"].angles), axis=0)
 
@@ -253,6 +607,23 @@ class Simulator:
                                        self.stages["Stage2"].density.transpose()), axis=0)
 
     def update(self):
+        if self.use_mission_kernel:
+            total = self.trajectory[:self.phase_starts[1]]
+            stage2 = self.trajectory[self.phase_starts[1]:self.phase_starts[2]]
+            altitude, velocity = trajectory_columns.index("y"), trajectory_columns.index("vy")
+            speed_of_sound = trajectory_columns.index("speed_of_sound")
+
+            self.combine_lists()
+            self.apogee_1 = total[:, altitude].max()
+            self.apogee = stage2[:, altitude].max()
+            self.max_velocity_tot = total[:, velocity].max()
+            self.min_speed_of_sound_tot = total[:, speed_of_sound].max()
+            self.max_velocity1 = self.stages["Stage1"].velocities.transpose()[1].max()
+            self.min_speed_of_sound1 = self.stages["Stage1"].speed_of_sound.transpose().max()
+            self.max_velocity2 = stage2[:, velocity].max()
+            self.min_speed_of_sound2 = stage2[:, speed_of_sound].max()
+            return
+
         self.apogee_1 = self.stages["Total"].locations.transpose()[1].max()
 
         self.combine_lists()
@@ -273,18 +644,22 @@ class Simulator:
 
     @staticmethod
     def trim_lists(rocket: FlightData):
-        rocket.time = rocket.time[rocket.time != 0]
-        rocket.angles = rocket.angles[:len(rocket.time)]
-        rocket.locations = rocket.locations[:len(rocket.time)]
-        rocket.velocities = rocket.velocities[:len(rocket.time)]
-        rocket.speed_of_sound = rocket.speed_of_sound[:len(rocket.time)]
-        rocket.accelerations = rocket.accelerations[:len(rocket.time)]
-
-        rocket.force_drag = rocket.force_drag[:len(rocket.time)]
-        rocket.force_gravity = rocket.force_gravity[:len(rocket.time)]
-        rocket.force_thrust = rocket.force_thrust[:len(rocket.time)]
-
-        rocket.density = rocket.density[:len(rocket.time)]
+        steps: int = rocket.steps  # Recorded by the dynamics
+        if steps == 0:  # Dynamics that do not record their steps, trimmed on the time stamps instead
+            rocket.time = rocket.time[rocket.time != 0]
+            steps = len(rocket.time)
+        rocket.time = rocket.time[:steps]
+        rocket.angles = rocket.angles[:steps]
+        rocket.locations = rocket.locations[:steps]
+        rocket.velocities = rocket.velocities[:steps]
+        rocket.speed_of_sound = rocket.speed_of_sound[:steps]
+        rocket.accelerations = rocket.accelerations[:steps]
+
+        rocket.force_drag = rocket.force_drag[:steps]
+        rocket.force_gravity = rocket.force_gravity[:steps]
+        rocket.force_thrust = rocket.force_thrust[:steps]
+
+        rocket.density = rocket.density[:steps]
 
     def plot_trajectory(self):
         self.combine_lists()
@@ -318,8 +693,8 @@ class Simulator:
 
 if __name__ == "__main__":
     from advanced.aerodynamics import drag, isa
-    from advanced.dynamics import run as dynamics_run
     from advanced.gravity import gravity
+    from advanced.mission import run_mission, run_mission_summary
 
     print(os.path.split(sys.argv[0])[0][:-10])
     current_path = os.path.split(sys.argv[0])[0][:-10]
@@ -329,7 +704,8 @@ if __name__ == "__main__":
     sim_params = run_params["simulator_parameters"]
     mission_params = run_params["mission_profile"]
 
-    sim = Simulator(mission_params, sim_params, dynamics_run, gravity, drag, isa)
+    sim = Simulator(mission_params, sim_params, euler_run, gravity, drag, isa, mission_run=run_mission,
+                    mission_summary_run=run_mission_summary)
 
     # Total stage
     sim.stages["Total"] = FlightData(int(sim.maximum_iterations))
@@ -73,7 +73,7 @@ def Wh_to_Ah(tot_p, avg_volt, time):
     amphour = (tot_p/avg_volt)*(time/3600)
     return amphour
 
-def stage1_electronics(rocket, text):
+def stage1_electronics(rocket, text, output=None):
     # telemetry
 
     frequency = rocket.stage1.electronics.communicationsystem.frequency
@@ -129,18 +129,18 @@ def stage1_electronics(rocket, text):
     temp = power_rec - gain_rx_db - gain_tx_db + other - power
 
     if text == True:
-        print("Link budget: \n", power, "\n", gain_tx_db,"\n", temp, "\n", gain_rx_db,"\n", other, "\n", power_rec )
-        print("Stage 1 maximum allowable datarate is: ", (capacity/10**6), "Mbit/s")
-        print("Stage 1 total signal to noise ratio: ", SNR)
-        print("Expected doppler shift stage 1: ", (delta_freq/10**3), "kHz")
-        print("Stage 1 total required bandwidth: ", min_bw/10**6, "MHz")
-        print("Stage 1 total required battery power: ", rocket.stage1.electronics.powersystem.tot_power, "W")
-        print("Stage 1 total required battery mass: ", rocket.stage1.electronics.powersystem.mass_bat, "Kg")
-        print("Stage 1 total required battery volume: ", rocket.stage1.electronics.powersystem.volume_bat * 10**3, "L")
-        print("Stage 1 total required battery Ah: ", bat_Ah, "Ah")
-        print("Stage 1 total required storage: ", storage/(8*10**9), "Gbytes")
-
-def stage2_electronics(rocket, text):
+        print("Link budget: \n", power, "\n", gain_tx_db,"\n", temp, "\n", gain_rx_db,"\n", other, "\n", power_rec, file=output)
+        print("Stage 1 maximum allowable datarate is: ", (capacity/10**6), "Mbit/s", file=output)
+        print("Stage 1 total signal to noise ratio: ", SNR, file=output)
+        print("Expected doppler shift stage 1: ", (delta_freq/10**3), "kHz", file=output)
+        print("Stage 1 total required bandwidth: ", min_bw/10**6, "MHz", file=output)
+        print("Stage 1 total required battery power: ", rocket.stage1.electronics.powersystem.tot_power, "W", file=output)
+        print("Stage 1 total required battery mass: ", rocket.stage1.electronics.powersystem.mass_bat, "Kg", file=output)
+        print("Stage 1 total required battery volume: ", rocket.stage1.electronics.powersystem.volume_bat * 10**3, "L", file=output)
+        print("Stage 1 total required battery Ah: ", bat_Ah, "Ah", file=output)
+        print("Stage 1 total required storage: ", storage/(8*10**9), "Gbytes", file=output)
+
+def stage2_electronics(rocket, text, output=None):
      # telemetry
 
     frequency = rocket.stage2.electronics.communicationsystem.frequency
@@ -197,21 +197,21 @@ def stage2_electronics(rocket, text):
     temp = power_rec - gain_rx_db - gain_tx_db + other - power
 
     if text == True:
-        print("Link budget stage 2: \n", power, "\n", gain_tx_db,"\n", temp, "\n", gain_rx_db,"\n", other, "\n", power_rec )
-        print("Stage 2 total required Datarate for payload: ",rocket.stage2.electronics.datarate , "bits/s")
-        print("Link budget: \n", power, "\n", gain_tx_db,"\n", temp, "\n", gain_rx_db, other )
-        print("Stage 2 maximum allowable datarate is: ", (capacity/10**6), "Mbit/s")
-        print("Stage 2 total signal to noise ratio: ", W_to_dB(SNR))
-        print("Expected doppler shift Stage 2: ", (delta_freq/10**3), "kHz")
-        print("Stage 2 total required bandwidth: ", min_bw/10**6, "MHz")
-        print("Stage 2 total required battery power: ", rocket.stage2.electronics.powersystem.tot_power, "W")
-        print("Stage 2 total required battery mass: ", rocket.stage2.electronics.powersystem.mass_bat, "Kg")
-        print("Stage 2 total required battery volume: ", rocket.stage2.electronics.powersystem.volume_bat * 10**3, "L")
-        print("Stage 2 total required battery Ah: ", bat_Ah, "Ah")
-        print("Stage 2 total required storage: ", storage/(8*10**9), "Gbytes")
-
-
-def stage2_payload(rocket, text):
+        print("Link budget stage 2: \n", power, "\n", gain_tx_db,"\n", temp, "\n", gain_rx_db,"\n", other, "\n", power_rec, file=output)
+        print("Stage 2 total required Datarate for payload: ",rocket.stage2.electronics.datarate , "bits/s", file=output)
+        print("Link budget: \n", power, "\n", gain_tx_db,"\n", temp, "\n", gain_rx_db, other, file=output)
+        print("Stage 2 maximum allowable datarate is: ", (capacity/10**6), "Mbit/s", file=output)
+        print("Stage 2 total signal to noise ratio: ", W_to_dB(SNR), file=output)
+        print("Expected doppler shift Stage 2: ", (delta_freq/10**3), "kHz", file=output)
+        print("Stage 2 total required bandwidth: ", min_bw/10**6, "MHz", file=output)
+        print("Stage 2 total required battery power: ", rocket.stage2.electronics.powersystem.tot_power, "W", file=output)
+        print("Stage 2 total required battery mass: ", rocket.stage2.electronics.powersystem.mass_bat, "Kg", file=output)
+        print("Stage 2 total required battery volume: ", rocket.stage2.electronics.powersystem.volume_bat * 10**3, "L", file=output)
+        print("Stage 2 total required battery Ah: ", bat_Ah, "Ah", file=output)
+        print("Stage 2 total required storage: ", storage/(8*10**9), "Gbytes", file=output)
+
+
+def stage2_payload(rocket, text, output=None):
     datarate = rocket.stage2.payload.datarate
     # power
     power_total = rocket.stage2.payload.power_sensors
@@ -234,32 +234,33 @@ def stage2_payload(rocket, text):
     rocket.stage2.payload.blackbox.storage = storage
 
     if text == True:
-        print("Stage 2 total required Datarate for payload: ",rocket.stage2.payload.datarate , "bits/s")
-        print("Stage 2 total required battery power for payload: ", rocket.stage2.payload.powersystem.tot_power, "W")
-        print("Stage 2 total required battery mass for payload: ", rocket.stage2.payload.powersystem.mass_bat, "Kg")
-        print("Stage 2 total required battery volume for payload: ", rocket.stage2.payload.powersystem.volume_bat*10**3, "L")
-        print("Stage 2 total required battery Ah for the payload: ", bat_Ah, "Ah")
-        print("Stage 2 total required storage for the payload: ", storage/(8*10**9), "Gbytes")
+        print("Stage 2 total required Datarate for payload: ",rocket.stage2.payload.datarate , "bits/s", file=output)
+        print("Stage 2 total required battery power for payload: ", rocket.stage2.payload.powersystem.tot_power, "W", file=output)
+        print("Stage 2 total required battery mass for payload: ", rocket.stage2.payload.powersystem.mass_bat, "Kg", file=output)
+        print("Stage 2 total required battery volume for payload: ", rocket.stage2.payload.powersystem.volume_bat*10**3, "L", file=output)
+        print("Stage 2 total required battery Ah for the payload: ", bat_Ah, "Ah", file=output)
+        print("Stage 2 total required storage for the payload: ", storage/(8*10**9), "Gbytes", file=output)
 
 
-def run(rocket, print_sizing=False):
+def run(rocket, print_sizing=False, output=None):
     """
     :param rocket: Original Rocket class
     :param print_sizing: Print the sizing process
+    :param output: Stream the sizing process is printed to, sys.stdout if None
     :return: Updated Rocket class
     """
 
     # Stage 1
-    stage1_electronics(rocket, print_sizing)
+    stage1_electronics(rocket, print_sizing, output)
     rocket.stage1.electronics.mass = rocket.stage1.electronics.powersystem.mass_bat
 
     # Stage 2
     # Electronics
-    stage2_electronics(rocket, print_sizing)
+    stage2_electronics(rocket, print_sizing, output)
     rocket.stage2.electronics.mass = rocket.stage2.electronics.powersystem.mass_bat
 
     # Payload
-    stage2_payload(rocket, print_sizing)
+    stage2_payload(rocket, print_sizing, output)
     # rocket.stage2.payload.mass = rocket.stage2.payload.powersystem.mass_bat
 
     # Cost
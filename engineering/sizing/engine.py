@@ -1,63 +1,13 @@
 import math
 import numpy as np
 
+from simulators.advanced.atmosphere import isa
+
 
 # ENGINE SIZING FUNCTIONS
 g_earth = 9.80665
 
 
-# Atmospheric layers with ceiling height and lapse rate
-layers: np.ndarray = np.array([[0, -0.0065],  # ground
-                               [11000, -0.0065],  # Troposphere
-                               [20000, 0],  # Tropopause
-                               [32000, 0.001],  # Stratosphere
-                               [47000, 0.0028],  # Stratosphere
-                               [51000, 0],  # Stratopause
-                               [71000, -0.0028],  # Mesosphere
-                               [86000, -0.0020],  # Mesosphere
-                               [400000, 0],  # Assume constant from here
-                               ])
-
-
-def calc_pressure(height: float) -> tuple[float, float, float]:
-    g0 = 9.80665  # m/s^2
-    R = 287.0  # J/kgK
-
-    T0 = 288.15
-    p0 = 101325
-    T = T0
-    p = p0
-
-    if height > layers[-1][0]:
-        return 0.0, 0.0, 0.0
-
-    h = min(height, layers[-1][0])
-
-    for i in range(1, len(layers)):  # Start in troposphere
-        layer = layers[i]
-        alpha = layer[1]
-        delta_h = layer[0] - layers[i - 1][0]  # Full layer thickness
-        if h <= layer[0]:
-            # Final layer
-            delta_h = h - layers[i - 1][0]
-
-        last_T = T
-        T += alpha * delta_h
-        if alpha == 0:  # isothermal
-            p *= np.exp(-g0 / (R * T) * delta_h)
-        else:
-            p *= (T / last_T) ** (-g0 / (alpha * R))
-
-        if h <= layer[0]:
-            break
-
-    rho0 = p0 / (R * T0)
-
-    rho = p / (R * T)
-
-    return T, p, rho
-
-
 # computing the initial acceleration dictated by the launch tower length and exit velocity [m/s^2]
 def initial_acceleration(length: float, velocity: float) -> float:
     launch_tower_acceleration = velocity ** 2 / (2 * length)
@@ -227,7 +177,7 @@ def create_stage1_engine(rocket):
     rocket.stage1.engine.impulse = rocket.stage1.engine.thrust * rocket.stage1.engine.burn_time
 
     # Calculate Pressure
-    _, pressure, _ = calc_pressure(rocket.simulator.apogee_1)
+    _, pressure, _ = isa(rocket.simulator.apogee_1)
 
     # Calculate stage1 engine specs
     calculate_engine_specs(rocket.stage1.engine, 40000)
@@ -239,7 +189,7 @@ def create_stage1_engine(rocket):
 
 def create_stage2_engine(rocket):
     # Calculate Pressure
-    _, pressure, _ = calc_pressure(rocket.simulator.apogee)
+    _, pressure, _ = isa(rocket.simulator.apogee)
 
     # Calculate engine specs with new Thrust
     calculate_engine_specs(rocket.stage2.engine, 4000)
@@ -249,16 +199,18 @@ def create_stage2_engine(rocket):
     rocket.stage2.engine.fuel_mass_curve = create_fuel_mass_curve(rocket.stage2.engine, rocket.simulator.dt)
 
 
-def stage2_iteration(rocket, apogee_goal):
+def stage2_apogee(rocket, impulse, summary_only=False) -> float:
+    """
+    :param rocket: Rocket class
+    :param impulse: Stage 2 impulse [Ns]
+    :param summary_only: Only calculate the apogee, without recording the trajectory
+    :return: Apogee with the resized stage 2 engine [m]
+    """
     # Makes the classes easier to read
     simulator = rocket.simulator
     engine = rocket.stage2.engine
 
-    # Main parameters
-    apogee: float = simulator.apogee
-
-    difference = apogee_goal - apogee  # Difference in altitude, negative means an overshoot
-    engine.impulse += 0.3 * difference  # Change Impulse to get closer to the target altitude
+    engine.impulse = impulse
     engine.thrust = engine.impulse / engine.burn_time
 
     create_stage2_engine(rocket)
@@ -266,18 +218,100 @@ def stage2_iteration(rocket, apogee_goal):
 
     # Simulate
     simulator.create_stages(rocket)
-    simulator.run()
+    simulator.run(summary_only=summary_only)
     simulator.delete_stages()
-    return difference
+    return simulator.apogee
 
 
-def optimize(rocket, max_iterations, apogee_goal, accuracy):
+def optimize(rocket, max_iterations, apogee_goal, accuracy, print_status=True, output=None) -> int:
+    """
+    :param rocket: Rocket class
+    :param max_iterations: Maximum number of simulations
+    :param apogee_goal: [m]
+    :param accuracy: Allowed apogee error [m]
+    :param print_status: Print the apogee and number of simulations
+    :param output: Stream the status is printed to, sys.stdout if None
+    :return: Number of simulations used
+    Finds the stage 2 impulse that reaches the apogee goal. The first step uses the slope of the apogee over the impulse
+    of the previous call, after that the secant method is used until the root is bracketed and then the Illinois
+    method, which keeps the bracket.
+    """
     create_stage1_engine(rocket)  # stage1 engine sizing
 
-    for i in range(max_iterations):
-        difference = stage2_iteration(rocket, apogee_goal)
-        if abs(difference) < accuracy:
-            break
+    simulator = rocket.simulator
+    engine = rocket.stage2.engine
+    tolerance: float = simulator.checkpoint_tolerance
+
+    slope: float = engine.impulse_slope if engine.impulse_slope else 1 / 0.3  # Apogee change per impulse [m/Ns]
+    impulse: float = engine.impulse
+    error: float = stage2_apogee(rocket, impulse, summary_only=True) - apogee_goal
+    simulations: int = 1
+    best: tuple = (math.inf, impulse)  # Smallest error of an exact boost phase, a reused one can look converged
+    if not simulator.approximate_boost:
+        best = (abs(error), impulse)
+
+    low: tuple | None = None  # Impulse and error with the apogee below the goal
+    high: tuple | None = None  # Impulse and error with the apogee above the goal
+    previous: tuple | None = None
+    while simulations < max_iterations:
+        if abs(error) < accuracy:
+            if not simulator.approximate_boost:
+                break
+            simulator.checkpoint_tolerance = 0  # Only accept convergence on an exact boost phase
+            low, high, previous = None, None, None  # Errors with a reused boost phase do not bracket the exact root
+            error = stage2_apogee(rocket, impulse, summary_only=True) - apogee_goal
+            simulations += 1
+            best = min(best, (abs(error), impulse))
+            continue
+
+        # Bracket, with the Illinois halving of the error on the side that was kept twice
+        if error < 0:
+            low, side = (impulse, error), "low"
+        else:
+            high, side = (impulse, error), "high"
+        if previous is not None and previous[2] == side:
+            if side == "low" and high is not None:
+                high = (high[0], high[1] / 2)
+            elif side == "high" and low is not None:
+                low = (low[0], low[1] / 2)
+
+        # A reused boost phase does not include the lift-off mass change, which makes the apogee too steep
+        exact: bool = not simulator.approximate_boost
+        if previous is not None and previous[3] and exact and impulse != previous[0] and error != previous[1]:
+            slope = (error - previous[1]) / (impulse - previous[0])
+        previous = (impulse, error, side, exact)
+
+        if low is not None and high is not None and abs(high[0] - low[0]) < 1E-6 * impulse:
+            break  # The apogee jumps over the goal inside the bracket, no impulse reaches it
+        if low is not None and high is not None:  # Regula falsi on the bracket
+            new_impulse = low[0] - low[1] * (high[0] - low[0]) / (high[1] - low[1])
+        elif slope > 0:  # Secant step
+            new_impulse = impulse - error / slope
+        else:  # No usable slope, step like the proportional update
+            new_impulse = impulse - 0.3 * error
+        if low is None or high is None:  # Far from the root the slope is not reliable, limit the step
+            new_impulse = min(max(new_impulse, impulse / 2), 2 * impulse)
+
+        impulse = new_impulse
+        error = stage2_apogee(rocket, impulse, summary_only=True) - apogee_goal
+        simulations += 1
+        if not simulator.approximate_boost:
+            best = min(best, (abs(error), impulse))
+
+    # The final design is the best impulse if the goal was not reached, its apogee needs an exact boost phase. The
+    # trajectory is only recorded by the simulation of the next iteration.
+    final_impulse: float = impulse if abs(error) < accuracy or best[0] > abs(error) else best[1]
+    if simulator.approximate_boost or final_impulse != impulse:
+        simulator.checkpoint_tolerance = 0
+        stage2_apogee(rocket, final_impulse, summary_only=True)
+        simulations += 1
+    simulator.checkpoint_tolerance = tolerance
+
+    if slope > 0:
+        engine.impulse_slope = slope  # Warm start of the next call
+    if print_status:
+        print(f"\t\t\tApogee {round(simulator.apogee, 3)} m after {simulations} simulations", file=output)
+    return simulations
 
 
 def initialize(rocket):
@@ -286,13 +320,14 @@ def initialize(rocket):
     return rocket
 
 
-def run(rocket):
+def run(rocket, output=None):
     """
     :param rocket: Original Rocket class
+    :param output: Stream the sizing prints to, sys.stdout if None
     :return: Updated Rocket class
     """
 
-    optimize(rocket, 30, 110E3, 1)
+    optimize(rocket, 30, 110E3, 1, output=output)
 
     # Cost
     rocket.stage1.engine.cost = 0  # Maybe expand?
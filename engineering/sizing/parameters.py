@@ -0,0 +1,255 @@
+import numpy as np
+
+
+installed: set = set()  # Class and node path of every NodeSchema that made its Parameters in this process
+
+
+def is_number(value) -> bool:
+    """
+    :param value: Any value
+    :return: True if the value can be stored in a ParameterStore
+    """
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_))
+
+
+class ParameterStore:
+    def __init__(self, size: int):
+        """
+        :param size: Number of parameters
+        Contiguous storage of all numeric parameters of a Rocket class, indexed by the ParameterSchema
+        """
+        self.values: np.ndarray = np.zeros(size, dtype=np.float64)
+        self.defined: np.ndarray = np.zeros(size, dtype=bool)  # False if the parameter is None
+        self.integer: np.ndarray = np.zeros(size, dtype=bool)  # True if the parameter is read back as an int
+
+        # Dirty tracking, writes to a tracked parameter mark its group as dirty
+        self.groups: dict = {}  # Group of every tracked parameter
+        self.dirty: set = set()  # Groups with a tracked parameter that was written since they were last calculated
+        self.cache: dict = {}  # Results per group, valid as long as the group is not dirty
+
+    def get(self, index: int):
+        if not self.defined[index]:
+            return None
+        if self.integer[index]:
+            return int(self.values[index])
+        return float(self.values[index])
+
+    def set(self, index: int, value) -> bool:
+        """
+        :param index: Index of the parameter
+        :param value: New value
+        :return: False if the value is not a number or None, the parameter is then undefined in the store
+        """
+        group = self.groups.get(index)
+        if group is not None:
+            self.dirty.add(group)
+
+        if type(value) is float:  # Most common, skips the type checks
+            self.values[index] = value
+            self.defined[index] = True
+            self.integer[index] = False
+            return True
+        if value is None:
+            self.defined[index] = False
+            self.integer[index] = False
+            return True
+        if not is_number(value):
+            self.defined[index] = False
+            self.integer[index] = False
+            return False
+
+        self.values[index] = value
+        self.defined[index] = True
+        self.integer[index] = isinstance(value, (int, np.integer))
+        return True
+
+    def to_list(self) -> list:
+        """
+        :return: All parameters as Python values, with None for undefined parameters
+        """
+        values: list = self.values.tolist()
+        for index in np.flatnonzero(~self.defined):
+            values[index] = None
+        for index in np.flatnonzero(self.defined & self.integer):
+            values[index] = int(values[index])
+        return values
+
+    def changed(self, other) -> np.ndarray:
+        """
+        :param other: ParameterStore of the same schema
+        :return: Indices of the parameters that differ, a NaN parameter always differs and an int is the same as an
+        equal float like with !=
+        """
+        different = (self.defined != other.defined) | (self.defined & ~(self.values == other.values))
+        return np.flatnonzero(different)
+
+    def copy(self):
+        store = ParameterStore(0)
+        store.values = self.values.copy()
+        store.defined = self.defined.copy()
+        store.integer = self.integer.copy()
+        store.groups = self.groups
+        store.dirty = set(self.dirty)
+        store.cache = dict(self.cache)
+        return store
+
+    def track(self, groups: dict):
+        """
+        :param groups: Group of every parameter that needs dirty tracking, all groups start dirty
+        """
+        self.groups = groups
+        self.dirty = set(groups.values())
+
+    def restore(self, snapshot):
+        """
+        :param snapshot: Copy of a ParameterStore of the same schema
+        """
+        self.values[:] = snapshot.values
+        self.defined[:] = snapshot.defined
+        self.integer[:] = snapshot.integer
+        self.dirty = set(self.groups.values())
+
+
+class Parameter:
+    def __init__(self, name: str):
+        """
+        :param name: Attribute name
+        Attribute of a ParameterNode class that reads and writes the ParameterStore of the Rocket class. Values that are
+        not a number, and all values before the Rocket class is attached, are kept as normal attributes.
+        """
+        self.name: str = name
+
+    def __get__(self, node, owner=None):
+        if node is None:
+            return self
+        data: dict = node.__dict__
+        if self.name in data:
+            return data[self.name]
+        try:
+            return data["_store"].get(data["_schema"].indices[self.name])
+        except KeyError:
+            raise AttributeError(f"'{type(node).__name__}' object has no attribute '{self.name}'")
+
+    def __set__(self, node, value):
+        data: dict = node.__dict__
+        schema = data.get("_schema")
+        if schema is not None and self.name in schema.indices and data["_store"].set(schema.indices[self.name], value):
+            data.pop(self.name, None)
+        else:
+            data[self.name] = value
+
+
+class NodeSchema:
+    def __init__(self, path: str, kind: type, order: list):
+        """
+        :param path: Dotted path of the node, empty for the Rocket class
+        :param kind: Class of the node
+        :param order: Attribute names in the order they were defined
+        """
+        self.path: str = path
+        self.kind: type = kind
+        self.order: list = order
+        self.known: set = set(order) | {"_store", "_schema"}  # Attributes that are not added later
+        self.indices: dict = {}  # Index in the ParameterStore of every numeric attribute
+        self.children: list = []  # Attribute names of the nodes inside this node
+
+    def install(self, kind: type):
+        """
+        :param kind: Class of the node
+        Makes every numeric attribute a Parameter of the class, if the class does not have it yet
+        """
+        for key in self.indices:
+            if key not in kind.__dict__:
+                setattr(kind, key, Parameter(key))
+        installed.add((kind, self.path))
+
+    def __deepcopy__(self, memo):  # Shared by all Rocket classes
+        return self
+
+
+class ParameterSchema:
+    def __init__(self, rocket):
+        """
+        :param rocket: Newly created Rocket class
+        Numbers the attributes of the Rocket class and its Stage and Subsystem classes that are a number or None, and
+        makes them a Parameter of their class
+        """
+        self.paths: list = []  # Dotted path of every parameter
+        self.nodes: dict = {}  # NodeSchema per dotted node path
+        self.add_node(rocket, "")
+        self.index: dict = {path: i for i, path in enumerate(self.paths)}
+
+    def add_node(self, node, path: str):
+        schema = NodeSchema(path, type(node), list(node.__dict__))
+        self.nodes[path] = schema
+        for key, value in node.__dict__.items():
+            name: str = f"{path}.{key}" if path else key
+            if isinstance(value, ParameterNode):
+                schema.children.append(key)
+                self.add_node(value, name)
+            elif (value is None or is_number(value)) and isinstance(getattr(type(node), key, Parameter(key)), Parameter):
+                schema.indices[key] = len(self.paths)
+                self.paths.append(name)
+        schema.install(type(node))
+
+    def attach(self, rocket, store: ParameterStore):
+        """
+        :param rocket: Rocket class with the same structure as the one the schema was made from
+        :param store: Store that receives the current attribute values
+        """
+        for path, schema in self.nodes.items():
+            node = rocket
+            if path:
+                for key in path.split("."):
+                    node = node.__dict__[key]
+
+            for key, index in schema.indices.items():
+                if store.set(index, node.__dict__[key]):
+                    del node.__dict__[key]
+            node.__dict__["_store"] = store
+            node.__dict__["_schema"] = schema
+
+
+class ParameterNode:
+    """
+    Base of the Rocket, Stage and Subsystem classes. After ParameterSchema.attach the numeric attributes are kept in the
+    ParameterStore of the Rocket class, reading and writing them as attributes or items works the same as before.
+    """
+    def __setstate__(self, state: dict):  # Copies and Rocket classes loaded from the archive
+        self.__dict__.update(state)
+        schema = state.get("_schema")
+        if schema is not None and (type(self), schema.path) not in installed:
+            schema.install(type(self))
+
+    def __setitem__(self, key, item):
+        setattr(self, key, item)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+
+def node_items(node, values: list = None) -> list:
+    """
+    :param node: Rocket, Stage or Subsystem class
+    :param values: Result of ParameterStore.to_list, to read all parameters at once
+    :return: All attributes of the node as (name, value), in the order they were defined
+    """
+    schema = node.__dict__.get("_schema")
+    if schema is None:  # Not attached, for example a Rocket class from an old archive
+        return list(node.__dict__.items())
+
+    if values is None:
+        values = node.__dict__["_store"].to_list()
+    items: list = []
+    for key in schema.order:
+        if key in node.__dict__:
+            items.append((key, node.__dict__[key]))
+        elif key in schema.indices:
+            items.append((key, values[schema.indices[key]]))
+    for key, value in node.__dict__.items():  # Attributes that were added later
+        if key not in schema.order and key not in ("_store", "_schema"):
+            items.append((key, value))
+    return items
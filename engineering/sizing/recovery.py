@@ -130,9 +130,10 @@ def cold_gas(rocket):
     return m_total1, m_total2, gas_total_cost1, gas_total_cost2
 
 
-def run(rocket):
+def run(rocket, output=None):
     """
     :param rocket: Original Rocket class
+    :param output: Stream the sizing prints to, recovery sizing does not print
     :return: Updated Rocket class
     """
     parachute_data = parachutes(rocket)
@@ -1,8 +1,16 @@
+import copy
 import numpy as np
 from colorama import Fore
 
+from sizing.parameters import ParameterNode, ParameterSchema, ParameterStore, node_items
 
-class Stage:
+
+schema: ParameterSchema | None = None  # Parameter numbering of the Rocket class, made by the first Rocket class
+summation: dict | None = None  # Parameter indices used by Rocket.update
+export_layouts: dict = {}  # Layout of export_all_values per set of attributes that were added after the schema was made
+
+
+class Stage(ParameterNode):
     def __init__(self, name: str, payload, shoulder, nosecone):
         self.id: str = "0.0"
         self.name: str = name
@@ -40,14 +48,8 @@ class Stage:
         if shoulder:
             self.shoulder: Subsystem | None = None
 
-    def __setitem__(self, key, item):
-        self.__dict__[key] = item
-
-    def __getitem__(self, key):
-        return self.__dict__[key]
-
 
-class Subsystem:
+class Subsystem(ParameterNode):
     def __init__(self, name: str):
         self.id: str = "0.0"
         self.name: str = name
@@ -70,12 +72,6 @@ class Subsystem:
         # Cost
         self.cost: float | None = None   # [euros]
 
-    def __setitem__(self, key, item):
-        self.__dict__[key] = item
-
-    def __getitem__(self, key):
-        return self.__dict__[key]
-
 
 class Engine(Subsystem):
     def __init__(self, name: str, tower):
@@ -140,6 +136,7 @@ class Engine(Subsystem):
         self.thrust_curve: np.array = np.zeros(10000, dtype=float)  # Engine thrust curve over time
         self.fuel_mass_curve: np.array = np.zeros(10000, dtype=float)  # Total engine mass over time
         self.mmoi: np.array = np.zeros(10000, dtype=float)  # Mass Moment of Inertia over time
+        self.impulse_slope: float | None = None  # Apogee change per impulse of the last apogee targeting [m/Ns]
 
         self.mass_flow_rate: np.ndarray = np.ones((2, 1000), dtype=float)  # Mass flow rate profile engine
         self.mass_fuel_start: float = 100 # Fuel mass at start of burn [kg]
@@ -358,7 +355,47 @@ class Payload(Subsystem):
             self.storage: float | None = 0
 
 
-class Rocket:
+def copy_node(node, store: ParameterStore):
+    """
+    :param node: Stage or Subsystem class
+    :param store: Parameter store of the copy
+    :return: Copy of the class and the Subsystem classes in it, all other values are shared
+    """
+    new_node = copy.copy(node)
+    new_node.__dict__["_store"] = store
+    for key, value in node.__dict__.items():
+        if isinstance(value, Subsystem):
+            new_node[key] = copy_node(value, store)
+    return new_node
+
+
+def changed_values(new_node, old_node, path: str = "") -> dict:
+    """
+    :param new_node: Rocket, Stage or Subsystem class that was copied with Rocket.copy_on_write
+    :param old_node: Class it was copied from
+    :param path: Dotted path of the class, empty for the Rocket class
+    :return: Changed values that are not in the parameter store, with their dotted path
+    Values that are still the shared object are skipped without comparing them.
+    """
+    changes: dict = {}
+    for key, value in new_node.__dict__.items():
+        old_value = old_node.__dict__.get(key)
+        if value is old_value or key in ("simulator", "_store", "_schema"):
+            continue
+
+        name: str = f"{path}.{key}" if path else key
+        if isinstance(value, (Stage, Subsystem)):
+            changes.update(changed_values(value, old_value, name))
+        elif type(value) == list or type(value) == np.ndarray:
+            if not np.array_equal(value, old_value):
+                changes[name] = value
+        elif value != old_value:
+            changes[name] = value
+
+    return changes
+
+
+class Rocket(ParameterNode):
     def __init__(self, simulator):
         # Global parameters
         self.id: str = "0"
@@ -405,11 +442,12 @@ class Rocket:
             if key not in self.excluded_variables:
                 self.compare_list.append(key)
 
-    def __setitem__(self, key, item):
-        self.__dict__[key] = item
-
-    def __getitem__(self, key):
-        return self.__dict__[key]
+        # Keep all numeric attributes in one parameter vector
+        global schema
+        if schema is None:
+            schema = ParameterSchema(self)
+        schema.attach(self, ParameterStore(len(schema.paths)))
+        self._store.track(self.summation_indices()["groups"])
 
     class Stage1(Stage):
         def __init__(self, name: str):
@@ -440,61 +478,262 @@ class Rocket:
             self.nosecone: Subsystem = Nosecone("Nosecone")
             self.payload: Subsystem = Payload("Scientific Payload")
 
-    def update(self, print_warnings=True):
-        # Start with all Rocket parameters at zero
-        for key in self.compare_list:
-            self[key] = 0
+    def summation_indices(self) -> dict:
+        """
+        :return: Parameter indices of the summed variables of the Rocket, every Stage and their Subsystems, and of the
+        mass and dry mass of the Subsystems of every Stage except the engine. The group of a summed variable is the
+        number of its Stage, or "rocket" for the Rocket.
+        """
+        global summation
+        if summation is None:
+            def indices(path: str) -> list:
+                return [schema.index[f"{path}.{key}" if path else key] for key in self.compare_list]
+
+            stages: list = []
+            groups: dict = {index: "rocket" for index in indices("")}
+            for stage_key in schema.nodes[""].children:
+                if "stage" in stage_key:
+                    subsystem_keys = [key for key in schema.nodes[stage_key].children
+                                      if issubclass(schema.nodes[f"{stage_key}.{key}"].kind, Subsystem)]
+                    subsystem_indices = np.array([indices(f"{stage_key}.{key}") for key in subsystem_keys], dtype=int)
+                    subsystem_indices = subsystem_indices.reshape(len(subsystem_keys), len(self.compare_list))
+
+                    # Dry mass is the same as actual mass for everything except the engine
+                    mass = [schema.index[f"{stage_key}.{key}.mass"] for key in subsystem_keys if key != "engine"]
+                    dry_mass = [schema.index[f"{stage_key}.{key}.dry_mass"] for key in subsystem_keys if key != "engine"]
+
+                    for index in indices(stage_key) + subsystem_indices.flatten().tolist():
+                        groups[index] = len(stages)
+                    stages.append((stage_key, np.array(indices(stage_key), dtype=int), subsystem_keys, subsystem_indices,
+                                   np.array(mass, dtype=int), np.array(dry_mass, dtype=int)))
+
+            summation = {"rocket": np.array(indices(""), dtype=int), "stages": stages, "groups": groups}
+        return summation
+
+    def update(self, print_warnings=True, full=False):
+        """
+        :param print_warnings: Print the Subsystem variables that are None or smaller than zero, these are skipped
+        :param full: Sum all Stages, otherwise only the Stages with a summed variable that was set since the last update
+        Sums the shared Subsystem variables into the Stages and the Stages into the Rocket, with the parameter vector.
+        Both ways give the same values.
+        """
+        store: ParameterStore = self._store
+        indices: dict = self.summation_indices()
+        dirty: set = set(range(len(indices["stages"]))) | {"rocket"} if full else store.dirty
+
+        if dirty:
+            next_dirty: set = set()
+            rocket_total = np.zeros(len(self.compare_list))
+            for stage, (stage_key, stage_indices, subsystem_keys, subsystem_indices, mass, dry_mass) in \
+                    enumerate(indices["stages"]):
+                if stage in dirty:
+                    values = store.values[subsystem_indices]
+                    usable = store.defined[subsystem_indices] & ~(values < 0)
+                    warnings: list = []
+                    for row, column in np.argwhere(~usable):
+                        name = f"{stage_key}.{subsystem_keys[row]}.{self.compare_list[column]}"
+                        if not store.defined[subsystem_indices[row, column]]:
+                            warnings.append(f"\t\tWarning! '{name}' is None")
+                        else:
+                            warnings.append(f"\t\tWarning! '{name}' smaller than zero: {values[row, column]}")
+                    store.cache[stage] = warnings
+
+                    # Summ all shared Subsystem parameters into Stage parameters, row by row like a running sum
+                    store.values[stage_indices] = np.where(usable, values, 0).sum(axis=0)
+                    store.defined[stage_indices] = True
+                    store.integer[stage_indices] = False
+
+                    # The dry mass is copied after the sum, so a changed dry mass is summed in the next update
+                    old_dry_mass = store.values[dry_mass]
+                    old_defined = store.defined[dry_mass]
+                    store.values[dry_mass] = store.values[mass]
+                    store.defined[dry_mass] = store.defined[mass]
+                    store.integer[dry_mass] = store.integer[mass]
+                    new_dry_mass = store.values[dry_mass]
+                    same = (old_dry_mass == new_dry_mass) | (np.isnan(old_dry_mass) & np.isnan(new_dry_mass))
+                    if np.any(old_defined != store.defined[dry_mass]) or np.any(old_defined & ~same):
+                        next_dirty.add(stage)
 
-        for stage_key, stage_value in self.__dict__.items():
-            if "stage" in stage_key:
+                # Sum all shared Stage parameters into Rocket parameters
+                rocket_total += store.values[stage_indices]
 
-                # Start with all Stage parameters at zero
-                for key in self.compare_list:
-                    self[stage_key][key] = 0
+            store.values[indices["rocket"]] = rocket_total
+            store.defined[indices["rocket"]] = True
+            store.integer[indices["rocket"]] = False
+            store.dirty = next_dirty
 
-                # Summ all shared Subsystem parameters into Stage parameters
-                for subsystem_key, subsystem_value in stage_value.__dict__.items():
-                    if isinstance(subsystem_value, Subsystem):
-                        for variable_key, variable_value in subsystem_value.__dict__.items():
-                            if variable_key in self.compare_list:
-                                if variable_key == "dry_mass" and subsystem_key != "engine":  # Dry mass is the same as actual mass for everything except the engine
-                                    self[stage_key][subsystem_key].dry_mass = self[stage_key][subsystem_key].mass
-                                if variable_value is None:
-                                    if print_warnings:
-                                        print(Fore.YELLOW + f"\t\tWarning! '{stage_key}.{subsystem_key}.{variable_key}' is None")
-                                elif variable_value < 0:
-                                    if print_warnings:
-                                        print(Fore.YELLOW + f"\t\tWarning! '{stage_key}.{subsystem_key}.{variable_key}' smaller than zero: {variable_value}")
-                                else:
-                                    self[stage_key][variable_key] += variable_value  # Add all the Subsystems
+        if print_warnings:
+            for stage in range(len(indices["stages"])):
+                for warning in store.cache.get(stage, []):
+                    print(Fore.YELLOW + warning)
 
-                # Sum all shared Stage parameters into Rocket parameters
-                for variable_key, variable_value in self[stage_key].__dict__.items():
-                    if variable_key in self.compare_list:
-                        self[variable_key] += variable_value
+    def copy_on_write(self):
+        """
+        :return: Copy of the Rocket class for a sizing function
+        Only the Rocket, Stage and Subsystem classes, the parameter vector and the simulator are copied, all other
+        values are shared with this class. Setting a value on the copy replaces the shared value, so this class does
+        not change as long as values are not changed in place. Use changes() on the copy to get the values that were
+        set.
+        """
+        store: ParameterStore = self._store.copy()
+        rocket = copy.copy(self)
+        rocket.__dict__["_store"] = store
+        rocket.simulator = copy.copy(self.simulator)
+        for key, value in self.__dict__.items():
+            if isinstance(value, Stage):
+                rocket[key] = copy_node(value, store)
+        return rocket
+
+    def changes(self, original) -> dict:
+        """
+        :param original: Rocket class this copy was made from with copy_on_write
+        :return: Values that were changed on this copy, with their dotted path
+        """
+        changes: dict = {}
+        for index in self._store.changed(original._store):
+            changes[schema.paths[index]] = self._store.get(index)
+        changes.update(changed_values(self, original))  # Values that are not numbers
+        return changes
+
+    def snapshot(self) -> ParameterStore:
+        """
+        :return: Copy of the parameter vector, values that are not numbers are not included
+        """
+        return self._store.copy()
+
+    def restore(self, snapshot: ParameterStore):
+        """
+        :param snapshot: Result of snapshot() of this Rocket class
+        """
+        self._store.restore(snapshot)
+
+    def nodes(self) -> dict:
+        """
+        :return: Rocket, Stage and Subsystem classes per dotted path of the schema
+        """
+        nodes: dict = {"": self}
+        for path in schema.nodes:
+            if path:
+                parent, _, key = path.rpartition(".")
+                nodes[path] = nodes[parent].__dict__[key]
+        return nodes
 
     def export_all_values(self):
+        nodes: dict = self.nodes()
+
+        # Attributes that are not in the schema and values that are not numbers are read from the classes
+        added: list = []
+        overrides: list = []
+        for path, node in nodes.items():
+            node_schema = schema.nodes[path]
+            for key in node.__dict__:
+                if key not in node_schema.known:
+                    added.append((path, key))
+                elif key in node_schema.indices:
+                    overrides.append((path, key))
+
+        layout_key: tuple = tuple(added)
+        if layout_key not in export_layouts:
+            entries: list = self.walk_all_values(layout=True)
+            parameter_positions = [i for i, (_, path, _) in enumerate(entries) if path in schema.index]
+            export_layouts[layout_key] = {
+                "names": ["iteration"] + [name for name, _, _ in entries],
+                "parameter_positions": np.array(parameter_positions, dtype=int) + 1,
+                "parameter_indices": np.array([schema.index[entries[i][1]] for i in parameter_positions], dtype=int),
+                "attributes": [(i + 1, node_path, path.rpartition(".")[2]) for i, (_, path, node_path) in enumerate(entries)
+                               if path not in schema.index],
+                "positions": {path: i + 1 for i, (_, path, _) in enumerate(entries)}}
+        layout: dict = export_layouts[layout_key]
+
+        store: ParameterStore = self._store
+        row = np.empty(len(layout["names"]), dtype=object)
+        row[layout["parameter_positions"]] = store.values[layout["parameter_indices"]]
+        for i in np.flatnonzero(~store.defined[layout["parameter_indices"]]):
+            row[layout["parameter_positions"][i]] = None
+        for i in np.flatnonzero(store.integer[layout["parameter_indices"]]):
+            row[layout["parameter_positions"][i]] = int(row[layout["parameter_positions"][i]])
+        for i, node_path, name in layout["attributes"]:
+            row[i] = nodes[node_path].__dict__[name]
+        for path, key in overrides:
+            row[layout["positions"][f"{path}.{key}" if path else key]] = nodes[path].__dict__[key]
+        row[0] = str(self.id)
+
+        return dict(zip(layout["names"], row.tolist()))
+
+    def walk_all_values(self, layout: bool = False):
+        """
+        :param layout: Return the export name, the attribute path and the node path of every value instead
+        :return: All values of the Rocket, Stages and Subsystems with their export name
+        """
+        values: list = self._store.to_list()
         parameters: dict = {"iteration": str(self.id)}
-        for stage_key, stage_value in self.__dict__.items():
+        entries: list = []
+
+        def add(key: str, value, path: str):
+            if layout:
+                entries.append((key, path, path.rpartition(".")[0]))
+            else:
+                parameters[key] = value
+
+        for stage_key, stage_value in node_items(self, values):
             if "stage" in stage_key:
-                for subsystem_key, subsystem_value in stage_value.__dict__.items():
+                for subsystem_key, subsystem_value in node_items(stage_value, values):
                     if isinstance(subsystem_value, Subsystem):
-                        for key, value in subsystem_value.__dict__.items():
+                        for key, value in node_items(subsystem_value, values):
                             if isinstance(value, Subsystem):
-                                for sub_key, sub_value in value.__dict__.items():
-                                    parameters[f"{stage_key}.{subsystem_key}.{key}.{sub_key}"] = sub_value
+                                for sub_key, sub_value in node_items(value, values):
+                                    name = f"{stage_key}.{subsystem_key}.{key}.{sub_key}"
+                                    add(name, sub_value, name)
                             else:
-                                parameters[f"{stage_key}.{subsystem_key}.{key}"] = value
+                                add(f"{stage_key}.{subsystem_key}.{key}", value, f"{stage_key}.{subsystem_key}.{key}")
                     else:
-                        parameters[f"{stage_key}.{subsystem_key}"] = subsystem_value
+                        add(f"{stage_key}.{subsystem_key}", subsystem_value, f"{stage_key}.{subsystem_key}")
             else:
-                parameters[stage_key] = stage_value
-
-        return parameters
+                add(stage_key, stage_value, stage_key)
+
+        return entries if layout else parameters
+
+
+def benchmark_update(repeats: int = 10000):
+    """
+    :param repeats: Number of calls per case
+    Prints the per call cost of the incremental update against a full update, with nothing changed, one Subsystem
+    changed and all Subsystems changed before every call
+    """
+    import timeit
+
+    test_rocket: Rocket = Rocket(None)
+    subsystems: list = [test_rocket[stage][subsystem] for stage in ["stage1", "stage2"]
+                        for subsystem in ["engine", "recovery", "fins", "electronics"]]
+    for test_subsystem in subsystems:
+        for variable in test_rocket.compare_list:
+            test_subsystem[variable] = 1.0
+    test_rocket.update(print_warnings=False)
+    calls: list = [0]
+
+    def change_one():
+        calls[0] += 1
+        test_rocket.stage2.fins.mass = 1.0 + calls[0] % 2  # A different value every call
+
+    def change_all():
+        calls[0] += 1
+        for changed_subsystem in subsystems:
+            changed_subsystem.mass = 1.0 + calls[0] % 2
+
+    for name, change in [("Nothing changed", None), ("One Subsystem changed", change_one),
+                         ("All Subsystems changed", change_all)]:
+        times: list = []
+        for full in [True, False]:
+            def call():
+                if change is not None:
+                    change()
+                test_rocket.update(print_warnings=False, full=full)
+            times.append(timeit.timeit(call, number=repeats) / repeats * 1e6)
+        print(f"{name}:\tfull {times[0]:.1f} us,\tincremental {times[1]:.1f} us")
 
 
 if __name__ == "__main__":
-    pass
+    benchmark_update()
     # test_rocket: Rocket = Rocket()
     # print(test_rocket.stage1.engine.mass)
     # print(test_rocket.stage2.engine.isp)
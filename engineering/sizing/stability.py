@@ -279,7 +279,7 @@ def calculate_fin_span(rocket, update):
     rocket.stage1.fins.span = scipy.optimize.fsolve(lambda x: fin_flow_function_1(x) - target_flow_area_1, rocket.stage1.fins.span)[0]
 
 
-def calculate_fin_thickness(rocket):
+def calculate_fin_thickness(rocket, output=None):
     def thickness_stage(stage, stage_num: str):
         shear_modulus = stage.fins.shear_modulus
         speed_of_sound = rocket.simulator[f"min_speed_of_sound{stage_num}"]
@@ -300,7 +300,7 @@ def calculate_fin_thickness(rocket):
     thickness_stage(rocket.stage1, "_tot")
     thickness_stage(rocket.stage2, "2")
 
-    print(f"Thickness 1 and 2: {rocket.stage1.fins.thickness}, {rocket.stage2.fins.thickness}")
+    print(f"Thickness 1 and 2: {rocket.stage1.fins.thickness}, {rocket.stage2.fins.thickness}", file=output)
 
 
 def update_masses(rocket):
@@ -354,15 +354,26 @@ def update_cg_cp(rocket):
     rocket.update(False)
 
 
-def run(rocket):
+def derive(rocket):
+    """
+    :param rocket: Rocket class with new fin spans
+    Derives the fin thickness, areas, CG, CP and masses from the fin spans, like run does after sizing the spans
+    """
+    update_cg_cp(rocket)
+    calculate_fin_thickness(rocket)
+    update_cg_cp(rocket)
+
+
+def run(rocket, output=None):
     """
     :param rocket: Original Rocket class
+    :param output: Stream the sizing prints to, sys.stdout if None
     :return: Updated Rocket class
     """
 
     # Calculate the span and thickness of the fins
     calculate_fin_span(rocket, update_cg_cp)
-    calculate_fin_thickness(rocket)
+    calculate_fin_thickness(rocket, output)
 
     update_cg_cp(rocket)
 
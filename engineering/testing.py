@@ -1,12 +1,16 @@
 import pytest
+import contextlib
 import json
 import os
+import shutil
 import sys
 import numpy as np
+import pandas as pd
 
 # Main Classes
 from sizing.rocket import Rocket
 from simulators.simulator import Simulator, FlightData
+from numba.typed import List
 
 import sizing.engine as engine
 import sizing.stability as stability
@@ -16,6 +20,18 @@ import sizing.recovery as recovery
 import simulators.advanced.aerodynamics as aerodynamics
 import simulators.advanced.gravity as gravity
 import simulators.advanced.dynamics as dynamics
+import simulators.advanced.atmosphere as atmosphere
+import simulators.advanced.mission as mission
+import simulators.advanced.batch_dynamics as batch_dynamics
+import simulators.dispersion as dispersion
+from convergence import ConvergenceMonitor, AndersonAccelerator
+import sampling
+import campaign
+import file_manager as fm
+from archive import RunArchive, SnapshotArchive
+from run_index import RunIndex
+from sizing.parameters import is_number
+from results import ResultStore
 
 current_file_path = os.path.split(sys.argv[0])[0]
 run_parameters_file = open(os.path.join("files/run_parameters_testing.json"))
@@ -146,6 +162,121 @@ def test_engine():
     rocket = Rocket(simulator)
 
 
+def test_copy_on_write():
+    simulator = Simulator(run_parameters["mission_profile"], run_parameters["simulator_parameters"], dynamics.run, gravity.gravity, aerodynamics.drag, aerodynamics.isa)
+    rocket = Rocket(simulator)
+    rocket.stage2.engine.impulse = 40000
+
+    copy = rocket.copy_on_write()
+    copy.stage2.engine.impulse = 50000
+    copy.stage2.engine.thrust_curve = np.ones(10)
+    copy.stage1.electronics.powersystem.margin = 0.2
+    copy.stage1.engine.isp = None  # Same value as the original
+    copy.simulator.apogee = 1000
+
+    assert copy.changes(rocket) == {"stage2.engine.impulse": 50000, "stage2.engine.thrust_curve": copy.stage2.engine.thrust_curve,
+                                    "stage1.electronics.powersystem.margin": 0.2}
+    assert rocket.stage2.engine.impulse == 40000 and rocket.stage1.electronics.powersystem.margin is None
+    assert simulator.apogee == 0
+
+
+def test_parameter_store():
+    simulator = Simulator(run_parameters["mission_profile"], run_parameters["simulator_parameters"], dynamics.run, gravity.gravity, aerodynamics.drag, aerodynamics.isa)
+    rocket = Rocket(simulator)
+    for stage in ["stage1", "stage2"]:
+        for subsystem in ["engine", "recovery", "fins", "electronics"]:
+            rocket[stage][subsystem].mass = 2
+            rocket[stage][subsystem].cost = 1.5
+    rocket.stage2.engine.dry_mass = 1.0
+    rocket.stage1.engine.casing_density = "aluminium"  # Not a number, kept as a normal attribute
+
+    snapshot = rocket.snapshot()
+    rocket.update(print_warnings=False)
+    assert rocket.stage1.mass == 8 and rocket.mass == 16 and rocket.cost == 12
+    assert rocket.stage2.recovery.dry_mass == 2 and rocket.stage2.engine.dry_mass == 1.0
+    assert type(rocket.stage1.engine.mass) is int and rocket["stage1"]["engine"]["casing_density"] == "aluminium"
+
+    values = rocket.export_all_values()
+    assert values["stage2.mass"] == 8 and values["stage1.engine.casing_density"] == "aluminium"
+
+    rocket.restore(snapshot)
+    assert rocket.mass is None and rocket.stage1.engine.mass == 2
+
+
+def test_incremental_update():
+    simulator = Simulator(run_parameters["mission_profile"], run_parameters["simulator_parameters"], dynamics.run, gravity.gravity, aerodynamics.drag, aerodynamics.isa)
+    rocket = Rocket(simulator)
+    for stage in ["stage1", "stage2"]:
+        for subsystem in ["engine", "recovery", "fins", "electronics"]:
+            for variable in rocket.compare_list:
+                rocket[stage][subsystem][variable] = 1.0
+    rocket.update(print_warnings=False)
+    rocket.update(print_warnings=False)
+    assert rocket._store.dirty == set()
+
+    rocket.stage2.fins.mass = 3.0
+    assert rocket._store.dirty == {1}
+    rocket.update(print_warnings=False)
+    assert rocket.stage2.mass == 6 and rocket.stage1.mass == 4 and rocket.mass == 10
+
+    full = rocket.copy_on_write()
+    rocket.update(print_warnings=False)
+    full.update(print_warnings=False, full=True)
+    assert rocket.changes(full) == {} and rocket.stage2.dry_mass == 6
+
+
+def test_convergence_monitor():
+    simulator = Simulator(run_parameters["mission_profile"], run_parameters["simulator_parameters"], dynamics.run, gravity.gravity, aerodynamics.drag, aerodynamics.isa)
+    rocket = Rocket(simulator)
+    rocket.mass = 100.0
+    rocket.stage1.fins.span = 0.5
+
+    monitor = ConvergenceMonitor({"tolerances": {"rocket.mass": 1E-3, "rocket.stage1.fins.span": 1E-2}, "minimum_iterations": 2})
+    monitor.start(rocket)
+    rocket.mass = 100.05
+    assert not monitor.check(rocket, 1)  # Within tolerance, but before the minimum iterations
+    rocket.mass = 101.0
+    assert not monitor.check(rocket, 2) and monitor.largest() == ("rocket.mass", abs(101.0 - 100.05) / 100.05)
+    rocket.stage1.fins.span = 0.501
+    assert monitor.check(rocket, 3) and len(monitor.history) == 3
+
+
+def test_anderson_accelerator():
+    simulator = Simulator(run_parameters["mission_profile"], run_parameters["simulator_parameters"], dynamics.run, gravity.gravity, aerodynamics.drag, aerodynamics.isa)
+    rocket = Rocket(simulator)
+    rocket.stage1.fins.mass = 1.0
+    rocket.stage1.fins.span = 1.0
+
+    # Slowly converging coupled map, a plain iteration needs more than 100 steps to reach 1E-6
+    accelerator = AndersonAccelerator({"variables": ["rocket.stage1.fins.mass", "rocket.stage1.fins.span"], "memory": 3,
+                                       "maximum_step": 10})
+    for step in range(8):
+        start = accelerator.values(rocket)
+        mass, span = rocket.stage1.fins.mass, rocket.stage1.fins.span
+        rocket.stage1.fins.mass = 0.9 * mass + 0.05 * span + 1
+        rocket.stage1.fins.span = 0.02 * mass + 0.95 * span + 0.5
+        accelerator.step(start, rocket)
+
+    assert abs(rocket.stage1.fins.mass - 18.75) <= 1E-6 and abs(rocket.stage1.fins.span - 17.5) <= 1E-6
+    assert rocket.stage1.mass == rocket.stage1.fins.mass
+
+    # Only the design variables are mixed, the quantities that depend on them are derived again
+    def derive(derived_rocket):
+        derived_rocket.stage1.fins.mass = 2 * derived_rocket.stage1.fins.span
+
+    rocket.stage1.fins.span = 1.0
+    rocket.stage1.engine.impulse = 1000.0
+    accelerator = AndersonAccelerator({"variables": ["rocket.stage1.fins.span"], "maximum_step": 10}, derive)
+    for step in range(8):
+        start = accelerator.values(rocket)
+        rocket.stage1.fins.span = 0.95 * rocket.stage1.fins.span + 0.5
+        rocket.stage1.engine.impulse += 100
+        accelerator.step(start, rocket)
+
+    assert abs(rocket.stage1.fins.span - 10) <= 1E-6 and rocket.stage1.fins.mass == 2 * rocket.stage1.fins.span
+    assert rocket.stage1.engine.impulse == 1800.0 and accelerator.steps["anderson"] > 0
+
+
 def test_nozzle_throat_area():
     pyth_area = engine.nozzle_throat_area(10, 5, 6)
     calc_area = 25 / 3
@@ -389,5 +520,648 @@ def test_stab():
     assert cp_location < 1
 
 
+
+def two_stage_flights(total_mass: float = 60, size: int = 1) -> dict:
+    """
+    :param total_mass: Lift-off mass without the fuel [kg]
+    :param size: Buffer lengths of the flight data
+    :return: Flight data of a small two stage rocket, like Simulator.build_stages
+    """
+    stages: dict = {"Stage1": FlightData(size)}
+    for name, mass, thrust, burn_time in [("Total", total_mass, 6000, 3), ("Stage2", 15, 800, 5)]:
+        flight = FlightData(size)
+        flight.diameter, flight.diameter1, flight.diameter2 = 0.2, 0.2, 0.15
+        flight.fineness_ratio = 5
+        flight.reference_area = np.pi * (0.2 / 2) ** 2
+        flight.wetted_area_body, flight.wetted_area_fins1, flight.wetted_area_fins2 = 3, 0.6, 0.25
+        flight.fin_thickness1, flight.fin_thickness2 = 0.005, 0.006
+        flight.fin_mac1, flight.fin_mac2 = 0.38, 0.25
+        flight.fin_span1, flight.fin_span2 = 0.2, 0.14
+        flight.mass[0] = mass
+        flight.burn_time = burn_time
+        flight.thrust_curve = thrust * np.ones(int(burn_time / 0.05))
+        flight.fuel_mass_curve = np.linspace(10, 0, int(burn_time / 0.05))
+        flight.angles[0] = np.deg2rad(7)
+        stages[name] = flight
+    return stages
+
+
+def test_flight_data_grow():
+    flight = FlightData(3)
+    flight.time[:] = [0, 0.1, 0.2]
+    flight.locations[2] = [1, 2]
+    flight.thrust_curve = np.ones(4)
+    flight.grow(2)
+
+    assert flight.time.shape == (5,) and flight.locations.shape == (5, 2) and flight.force_gravity.shape == (5,)
+    assert np.array_equal(flight.time, [0, 0.1, 0.2, 0, 0]) and np.array_equal(flight.locations[2], [1, 2])
+    assert flight.thrust_curve.shape == (4,), "the engine curves are not time steps of the flight"
+
+    # Without a step count from the dynamics the buffers are trimmed on the time stamps
+    Simulator.trim_lists(flight)
+    assert flight.time.shape == (2,) and flight.locations.shape == (2, 2)
+
+
+def test_ground_stop():
+    simulator = Simulator(run_parameters["mission_profile"], run_parameters["simulator_parameters"], dynamics.run, gravity.gravity, aerodynamics.drag, aerodynamics.isa)
+
+    # Thrust below the weight, the flight stops before the rocket sinks through the ground
+    flight = two_stage_flights(size=10)["Stage2"]
+    flight.thrust_curve = 10 * np.ones(100)
+    flight.angles[0] = 0
+    dynamics.run(flight, 2, gravity.gravity, aerodynamics.drag, aerodynamics.isa, dt=0.05, chunk=10)
+    simulator.trim_lists(flight)
+    assert 1 < flight.steps < 10 and np.all(flight.locations[:, 1] >= 0)
+
+    # Starting below the ground, only the initial state is recorded
+    flight = two_stage_flights(size=10)["Stage2"]
+    flight.locations[0] = [0, -1]
+    flight.velocities[0] = [0, 50]
+    dynamics.run(flight, 2, gravity.gravity, aerodynamics.drag, aerodynamics.isa, dt=0.05, chunk=10)
+    simulator.trim_lists(flight)
+    assert flight.steps == 1 and flight.time.shape == (1,)
+
+
+def constant_thrust_flight(dt: float, thrust: float = 800):
+    """
+    :param dt: Time step the engine curves are sampled at, like the engine sizing [s]
+    :return: Flight data of the 2nd stage of two_stage_flights, launched from the ground
+    """
+    flight = two_stage_flights(size=10)["Stage2"]
+    flight.thrust_curve = thrust * np.ones(int(flight.burn_time / dt))
+    flight.fuel_mass_curve = np.linspace(10, 0, int(flight.burn_time / dt))
+    return flight
+
+
+def test_adaptive_integrator():
+    euler = constant_thrust_flight(0.001)
+    dynamics.run(euler, 2, gravity.gravity, aerodynamics.drag, aerodynamics.isa, dt=0.001, chunk=10000)
+    adaptive = constant_thrust_flight(0.05)
+    dynamics.run_adaptive(adaptive, 2, gravity.gravity, aerodynamics.drag, aerodynamics.isa, dt=0.05, chunk=100)
+
+    times, altitudes, speeds = [], [], []
+    for flight in [euler, adaptive]:
+        times.append(flight.time[:flight.steps])
+        altitudes.append(flight.locations[:flight.steps, 1])
+        speeds.append(np.hypot(flight.velocities[:flight.steps, 0], flight.velocities[:flight.steps, 1]))
+
+    # Same apogee, apogee time and tower exit time as Euler at a small step, with far fewer steps
+    assert abs(altitudes[1].max() - altitudes[0].max()) <= 5E-3 * altitudes[0].max()
+    assert abs(times[1][np.argmax(altitudes[1])] - times[0][np.argmax(altitudes[0])]) <= 0.05
+    assert abs(times[1][np.argmax(speeds[1] >= 40 - 1E-6)] - times[0][np.argmax(speeds[0] >= 40)]) <= 0.01
+    assert adaptive.steps < euler.steps / 100
+
+
+def test_adaptive_events():
+    flight = constant_thrust_flight(0.05)
+    dynamics.run_adaptive(flight, 2, gravity.gravity, aerodynamics.drag, aerodynamics.isa, dt=0.05, chunk=100)
+    speeds = np.hypot(flight.velocities[:flight.steps, 0], flight.velocities[:flight.steps, 1])
+
+    # The flight ends exactly at apogee, and there is a step exactly at the tower exit speed
+    assert abs(flight.velocities[flight.steps - 1, 1]) <= 1E-6
+    assert flight.locations[flight.steps - 1, 1] == flight.locations[:flight.steps, 1].max()
+    assert np.min(np.abs(speeds - 40)) <= 1E-6
+    assert dynamics.event_value(np.array([0, 10, 3, 4]), 2) == 35
+
+    # Thrust below the weight, the flight ends on the ground instead of below it
+    flight = constant_thrust_flight(0.05, thrust=10)
+    dynamics.run_adaptive(flight, 2, gravity.gravity, aerodynamics.drag, aerodynamics.isa, dt=0.05, chunk=100)
+    assert flight.steps == 2 and abs(flight.locations[1, 1]) <= 1E-9 and abs(flight.time[1]) <= 1E-6
+
+
+def test_mission_kernel_integrator():
+    parameters = {"maximum_iterations": 1E5, "dt": 0.05, "mission_kernel": True}
+    with pytest.raises(ValueError):
+        Simulator(run_parameters["mission_profile"], parameters, dynamics.run_adaptive, gravity.gravity, aerodynamics.drag,
+                  aerodynamics.isa, mission_run=mission.run_mission, mission_summary_run=mission.run_mission_summary)
+    Simulator(run_parameters["mission_profile"], {**parameters, "mission_kernel": False}, dynamics.run_adaptive,
+              gravity.gravity, aerodynamics.drag, aerodynamics.isa)
+    Simulator(run_parameters["mission_profile"], parameters, dynamics.run, gravity.gravity, aerodynamics.drag,
+              aerodynamics.isa, mission_run=mission.run_mission, mission_summary_run=mission.run_mission_summary)
+
+
+def test_buffer_sizes():
+    parameters = {**run_parameters["simulator_parameters"], "right_size_buffers": True}
+    simulator = Simulator(run_parameters["mission_profile"], parameters, dynamics.run, gravity.gravity, aerodynamics.drag, aerodynamics.isa)
+    rocket = Rocket(simulator)
+    for stage, mass in [("stage1", 100), ("stage2", 40)]:
+        rocket[stage].mass = mass
+        rocket[stage].engine.burn_time = 5
+        rocket[stage].engine.isp = 200
+        rocket[stage].engine.propellant_mass = 20
+    rocket.mass = 100
+
+    total_size, _, stage2_size = simulator.buffer_sizes(rocket)
+    assert total_size == int(6 / 0.01) + 2 and stage2_size < simulator.maximum_iterations
+
+    # More propellant than mass, like a randomized first iteration, falls back to the largest buffers
+    rocket.stage2.engine.propellant_mass = 50
+    assert simulator.buffer_sizes(rocket)[2] == simulator.maximum_iterations
+
+
+def test_boost_checkpoint():
+    parameters = {"maximum_iterations": 1E5, "dt": 0.05, "boost_checkpoint": True, "checkpoint_mass_tolerance": 1E-3}
+    simulator = Simulator(run_parameters["mission_profile"], parameters, dynamics.run, gravity.gravity, aerodynamics.drag, aerodynamics.isa)
+    reference = Simulator(run_parameters["mission_profile"], {**parameters, "boost_checkpoint": False}, dynamics.run, gravity.gravity,
+                          aerodynamics.drag, aerodynamics.isa)
+
+    simulator.stages = two_stage_flights()
+    simulator.run()
+    apogee = simulator.apogee
+    assert simulator.checkpoint_hits == 0
+
+    # Unchanged boost phase, the checkpoint gives the same flight
+    simulator.stages = two_stage_flights()
+    simulator.run()
+    assert simulator.checkpoint_hits == 1 and not simulator.approximate_boost and simulator.apogee == apogee
+
+    # Lift-off mass within the tolerance, reused as an approximation of the exact flight
+    simulator.stages = two_stage_flights(60 * (1 + 5E-4))
+    simulator.run()
+    reference.stages = two_stage_flights(60 * (1 + 5E-4))
+    reference.run()
+    assert simulator.checkpoint_hits == 2 and simulator.approximate_boost
+    assert abs(simulator.apogee - reference.apogee) <= 1E-3 * reference.apogee
+
+    # Lift-off mass outside the tolerance, the boost phase is simulated again
+    simulator.stages = two_stage_flights(60 * (1 + 1E-2))
+    simulator.run()
+    assert simulator.checkpoint_hits == 2 and not simulator.approximate_boost
+
+
+def test_batch_dynamics():
+    parameters = {"maximum_iterations": 1E5, "dt": 0.05}
+    simulator = Simulator(run_parameters["mission_profile"], parameters, dynamics.run, gravity.gravity, aerodynamics.drag, aerodynamics.isa,
+                          batch_run=batch_dynamics.run_batch)
+    masses = [50, 60, 75]
+    totals, stages2 = List(), List()
+    for mass in masses:
+        stages = two_stage_flights(mass)
+        totals.append(stages["Total"])
+        stages2.append(stages["Stage2"])
+    batch = simulator.run_batch_stages(totals, stages2)
+
+    # Every member gives the same flight as a separate run of the scalar dynamics
+    for i, mass in enumerate(masses):
+        simulator.stages = two_stage_flights(mass)
+        simulator.run()
+        for name in ["apogee", "apogee_1", "max_velocity_tot", "max_velocity2", "min_speed_of_sound2"]:
+            assert abs(batch[name][i] - simulator[name]) <= 1E-9 * abs(simulator[name]), f"{name} of member {i}"
+        assert batch["steps"][i] == len(simulator.stages["Total"].time) + len(simulator.stages["Stage2"].time)
+
+
+def test_apogee_targeting(monkeypatch):
+    import file_manager as fm
+    monkeypatch.setattr(fm, "current_file_path", "")
+    parameters = {"maximum_iterations": 1E5, "dt": 0.01, "right_size_buffers": True, "boost_checkpoint": True,
+                  "checkpoint_mass_tolerance": 1E-3, "mission_kernel": True}
+    simulator = Simulator(run_parameters["mission_profile"], parameters, dynamics.run, gravity.gravity, aerodynamics.drag,
+                          atmosphere.isa, mission_run=mission.run_mission, mission_summary_run=mission.run_mission_summary)
+    rocket = fm.initialize_rocket("initial_values_2", simulator, run_parameters, False)
+    engine.initialize(rocket)
+    stability.initialize(rocket)
+    rocket.update(print_warnings=False)
+
+    runs: list = []
+    run = simulator.run
+    monkeypatch.setattr(simulator, "run", lambda summary_only=False: runs.append(summary_only) or run(summary_only))
+
+    # Default start, secant steps from the proportional slope
+    simulations = engine.optimize(rocket, 30, 110E3, 1, print_status=False)
+    assert simulations == len(runs) <= 12 and all(runs)
+    assert abs(simulator.apogee - 110E3) < 1 and not simulator.approximate_boost
+
+    # Warm start from the slope of the previous call
+    runs.clear()
+    simulations = engine.optimize(rocket, 30, 100E3, 1, print_status=False)
+    assert simulations == len(runs) <= 9 and all(runs)
+    assert abs(simulator.apogee - 100E3) < 1 and rocket.stage2.engine.impulse_slope > 0
+    runs.clear()
+    assert engine.optimize(rocket, 30, 100E3, 1, print_status=False) < simulations
+
+    # Poor start, the unbracketed steps are limited to a factor 2 of the impulse
+    rocket.stage2.engine.impulse /= 10
+    rocket.stage2.engine.impulse_slope = None
+    runs.clear()
+    simulations = engine.optimize(rocket, 30, 100E3, 1, print_status=False)
+    assert simulations == len(runs) <= 30
+    assert abs(simulator.apogee - 100E3) < 1 and simulator.checkpoint_tolerance == 1E-3
+
+
+def sizing_runner(monkeypatch, selection: list):
+    import file_manager as fm
+    import main
+    monkeypatch.setattr(sys, "argv", ["main.py"])
+    monkeypatch.setattr(fm, "current_file_path", "")
+    runner = main.Runner("initial_values_2")
+    runner.selection = selection
+    stability.initialize(runner.rocket)
+    runner.rocket.update(print_warnings=False)
+    runner.rocket.id = "1.1"
+    return runner
+
+
+def test_sizing_cache(monkeypatch):
+    runner = sizing_runner(monkeypatch, ["recovery", "electronics"])
+    runner.cache_sizing = True
+    runner.sizing_threads = 0
+    assert "simulator.apogee" in runner.input_values() and "simulator.checkpoint_hits" not in runner.input_values()
+
+    runner.new_rocket = runner.rocket.copy_on_write()
+    runner.run_sizing(print_status=False)
+    sized = {key: value for key, value in runner.new_rocket.export_all_values().items() if is_number(value)}
+    assert runner.cache_counts == {"hits": 0, "misses": 2}
+
+    # Same inputs, the changes of the last run are used again
+    runner.new_rocket = runner.rocket.copy_on_write()
+    runner.run_sizing(print_status=False)
+    assert runner.cache_counts == {"hits": 2, "misses": 2}
+    assert {key: value for key, value in runner.new_rocket.export_all_values().items() if is_number(value)} == sized
+
+    # Counters of the simulator are not an input of any sizer
+    runner.rocket.simulator.checkpoint_hits += 3
+    runner.rocket.simulator.trajectory_size += 100
+    runner.run_sizing(print_status=False)
+    assert runner.cache_counts == {"hits": 4, "misses": 2}
+
+    # A flight result that only the electronics read
+    runner.rocket.simulator.max_velocity_tot = 900.0
+    runner.run_sizing(print_status=False)
+    assert runner.cache_counts == {"hits": 5, "misses": 3}
+
+
+def test_sizing_plan(monkeypatch, capsys):
+    runner = sizing_runner(monkeypatch, ["stability", "electronics", "recovery", "engine"])
+    runner.cache_sizing = False
+    inputs = runner.plan_sizing()
+    assert list(inputs) == ["engine", "recovery", "electronics", "stability"]  # In the order of the sizers
+    assert "stage1.dry_mass" in inputs["recovery"] and "stage2.recovery.mass" in inputs["recovery"]
+    assert "simulator.max_velocity_tot" in inputs["electronics"] and "stage1.dry_mass" not in inputs["electronics"]
+    assert "simulator.checkpoint_hits" not in inputs["engine"]
+
+    # The sizers running at the same time give the same Rocket and output as running them one by one
+    results: list = []
+    for threads in [0, 4]:
+        runner.sizing_threads = threads
+        runner.new_rocket = runner.rocket.copy_on_write()
+        runner.populate_simulation()
+        runner.rocket.simulator.run()
+        capsys.readouterr()
+        changes = runner.run_sizing(print_status=True)
+        values = {key: value for key, value in runner.new_rocket.export_all_values().items() if is_number(value)}
+        results.append((changes.keys(), values, capsys.readouterr().out))
+    assert results[0] == results[1]
+    assert results[0][2].index("Sizing Engine") < results[0][2].index("Apogee") < results[0][2].index("Sizing Recovery")
+
+
+def test_drag_table():
+    flight = FlightData(1)
+    flight.diameter = 0.2
+    flight.diameter1 = 0.2
+    flight.diameter2 = 0.15
+    flight.fineness_ratio = 5
+    flight.reference_area = np.pi * (0.2 / 2) ** 2
+    flight.wetted_area_body = 3
+    flight.wetted_area_fins1 = 0.6
+    flight.wetted_area_fins2 = 0.25
+    flight.fin_thickness1 = 0.005
+    flight.fin_thickness2 = 0.006
+    flight.fin_mac1 = 0.38
+    flight.fin_mac2 = 0.25
+    flight.fin_span1 = 0.2
+    flight.fin_span2 = 0.14
+
+    aerodynamics.build_drag_table(flight, 0)
+    temperature, pressure, density = aerodynamics.isa(5000)
+    for velocity in [0, 50, 250, 320.5, 330, 600, 1500]:
+        drag = aerodynamics.drag(flight, velocity, temperature, density, 0)
+        drag_table = aerodynamics.table_drag(flight, velocity, temperature, density, 0)
+        assert abs(drag_table - drag) <= 1E-4 * drag, f"table drag at {velocity} m/s is {drag_table} instead of {drag}"
+        assert abs(aerodynamics.drag_components(flight, velocity, temperature, density, 0).sum() - drag) <= 1E-9 * drag
+
+
+def test_mission_events():
+    events = mission.encode_mission(run_parameters["mission_profile"])
+    assert events.shape == (len(mission.mission_events), 3)
+
+    for i, event in enumerate(mission.mission_events):
+        kind, value = next(iter(run_parameters["mission_profile"][event].items()))
+        assert mission.event_kinds[int(events[i, 1])] == kind
+        assert mission.event_delay(events, i, 10.0) == (value - 10.0 if kind == "exact" else value)
+
+
+def test_mission_summary():
+    flights = []
+    for mass, thrust, burn_time in [(60, 6000, 3), (15, 800, 5)]:
+        flight = FlightData(1)
+        flight.diameter, flight.diameter1, flight.diameter2 = 0.2, 0.2, 0.15
+        flight.fineness_ratio = 5
+        flight.reference_area = np.pi * (0.2 / 2) ** 2
+        flight.wetted_area_body, flight.wetted_area_fins1, flight.wetted_area_fins2 = 3, 0.6, 0.25
+        flight.fin_thickness1, flight.fin_thickness2 = 0.005, 0.006
+        flight.fin_mac1, flight.fin_mac2 = 0.38, 0.25
+        flight.fin_span1, flight.fin_span2 = 0.2, 0.14
+        flight.mass[0] = mass
+        flight.burn_time = burn_time
+        flight.thrust_curve = thrust * np.ones(int(burn_time / 0.05))
+        flight.fuel_mass_curve = np.linspace(10, 0, int(burn_time / 0.05))
+        flight.angles[0] = np.deg2rad(7)
+        flights.append(flight)
+
+    events = mission.encode_mission(run_parameters["mission_profile"])
+    arguments = (flights[0], flights[1], gravity.gravity, aerodynamics.drag, atmosphere.isa, events)
+    trajectory, phase_starts = mission.run_mission(*arguments, np.zeros((0, mission.column_count)), dt=0.05)
+    summary, separation = mission.run_mission_summary(*arguments, np.zeros(0), np.zeros(3), dt=0.05)
+
+    columns = (mission.y_column, mission.vy_column, mission.speed_of_sound_column)
+    for phase in range(2):
+        rows = trajectory[phase_starts[phase]:phase_starts[phase + 1]]
+        assert np.array_equal(summary[3 * phase:3 * phase + 3], [rows[:, column].max() for column in columns])
+    assert np.array_equal(separation, trajectory[phase_starts[1] - 1])
+
+    # Continuing from the separation state gives the same 2nd stage
+    reused, _ = mission.run_mission_summary(*arguments, separation, summary[:3], dt=0.05)
+    assert np.array_equal(reused, summary)
+
+
+# Atmosphere
+def test_atmosphere_table():
+    for height in [0, 5.5, 11000, 25123.4, 47001, 85999.9, 150000]:
+        exact = np.array(aerodynamics.isa(height))
+        table = np.array(atmosphere.isa(height))
+        assert np.allclose(table, exact, rtol=1E-6), f"table atmosphere at {height} m is {table} instead of {exact}"
+
+    assert atmosphere.isa(500000) == (0.0, 0.0, 0.0)
+
+
+def test_atmosphere_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(atmosphere, "cache_directory", str(tmp_path))
+    table = atmosphere.load_table(1000.0)
+
+    # Only the finished table is left in the cache, and it is loaded the next time
+    assert [name.endswith(".npy") for name in os.listdir(tmp_path)] == [True]
+    assert np.array_equal(atmosphere.load_table(1000.0), table)
+
+
+# Dispersion
+def test_dispersion_samples():
+    distributions = {"thrust_scale": {"normal": [1, 0.02]}, "wind": {"uniform": [-10, 10]}}
+    samples = dispersion.draw_samples(distributions, 20, 3)
+    first_samples = dispersion.draw_samples(distributions, 5, 3)
+
+    assert np.array_equal(samples["thrust_scale"][:5], first_samples["thrust_scale"]), "samples depend on the sample count"
+    assert np.all(samples["launch_angle"] == 7), "missing inputs should keep their nominal value"
+    assert np.all((-10 <= samples["wind"]) & (samples["wind"] <= 10))
+
+
+
+def test_dispersion_nominal(monkeypatch):
+    from numba import config
+    monkeypatch.setattr(fm, "current_file_path", "")
+    simulator = Simulator(run_parameters["mission_profile"], {"maximum_iterations": 1E5, "dt": 0.05}, dynamics.run, gravity.gravity,
+                          aerodynamics.drag, atmosphere.isa)
+    rocket = fm.initialize_rocket("initial_values_2", simulator, run_parameters, False)
+    engine.initialize(rocket)
+    stability.initialize(rocket)
+    rocket.update(print_warnings=False)
+    simulator.create_stages(rocket, False)
+    simulator.run()
+
+    # Exact nominal inputs fly the same mission as the simulator
+    nominal = {name: {"exact": value} for name, value in dispersion.nominal_values.items()}
+    result = dispersion.run(rocket, nominal, 2, threads=1)
+    assert np.all(np.abs(result["samples"]["apogee"] - simulator.apogee) <= 1E-9 * simulator.apogee)
+
+    # The samples do not depend on the number of threads
+    distributions = {"thrust_scale": {"normal": [1, 0.02]}, "drag_scale": {"normal": [1, 0.05]}, "wind": {"uniform": [-10, 10]}}
+    single = dispersion.run(rocket, distributions, 8, seed=1, threads=1)
+    parallel = dispersion.run(rocket, distributions, 8, seed=1, threads=config.NUMBA_NUM_THREADS)
+    for name in dispersion.result_names:
+        assert np.array_equal(single["samples"][name], parallel["samples"][name], equal_nan=True), name
+
+# Archive
+def test_run_archive(tmp_path):
+    simulator = Simulator(run_parameters["mission_profile"], run_parameters["simulator_parameters"], dynamics.run, gravity.gravity, aerodynamics.drag, aerodynamics.isa)
+    rocket = Rocket(simulator)
+    rocket.stage1.fins.span = 0.2
+    archive = RunArchive(str(tmp_path))
+    archive.append(0, rocket)
+
+    rocket.stage1.fins.span = 0.3
+    rocket.stage1.fins.extra = 4.0  # Added variable, starts a new segment
+    simulator.apogee = 1000
+    archive.append(1, rocket)
+
+    columns = archive.read(["iteration", "stage1.fins.span", "stage1.fins.extra", "simulator.apogee", "unknown"])
+    archive.close()
+    assert sorted(os.listdir(tmp_path)) == ["columns.npz"]
+    for variable, column in archive.read(list(columns)).items():
+        assert np.array_equal(column, columns[variable], equal_nan=True)
+
+    assert np.array_equal(columns["iteration"], [0, 1]) and np.array_equal(columns["stage1.fins.span"], [0.2, 0.3])
+    assert np.isnan(columns["stage1.fins.extra"][0]) and columns["stage1.fins.extra"][1] == 4
+    assert np.array_equal(columns["simulator.apogee"], [0, 1000]) and np.all(np.isnan(columns["unknown"]))
+
+
+def test_snapshot_archive(tmp_path):
+    simulator = Simulator(run_parameters["mission_profile"], run_parameters["simulator_parameters"], dynamics.run, gravity.gravity, aerodynamics.drag, aerodynamics.isa)
+    rocket = Rocket(simulator)
+    snapshots = SnapshotArchive(str(tmp_path), keyframe_interval=2)
+    spans: list = []
+    for iteration in range(5):
+        rocket.stage1.fins.span = 0.1 * (iteration + 1)
+        rocket.stage2.engine.thrust_curve = np.full(3, float(iteration))
+        simulator.apogee = 1000.0 * iteration
+        changes = {"stage1.fins.span": rocket.stage1.fins.span, "stage2.engine.thrust_curve": rocket.stage2.engine.thrust_curve}
+        snapshots.save(iteration, rocket, changes, last=iteration == 4)
+        spans.append(rocket.stage1.fins.span)
+
+    assert list(snapshots.keyframes()) == [0, 2, 4]
+    assert [iteration for iteration, _ in snapshots.deltas()] == [1, 3]  # Keyframes are not in the changes
+    for iteration in range(5):
+        rebuilt = snapshots.load(iteration)
+        assert rebuilt.stage1.fins.span == spans[iteration] and rebuilt.simulator.apogee == 1000 * iteration
+        assert np.array_equal(rebuilt.stage2.engine.thrust_curve, np.full(3, iteration))
+    assert list(snapshots.history("stage1.fins.span")) == list(enumerate(spans))
+
+    # Unknown changes are saved as a keyframe
+    rocket.stage1.fins.span = 0.7
+    snapshots.save(5, rocket)
+    assert list(snapshots.keyframes()) == [0, 2, 4, 5] and snapshots.load(5).stage1.fins.span == 0.7
+
+
+def test_run_index(tmp_path):
+    os.makedirs(tmp_path / "archive/run_4")
+    open(tmp_path / "archive/run_4/0012_rocket.pickle", "w").close()
+    index = RunIndex(str(tmp_path / "runs.sqlite"), str(tmp_path / "archive"))
+    assert index.run(4)["status"] == "unindexed" and index.run(4)["iterations"] == 12
+
+    run_ids = [index.allocate("initial_values_2", seed) for seed in range(3)]
+    assert run_ids == [5, 6, 7] and os.path.isdir(tmp_path / "archive/run_7")
+    index.finish(5, "ok", {"rocket.simulator.apogee": 120000.0}, iterations=20, converged=1)
+    index.finish(6, "ok", {"rocket.simulator.apogee": 80000.0}, iterations=20, converged=1)
+    index.finish(7, "failed")
+
+    assert index.select([("rocket.simulator.apogee", ">", 100000)]) == [5]
+    assert index.select([("rocket.simulator.apogee", "<=", 100000)]) == [6]
+    assert index.select(status=None) == [4, 5, 6, 7]
+    index.close()
+
+    # Opening the index again continues the numbering
+    index = RunIndex(str(tmp_path / "runs.sqlite"), str(tmp_path / "archive"))
+    assert index.allocate("initial_values_2") == 8
+    index.close()
+
+
+def test_result_store(tmp_path):
+    store = ResultStore(str(tmp_path / "runs.sqlite"), ["rocket.simulator.apogee"])
+    for run, apogees in [(1, [50000.0, 95000.0]), (2, [120000.0, 85000.0])]:
+        for iteration, apogee in enumerate(apogees):
+            store.add_iteration(run, iteration, {"iteration": iteration, "simulator.apogee": apogee,
+                                                 "stage2.payload.mass": 30.0 + 10 * run, "cost": np.nan})
+
+    series = store.series([1, 2, 3], ["iteration", "rocket.simulator.apogee", "rocket.cost", "rocket.unknown"])
+    assert list(series) == [1, 2] and series[1]["iteration"] is None
+    assert np.array_equal(series[2]["rocket.simulator.apogee"], [120000, 85000])
+    assert np.all(np.isnan(series[1]["rocket.cost"])) and np.all(np.isnan(series[1]["rocket.unknown"]))
+
+    assert store.find([("rocket.simulator.apogee", ">", 90000)]) == [(1, 1)]
+    assert store.find([("rocket.simulator.apogee", ">", 90000)], last=False) == [(1, 1), (2, 0)]
+
+    requirements = pd.DataFrame({"Requirement": ["Apogee", "Payload"], "Stage": [0, 2],
+                                 "Subsystem": ["simulation", "payload"], "Variable": ["apogee", "mass"],
+                                 "Value": [90000, 45], "Type": [">", "<"]})
+    table = store.compliance(requirements)
+    assert table["compliant"].tolist() == [True, False] and table["Apogee"].tolist() == [True, False]
+
+    store.clear(2)
+    assert list(store.series([1, 2], ["rocket.cost"])) == [1]
+    store.close()
+
+
+def test_load_variables(tmp_path, monkeypatch):
+    monkeypatch.setattr(fm, "current_file_path", str(tmp_path))
+    simulator = Simulator(run_parameters["mission_profile"], run_parameters["simulator_parameters"], dynamics.run, gravity.gravity, aerodynamics.drag, aerodynamics.isa)
+    rocket = Rocket(simulator)
+
+    # Run 1 in the columnar archive and the results store, runs 2 and 3 from before them with a pickle per iteration
+    for run in [1, 2, 3]:
+        os.makedirs(tmp_path / f"files/archive/run_{run}")
+    archive = fm.open_archive("run_1")
+    store = fm.open_results()
+    for iteration in range(4):
+        rocket.mass = 100.0 + iteration
+        rocket.stage1.fins.span = None if iteration == 2 else 0.1 * (iteration + 1)
+        simulator.apogee = 1000.0 * iteration
+        store.add_iteration(1, iteration, archive.append(iteration, rocket))
+        for run in [2, 3]:
+            fm.export_rocket_iteration(f"run_{run}/{str(iteration).zfill(4)}_rocket", rocket)
+    archive.close()
+    store.close()
+
+    variables = ["iteration", "rocket.mass", "rocket.stage1.fins.span", "rocket.simulator.apogee"]
+    runs: dict = fm.load_runs([1, 2, 3], variables, workers=2)
+    for run in [1, 2, 3]:
+        variables_data: dict = fm.load_variables(run, variables)
+        for variable in variables:
+            series = fm.load_variable(run, variable.split(".")[1:])
+            if variable == "iteration":
+                assert series is None and variables_data[variable] is None and runs[run][variable] is None
+                continue
+            series = np.array([np.nan if value is None else value for value in series], dtype=float)
+            assert np.array_equal(variables_data[variable], series, equal_nan=True), f"{variable} of run {run}"
+            assert np.array_equal(runs[run][variable], series, equal_nan=True), f"{variable} of run {run}"
+    assert np.array_equal(runs[2]["rocket.mass"], [100, 101, 102, 103])
+
+
+# Campaign
+def stub_worker(connection, log_directory: str):
+    # Stands in for campaign.worker in the worker processes, the run with seed 1 fails, the others finish at once
+    while True:
+        try:
+            task: dict | None = connection.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        if task["seed"] == 1:
+            connection.send({"status": "failed", "traceback": "Stub failure", "duration": 0})
+        else:
+            connection.send({"status": "ok", "duration": 0})
+
+
+def test_campaign(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / "files")
+    shutil.copy("files/initial_values_2.csv", tmp_path / "files")
+    monkeypatch.setattr(fm, "current_file_path", str(tmp_path))
+    monkeypatch.setattr(campaign, "current_file_path", str(tmp_path))
+    monkeypatch.setattr(campaign, "worker", stub_worker)
+
+    # The runs get consecutive ids from the index and consecutive seeds
+    study = campaign.Campaign("study", runs=4, iterations=2, seed=0)
+    run_ids: list = [run["run_id"] for run in study.manifest["runs"]]
+    assert run_ids == [1, 2, 3, 4] and [run["seed"] for run in study.manifest["runs"]] == [0, 1, 2, 3]
+    assert list(study.design.index) == run_ids and len(study.remaining()) == 4 and study.finished() == []
+    with contextlib.closing(fm.open_index()) as index:
+        assert [index.run(run_id)["status"] for run_id in run_ids] == ["pending"] * 4
+
+    # Interrupted while two runs are running, they are pending again
+    def interrupt(connections, timeout=None):
+        with open(study.manifest_file) as file:
+            assert [run["status"] for run in json.load(file)["runs"]] == ["running", "running", "pending", "pending"]
+        raise KeyboardInterrupt
+
+    wait = campaign.wait
+    monkeypatch.setattr(campaign, "wait", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        study.run(workers=2)
+    monkeypatch.setattr(campaign, "wait", wait)
+    with contextlib.closing(fm.open_index()) as index:
+        assert [index.run(run_id)["status"] for run_id in run_ids] == ["pending"] * 4
+
+    # Resumed from the manifest, only the runs that did not finish are run again
+    study = campaign.Campaign("study")
+    assert [run["status"] for run in study.manifest["runs"]] == ["pending"] * 4 and len(study.remaining()) == 4
+    study.run(workers=2)
+    assert study.finished() == [1, 3, 4] and [run["run_id"] for run in study.remaining()] == [2]
+    assert study.manifest["runs"][1]["traceback"] == "Stub failure"
+    with contextlib.closing(fm.open_index()) as index:
+        assert index.run(2)["status"] == "failed"
+
+    monkeypatch.setattr(study, "clear_run", lambda run: runs.append(run["run_id"]))
+    runs: list = []
+    study.run(workers=2)
+    assert runs == [2] and study.finished() == [1, 3, 4]
+
+
+# Sampling
+def test_sampling_design():
+    data = pd.DataFrame({"Stage": [0, 1, 1, 2], "Subsystem": ["rocket", "stage", "recovery,drogue", "engine"],
+                         "Variable": ["mass", "length", "mass", "propellant"], "Value": ["98", "3", "1", "ap"],
+                         "Locked": [False, True, False, False], "Lower": [None, None, 0.1, None],
+                         "Upper": [None, None, 10, None], "Scale": [None, None, "log", None]})
+    design = sampling.design(data, 20, "lhs", seed=3)
+
+    assert list(design.columns) == ["rocket.mass", "stage1.recovery.drogue.mass"], "only unlocked numbers are sampled"
+    assert np.array_equal(np.sort(np.floor((design["rocket.mass"] - 0.5) / 1.5 * 20)), np.arange(20)), \
+        "a Latin hypercube has one run in every interval"
+    assert np.array_equal(np.sort(np.floor(np.log(design["stage1.recovery.drogue.mass"] / 0.1) / np.log(100) * 20)),
+                          np.arange(20)), "log scaled variables are stratified in log space"
+    assert design.equals(sampling.design(data, 20, "lhs", seed=3)), "the design depends on the seed only"
+
+
+def test_sobol_indices():
+    # Ishigami function, with known first order and total indices
+    data = pd.DataFrame({"Stage": 0, "Subsystem": "rocket", "Variable": ["x1", "x2", "x3"], "Value": "1",
+                         "Locked": False, "Lower": -np.pi, "Upper": np.pi})
+    x = sampling.saltelli_design(data, 1024, seed=0).to_numpy()
+    y = np.sin(x[:, 0]) + 7 * np.sin(x[:, 1]) ** 2 + 0.1 * x[:, 2] ** 4 * np.sin(x[:, 0])
+    indices = sampling.sobol_indices(y, 3, resamples=100, seed=0)
+
+    assert np.allclose(indices["first"], [0.314, 0.442, 0], atol=0.05)
+    assert np.allclose(indices["total"], [0.558, 0.442, 0.244], atol=0.05)
+    assert np.all(indices["total_confidence"] < 0.1)
+
+
 if __name__ == "__main__":
     pass